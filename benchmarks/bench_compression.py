@@ -0,0 +1,131 @@
+"""Compares database size and latency across message compression settings.
+
+For each setting a fresh database is filled with a synthetic corpus (mostly short chat
+lines, plus long assistant replies and pasted code/logs), stored plain and then converted by
+the same background pass the bot runs (compress_existing, against the built-in dictionary). Reports the
+file size after VACUUM, how long the conversion took, and save/get_history latencies.
+
+Usage: python benchmarks/bench_compression.py [--messages N] [--conversations C] [--threshold T]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from harness import use_temp_database # Also puts the project on sys.path
+
+import config
+import content_codec
+import database
+
+SENTENCES = [
+    "I hear you, and it sounds like the week has asked a lot of you.",
+    "What part of that conversation stayed with you the longest?",
+    "Sometimes the quiet after a decision says more than the decision itself.",
+    "There is a kind of courage in admitting you are not sure yet.",
+    "It might help to notice what you were hoping would happen instead.",
+    "Cheese, like patience, improves when it is left alone for a while.",
+    "You mentioned your sister earlier; how does she fit into this?",
+    "That is a thoughtful way to put it, {name}.",
+    "Let us sit with that feeling for a moment before trying to fix it.",
+    "Do you think the version of you from a year ago would agree?",
+]
+CODE_LINES = [
+    "def handle(event, context):",
+    "    payload = json.loads(event['body'])",
+    "    if not payload.get('user_id'):",
+    "        raise ValueError('missing user_id')",
+    "    return {{'statusCode': 200, 'body': json.dumps(result)}}",
+    "2024-05-01 12:00:{sec:02d} ERROR worker-{n}: connection reset by peer",
+    "Traceback (most recent call last):",
+    '  File "/srv/app/main.py", line {n}, in <module>',
+]
+MODES = [("plain", "off"), ("zlib", "zlib")]
+if content_codec.zstandard is not None:
+    MODES += [("zstd", "zstd")]
+
+def make_corpus(count, conversations, seed=7):
+    """Returns (conversation_id, role, content) tuples: ~70% short lines, ~25% long replies, ~5% pastes."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        conversation_id = f"chan{rng.randrange(conversations)}"
+        kind = rng.random()
+        if kind < 0.70:
+            content = rng.choice(SENTENCES).format(name=f"user{rng.randrange(50)}")
+            role = "user"
+        elif kind < 0.95:
+            content = " ".join(rng.choice(SENTENCES).format(name=f"user{rng.randrange(50)}") for _ in range(rng.randrange(8, 40)))
+            role = "assistant"
+        else:
+            content = "\n".join(rng.choice(CODE_LINES).format(sec=rng.randrange(60), n=rng.randrange(500)) for _ in range(rng.randrange(40, 200)))
+            role = "user"
+        corpus.append((conversation_id, role, content))
+    return corpus
+
+def run_mode(label, codec, corpus, conversations, directory):
+    os.makedirs(os.path.join(directory, label))
+    use_temp_database(os.path.join(directory, label))
+    config.DB_COMPRESSION = "off"
+    conn = database.open_connection(config.DB_FILE)
+    try:
+        for conversation_id, role, content in corpus:
+            database.save_message(conversation_id, role, content, conn=conn)
+
+        # Convert existing rows, as the background pass does
+        config.DB_COMPRESSION = codec
+        started = time.perf_counter()
+        done = database.compression_format() is None
+        while not done:
+            _, done = database.compress_existing(conn=conn)
+        convert_seconds = time.perf_counter() - started
+
+        long_reply = max((content for _, role, content in corpus if role == "assistant"), key=len)
+        save_times = []
+        for i in range(200):
+            started = time.perf_counter()
+            database.save_message(f"bench{i % 10}", "assistant", long_reply, conn=conn)
+            save_times.append(time.perf_counter() - started)
+
+        read_times = []
+        for i in range(1000):
+            started = time.perf_counter()
+            database.get_history(f"chan{i % conversations}", conn=conn)
+            read_times.append(time.perf_counter() - started)
+    finally:
+        conn.close()
+
+    raw = sqlite3.connect(config.DB_FILE)
+    raw.execute("VACUUM")
+    raw.close()
+    return {
+        "size": os.path.getsize(config.DB_FILE),
+        "convert": convert_seconds,
+        "save": statistics.median(save_times),
+        "read": statistics.median(read_times),
+        "read_p95": statistics.quantiles(read_times, n=20)[-1],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--threshold", type=int, default=512, help="DB_COMPRESSION_THRESHOLD in characters")
+    args = parser.parse_args()
+
+    config.DB_COMPRESSION_THRESHOLD = args.threshold
+    corpus = make_corpus(args.messages, args.conversations)
+    corpus_bytes = sum(len(content.encode()) for _, _, content in corpus)
+    print(f"{args.messages} messages in {args.conversations} conversations, {corpus_bytes / 2**20:.1f} MiB of content, threshold {args.threshold} chars")
+    print(f"{'mode':<10} {'file':>9} {'convert':>9} {'save(long)':>11} {'history':>9} {'p95':>9}")
+    with tempfile.TemporaryDirectory(prefix="fromage-compression-") as directory:
+        for label, codec in MODES:
+            result = run_mode(label, codec, corpus, args.conversations, directory)
+            print(f"{label:<10} {result['size'] / 2**20:7.2f}MiB {result['convert']:8.2f}s "
+                  f"{result['save'] * 1e6:9.0f}us {result['read'] * 1e6:7.0f}us {result['read_p95'] * 1e6:7.0f}us")
+
+if __name__ == "__main__":
+    main()
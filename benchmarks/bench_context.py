@@ -0,0 +1,79 @@
+"""Compares allocations and time of API-message assembly: full rebuild vs prepared context.
+
+"rebuild" is the previous hot path: fetch history rows and the prompt, then format every row and
+the system message into new dicts on each mention. "prepared" is conversation.build_api_messages,
+which reuses the channel's PreparedContext and only formats messages as they are saved.
+Both read from the warm Storage cache, so the difference is assembly alone. Allocation figures
+come from tracemalloc: blocks and bytes allocated per save + assembly cycle, with every returned
+message list kept alive. Times include the save's round trip through the writer thread.
+
+Usage: python benchmarks/bench_context.py [--history N] [--iterations I]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+import tracemalloc
+
+from harness import use_temp_database # Also puts the project on sys.path
+
+import config
+import conversation
+from storage import Storage
+
+async def rebuild(storage, conversation_id):
+    history, custom_prompt = await asyncio.gather(
+        storage.get_history(conversation_id, limit=config.HISTORY_LIMIT),
+        storage.get_channel_prompt(conversation_id),
+    )
+    system_message = {"role": "system", "content": custom_prompt or config.DEFAULT_SYSTEM_PROMPT}
+    return [system_message] + conversation.format_history_for_api(history)
+
+async def measure(storage, assemble, conversation_id, iterations):
+    """Returns (allocated blocks, allocated KiB, microseconds) per mention: one save plus one assembly."""
+    for i in range(config.HISTORY_LIMIT):
+        await storage.save_message(conversation_id, "user", f"Earlier message {i} " * 10, username=f"user_{i % 5}")
+    await assemble(storage, conversation_id) # Fill caches
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        await storage.save_message(conversation_id, "user", f"New message {i}", username="alice")
+        await assemble(storage, conversation_id)
+    seconds = (time.perf_counter() - started) / iterations
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = []
+    for i in range(iterations):
+        await storage.save_message(conversation_id, "user", f"Traced message {i}", username="alice")
+        results.append(await assemble(storage, conversation_id)) # Kept alive so every allocation shows up
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    size = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    return blocks / iterations, size / iterations / 1024, seconds * 1e6
+
+async def run(history, iterations):
+    config.HISTORY_LIMIT = history
+    storage = Storage()
+    await storage.start()
+    try:
+        print(f"History limit {history}, {iterations} mentions per run")
+        print(f"{'path':<9} {'blocks':>8} {'KiB':>8} {'time':>9}")
+        for label, assemble in (("rebuild", rebuild), ("prepared", conversation.build_api_messages)):
+            blocks, kib, micros = await measure(storage, assemble, f"bench-{label}", iterations)
+            print(f"{label:<9} {blocks:8.0f} {kib:8.1f} {micros:7.0f}us")
+    finally:
+        await storage.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, default=20, help="HISTORY_LIMIT")
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+    use_temp_database(tempfile.mkdtemp(prefix="fromage-context-"))
+    asyncio.run(run(args.history, args.iterations))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Compares message-handling throughput between asyncio and uvloop.
+
+Runs the real AIHandler.on_message path (storage writes, history/prompt reads, model call,
+reply) against fake Discord/Mistral objects, once per available loop implementation.
+
+Usage: python benchmarks/bench_event_loop.py [--messages N] [--concurrency C] [--model-latency S]
+"""
+import argparse
+import logging
+
+import harness
+import runtime
+
+async def measure(messages_count, concurrency, model_latency):
+    harness.use_temp_database()
+    bot, cog = await harness.start_harness(model_latency=model_latency)
+    try:
+        # Warm up imports, connections and caches before timing
+        await harness.drive(cog, harness.make_mentions(50, start_id=10_000_000), concurrency)
+        elapsed = await harness.drive(cog, harness.make_mentions(messages_count), concurrency)
+    finally:
+        await bot.storage.close()
+    return runtime.describe_loop(), elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--model-latency", type=float, default=0.01, help="Simulated Mistral latency in seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    for preference in (runtime.LOOP_ASYNCIO, runtime.LOOP_UVLOOP):
+        _, name = runtime.select_loop_factory(preference)
+        if name != preference:
+            print(f"{preference:>8}: not installed, skipped")
+            continue
+        description, elapsed = runtime.run(lambda: measure(args.messages, args.concurrency, args.model_latency), preference)
+        print(f"{preference:>8}: {args.messages / elapsed:8.0f} msgs/s  ({elapsed:.2f}s for {args.messages} messages, {description})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Measures gateway cache memory per MEMORY_PROFILE by replaying a synthetic large guild offline.
+
+Each profile runs in a fresh interpreter: the bot is built exactly as bot.py builds it, then
+a GUILD_CREATE with `--members` members is fed to discord.py's connection state, followed by
+`--messages` MESSAGE_CREATE events. Memory is measured with tracemalloc.
+
+The default profile would chunk members over the gateway after GUILD_CREATE; the synthetic
+payload already carries the full member list, which stands in for the chunk replies.
+
+Usage: python benchmarks/bench_memory.py [--members N] [--messages M]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+GUILD_ID = "1"
+CHANNELS = 50
+BOT_USER_ID = "1000"
+
+def user_payload(user_id):
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "avatar": None, "global_name": f"User {user_id}"}
+
+def member_payload(user_id):
+    return {"user": user_payload(user_id), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+
+def guild_create_payload(members):
+    everyone = {"id": GUILD_ID, "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                "hoist": False, "managed": False, "mentionable": False}
+    channels = [{"id": str(100 + i), "type": 0, "name": f"channel-{i}", "position": i,
+                 "permission_overwrites": [], "guild_id": GUILD_ID} for i in range(CHANNELS)]
+    return {
+        "id": GUILD_ID, "name": "Large Guild", "icon": None, "owner_id": "2000000", "roles": [everyone],
+        "emojis": [], "stickers": [], "features": [], "channels": channels, "threads": [],
+        "members": [member_payload(2_000_000 + i) for i in range(members)], "member_count": members,
+        "large": True, "presences": [], "voice_states": [], "unavailable": False,
+    }
+
+def message_payload(index, members):
+    author_id = 2_000_000 + index % max(members, 1)
+    return {
+        "id": str(10**9 + index), "channel_id": str(100 + index % CHANNELS), "guild_id": GUILD_ID,
+        "author": user_payload(author_id), "member": {k: v for k, v in member_payload(author_id).items() if k != "user"},
+        "content": f"<@{BOT_USER_ID}> synthetic message number {index} with a little padding text",
+        "timestamp": "2024-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False,
+        "mention_everyone": False, "mentions": [user_payload(BOT_USER_ID)], "mention_roles": [],
+        "attachments": [], "embeds": [], "pinned": False, "type": 0,
+    }
+
+def child(profile, members, messages):
+    """Replays the synthetic guild under one profile and prints memory figures as JSON."""
+    import asyncio
+    import tracemalloc
+    sys.path.insert(0, PROJECT_ROOT)
+    import gateway
+
+    guild_data = guild_create_payload(members)
+    message_data = [message_payload(i, members) for i in range(messages)]
+
+    async def replay():
+        bot = gateway.create_bot(profile)
+        await bot._async_setup_hook() # What Client.login does before connecting
+        state = bot._connection
+        state._guild_needs_chunking = lambda guild: False # No gateway to answer chunk requests
+
+        tracemalloc.start()
+        state.parse_guild_create(guild_data)
+        after_guild = tracemalloc.get_traced_memory()[0]
+        for data in message_data:
+            state.parse_message_create(data)
+        await asyncio.sleep(0.1) # Let dispatched on_message handlers finish
+        current, peak = tracemalloc.get_traced_memory()
+        guild = bot.get_guild(int(GUILD_ID))
+        return {
+            "guild_create": after_guild, "total": current, "peak": peak,
+            "cached_members": len(guild.members), "cached_messages": len(bot.cached_messages),
+        }
+
+    print(json.dumps(asyncio.run(replay())))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--messages", type=int, default=5_000)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.members, args.messages)
+        return
+
+    sys.path.insert(0, PROJECT_ROOT)
+    import gateway
+    print(f"Synthetic guild: {args.members} members, {CHANNELS} channels, {args.messages} messages")
+    for profile in (gateway.PROFILE_DEFAULT, gateway.PROFILE_MINIMAL):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", profile, "--members", str(args.members), "--messages", str(args.messages)],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{profile:>8}: GUILD_CREATE {result['guild_create'] / 2**20:7.1f} MiB, "
+              f"after messages {result['total'] / 2**20:7.1f} MiB (peak {result['peak'] / 2**20:.1f} MiB), "
+              f"{result['cached_members']} members / {result['cached_messages']} messages cached")
+
+if __name__ == "__main__":
+    main()
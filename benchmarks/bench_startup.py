@@ -0,0 +1,84 @@
+"""Measures cold-start time-to-ready against a fake gateway.
+
+Each run is a fresh interpreter that imports bot.py, runs bot.main() with login/connect
+replaced by an offline gateway that dispatches READY after `--gateway-latency` seconds, and
+reports the per-phase startup breakdown. Prints the median of each phase across runs.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--gateway-latency S]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def child(gateway_latency, db_dir):
+    """Runs one startup in this process and prints the phase timings as JSON."""
+    import asyncio
+    from types import SimpleNamespace
+    sys.path.insert(0, PROJECT_ROOT)
+    import bot as bot_module
+    import discord
+    import config
+    import runtime
+
+    config.DB_FILE = os.path.join(db_dir, "history.db")
+    client = bot_module.bot
+
+    # Real Client.login runs; only its two HTTP calls are answered offline
+    async def fake_static_login(token):
+        return {"id": "1000", "username": "Fromage", "discriminator": "0", "avatar": None, "bot": True}
+
+    async def fake_application_info():
+        return SimpleNamespace(id=1000, interactions_endpoint_url=None, flags=discord.ApplicationFlags())
+
+    async def fake_connect(reconnect=True):
+        await asyncio.sleep(gateway_latency) # Stand-in for the gateway handshake
+        client.dispatch("ready")
+        while not bot_module.startup.finished:
+            await asyncio.sleep(0.001)
+
+    async def fake_change_presence(**kwargs):
+        pass
+
+    client.http.static_login = fake_static_login
+    client.application_info = fake_application_info
+    client.connect = fake_connect
+    client.change_presence = fake_change_presence
+    runtime.run(bot_module.main)
+    print(json.dumps({"phases": bot_module.startup.phases, "total": bot_module.startup.total}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--gateway-latency", type=float, default=0.0, help="Simulated seconds from connect to READY")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--db-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.gateway_latency, args.db_dir)
+        return
+
+    env = dict(os.environ, DISCORD_TOKEN="offline-benchmark", LOG_LEVEL="WARNING")
+    results = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as db_dir:
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", "--gateway-latency", str(args.gateway_latency), "--db-dir", db_dir],
+                cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True,
+            ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    phase_names = [name for name, _ in results[0]["phases"]]
+    print(f"Median over {args.runs} cold starts (gateway latency {args.gateway_latency:.3f}s):")
+    for index, name in enumerate(phase_names):
+        print(f"  {name:<15} {statistics.median(run['phases'][index][1] for run in results) * 1000:8.1f}ms")
+    print(f"  {'time-to-ready':<15} {statistics.median(run['total'] for run in results) * 1000:8.1f}ms")
+
+if __name__ == "__main__":
+    main()
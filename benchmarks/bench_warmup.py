@@ -0,0 +1,100 @@
+"""Measures first-mention latency after a restart, with and without the warm-up pass.
+
+Builds a database of --channels conversations (long replies stored compressed), then starts a
+fresh process per run so nothing is cached in memory. The "warm" run lets the Warmup cog preload
+the most recently active conversations before the first mentions arrive; the "cold" run sends
+them straight away. Reports per-mention latency through AIHandler.on_message for the
+--hot most recently active channels (the model call itself is a zero-latency fake).
+
+Usage: python benchmarks/bench_warmup.py [--channels N] [--messages M] [--hot H]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import BOT_USER_ID, FakeChannel, FakeGuild, FakeMessage, FakeUser, start_harness, use_temp_database # Also puts the project on sys.path
+
+import config
+import database
+
+REPLY = "Patience is a kind of ripening; the best things take the time they need. " * 12
+
+def build_database(directory, channels, messages, hot):
+    use_temp_database(directory)
+    conn = database.open_connection(config.DB_FILE)
+    try:
+        for c in range(channels):
+            for i in range(messages):
+                role = "user" if i % 2 == 0 else "assistant"
+                content = f"Question {i} from channel {c}?" if role == "user" else REPLY
+                database.save_message(str(5000 + c), role, content, username=f"user{i % 7}" if role == "user" else None, conn=conn)
+    finally:
+        conn.close()
+    # The first `hot` channels are the most recently active ones
+    raw = sqlite3.connect(config.DB_FILE)
+    raw.execute("UPDATE messages SET timestamp = datetime('now', '-1 day') WHERE CAST(conversation_id AS INTEGER) >= ?", (5000 + hot,))
+    raw.commit()
+    raw.close()
+
+async def first_mentions(warm, hot):
+    from cogs.warmup import Warmup
+    bot, cog = await start_harness()
+    warmup_seconds = 0.0
+    if warm:
+        started = time.perf_counter()
+        await Warmup(bot).run("benchmark")
+        warmup_seconds = time.perf_counter() - started
+
+    guild = FakeGuild(900)
+    author = FakeUser(2000, "user0", "User 0")
+    latencies = []
+    for c in range(hot):
+        message = FakeMessage(10_000 + c, f"<@{BOT_USER_ID}> hello again", author, FakeChannel(5000 + c, guild))
+        started = time.perf_counter()
+        await cog.on_message(message)
+        latencies.append(time.perf_counter() - started)
+    await bot.storage.close()
+    return {"warmup": warmup_seconds, "latencies": latencies}
+
+def run_child(args):
+    config.DB_FILE = os.path.join(args.directory, "history.db")
+    config.DB_PARTITION_DIR = os.path.join(args.directory, "partitions")
+    config.WARMUP_CHANNELS = args.hot
+    config.WARMUP_RATE = 0 # Unpaced: measure how long a full warm-up takes
+    print(json.dumps(asyncio.run(first_mentions(args.child == "warm", args.hot))))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=40, help="Stored messages per channel")
+    parser.add_argument("--hot", type=int, default=100, help="Recently active channels that get a first mention")
+    parser.add_argument("--child", choices=["cold", "warm"], help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="fromage-warmup-") as directory:
+        build_database(directory, args.channels, args.messages, args.hot)
+        print(f"{args.channels} channels x {args.messages} messages, first mention in the {args.hot} most recently active")
+        print(f"{'run':<6} {'warm-up':>9} {'median':>9} {'p95':>9} {'max':>9}")
+        for run in ("cold", "warm"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", run, "--directory", directory, "--hot", str(args.hot)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            latencies = result["latencies"]
+            print(f"{run:<6} {result['warmup'] * 1000:7.0f}ms {statistics.median(latencies) * 1e6:7.0f}us "
+                  f"{statistics.quantiles(latencies, n=20, method='inclusive')[-1] * 1e6:7.0f}us {max(latencies) * 1e6:7.0f}us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Offline load harness: drives the real cogs with fake Discord and Mistral objects.
+
+No network access or tokens are needed. Benchmarks build a HarnessBot, attach the cogs they
+want to measure, and feed FakeMessages through the cog listeners.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Make the project importable and keep config's token check satisfied offline
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+os.environ.setdefault("DISCORD_TOKEN", "offline-harness")
+
+import config
+import database
+from delivery import Delivery
+from storage import Storage
+
+BOT_USER_ID = 1000
+
+class FakeUser:
+    def __init__(self, user_id, name, global_name=None):
+        self.id = user_id
+        self.name = name
+        self.global_name = global_name
+
+    def mentioned_in(self, message):
+        return f"<@{self.id}>" in message.content
+
+    def __str__(self):
+        return self.name
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.shard_id = 0
+
+class FakeChannel:
+    """Records what the bot sends; `send_latency` simulates the Discord HTTP round trip."""
+
+    def __init__(self, channel_id, guild=None, send_latency=0.0):
+        self.id = channel_id
+        self.guild = guild
+        self.send_latency = send_latency
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        self.sent.append(content)
+        return SimpleNamespace(id=len(self.sent), content=content, channel=self)
+
+class FakeMessage:
+    def __init__(self, message_id, content, author, channel):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+
+class FakeMistral:
+    """Stands in for the Mistral client; replies after `latency` seconds."""
+
+    def __init__(self, latency=0.0, reply="A thoughtful reply."):
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+        self.chat = self
+
+    async def complete_async(self, model, messages):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = SimpleNamespace(content=self.reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+class HarnessBot:
+    """Just enough of commands.Bot for the cogs' message path."""
+
+    def __init__(self, storage):
+        self.user = FakeUser(BOT_USER_ID, "Fromage")
+        self.command_prefix = "$"
+        self.storage = storage
+        self.job_queue = None # Combined deployment mode
+        self.delivery = Delivery(channel_rate=0, global_rate=0) # The fake channels have no rate limits
+        self.latency = 0.05
+
+    def get_channel(self, channel_id):
+        return FakeChannel(channel_id) # Every channel is visible to the harness
+
+def use_temp_database(directory=None):
+    """Points config at a fresh database file in a temporary directory and returns its path."""
+    directory = directory or tempfile.mkdtemp(prefix="fromage-bench-")
+    config.DB_FILE = os.path.join(directory, "history.db")
+    config.DB_PARTITION_DIR = os.path.join(directory, "partitions")
+    database.close_partition_pool()
+    database.init_db()
+    return config.DB_FILE
+
+async def start_harness(model_latency=0.0, send_latency=0.0):
+    """Starts storage and an AIHandler wired to fakes. Returns (bot, cog)."""
+    from cogs.ai_handler import AIHandler
+    storage = Storage()
+    await storage.start()
+    bot = HarnessBot(storage)
+    cog = AIHandler(bot)
+    cog.mistral_client = FakeMistral(latency=model_latency)
+    return bot, cog
+
+def make_mentions(count, channels=10, guilds=1, send_latency=0.0, start_id=1):
+    """Builds `count` mention messages spread round-robin over `channels` channels in `guilds` guilds."""
+    guild_objs = [FakeGuild(900 + g) for g in range(guilds)]
+    channel_objs = [FakeChannel(5000 + c, guild_objs[c % guilds], send_latency) for c in range(channels)]
+    authors = [FakeUser(2000 + a, f"user{a}", f"User {a}") for a in range(20)]
+    messages = []
+    for i in range(count):
+        channel = channel_objs[i % channels]
+        author = authors[i % len(authors)]
+        messages.append(FakeMessage(start_id + i, f"<@{BOT_USER_ID}> message number {i}", author, channel))
+    return messages
+
+async def drive(cog, messages, concurrency=50):
+    """Feeds messages through cog.on_message with bounded concurrency. Returns elapsed seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(message):
+        async with semaphore:
+            await cog.on_message(message)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(message) for message in messages))
+    return time.perf_counter() - started
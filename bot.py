@@ -1,4 +1,7 @@
 # bot.py
+import time
+_process_started = time.perf_counter() # Startup timing starts before the heavy imports below
+
 import discord
 import logging
 import os
@@ -8,58 +11,85 @@ from discord.ext import commands
 # Import our custom modules
 import config
 import database
+import gateway
+import logging_setup
+import runtime
+import worker
+from delivery import Delivery
+from job_queue import JobQueue
+from storage import Storage
+
+# --- Configuration ---
+# Read .env and validate secrets before anything below builds objects from settings
+config.load()
+startup = runtime.StartupTimer(started=_process_started)
 
-# --- Basic Logging Setup ---
-# Configure logging level and format
-log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
-logging.basicConfig(level=getattr(logging, log_level, logging.INFO),
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Logging Setup ---
+# Records are queued and written by a listener thread (see logging_setup.py);
+# level and JSON output come from LOG_LEVEL / LOG_JSON.
+logging_setup.setup_logging()
 # Suppress overly verbose discord logs if desired
 # logging.getLogger('discord').setLevel(logging.WARNING)
 # logging.getLogger('discord.http').setLevel(logging.WARNING)
 # logging.getLogger('discord.gateway').setLevel(logging.WARNING)
 
 # --- Bot Setup ---
-# Define necessary intents
-intents = discord.Intents.default()
-intents.message_content = True  # Required for reading message content
-intents.members = True # Potentially needed for username resolution, enable if needed
-intents.guilds = True # Needed for guild-only commands and context
-
-# Initialize the bot
-bot = commands.Bot(command_prefix="$", intents=intents)
+# Intents, member/message caches and chunking come from MEMORY_PROFILE (see gateway.py)
+bot = gateway.create_bot()
+# Cogs reach the database through this async facade (single writer, parallel readers)
+bot.storage = Storage()
+# Replies go out through ordered per-channel lanes within Discord's rate limits (see delivery.py)
+bot.delivery = Delivery()
+# Set in gateway deployment mode: mentions become jobs for the AI worker processes (see worker.py)
+bot.job_queue = None
 
 # --- Cog Loading ---
+async def load_extension(extension):
+    """Loads a single extension, logging (rather than raising) any failure."""
+    try:
+        await bot.load_extension(extension)
+        logging.info(f"Successfully loaded extension: {extension}")
+    except commands.ExtensionNotFound:
+        logging.error(f"Extension not found: {extension}")
+    except commands.ExtensionAlreadyLoaded:
+        logging.warning(f"Extension already loaded: {extension}")
+    except commands.NoEntryPointError:
+        logging.error(f"Extension '{extension}' has no setup() function.")
+    except commands.ExtensionFailed as e:
+        logging.exception(f"Extension {extension} failed to load: {e.args[0]}") # Log the original exception
+    except Exception as e:
+        logging.exception(f"An unexpected error occurred loading extension {extension}: {e}")
+
 async def load_extensions():
-    """Loads all cogs from the 'cogs' directory."""
+    """Loads all cogs from the 'cogs' directory concurrently."""
     cogs_dir = "cogs"
     if not os.path.exists(cogs_dir):
         logging.warning(f"Cogs directory '{cogs_dir}' not found. No cogs will be loaded.")
         return
 
-    for filename in os.listdir(cogs_dir):
-        if filename.endswith(".py") and not filename.startswith("_"):
-            extension = f"{cogs_dir}.{filename[:-3]}"
-            try:
-                await bot.load_extension(extension)
-                logging.info(f"Successfully loaded extension: {extension}")
-            except commands.ExtensionNotFound:
-                logging.error(f"Extension not found: {extension}")
-            except commands.ExtensionAlreadyLoaded:
-                logging.warning(f"Extension already loaded: {extension}")
-            except commands.NoEntryPointError:
-                logging.error(f"Extension '{extension}' has no setup() function.")
-            except commands.ExtensionFailed as e:
-                logging.exception(f"Extension {extension} failed to load: {e.args[0]}") # Log the original exception
-            except Exception as e:
-                logging.exception(f"An unexpected error occurred loading extension {extension}: {e}")
+    extensions = [
+        f"{cogs_dir}.{filename[:-3]}"
+        for filename in sorted(os.listdir(cogs_dir))
+        if filename.endswith(".py") and not filename.startswith("_")
+    ]
+    # Cogs are independent of each other, so their setup() awaits can overlap
+    await asyncio.gather(*(load_extension(extension) for extension in extensions))
 
 # --- Bot Events ---
+@bot.before_invoke
+async def tag_command_logs(ctx: commands.Context):
+    """Tags every log line emitted while running a command with the invoking message's ID."""
+    logging_setup.set_correlation_id(ctx.message.id)
+
 @bot.event
 async def on_ready():
     """Called when the bot is ready and connected to Discord."""
     logging.info(f'Logged in as {bot.user.name} ({bot.user.id})')
     logging.info(f'discord.py version: {discord.__version__}')
+    logging.info(f'Event loop: {runtime.describe_loop()}')
+    if isinstance(bot, commands.AutoShardedBot):
+        logging.info(f'Running shards {bot.shard_ids if bot.shard_ids is not None else "(all)"} of {bot.shard_count}')
+    logging.info(f'Memory profile: {config.MEMORY_PROFILE} (members intent: {bot.intents.members}, cached guild members: {sum(len(guild.members) for guild in bot.guilds)})')
     logging.info('------')
     # Set a status (optional)
     status_message = "CheeseCraft | $help"
@@ -68,33 +98,82 @@ async def on_ready():
         activity=discord.Activity(type=discord.ActivityType.playing, name=status_message)
     )
     logging.info("Bot is ready and listening!")
+    if not startup.finished: # on_ready fires again after reconnects
+        startup.finish("connect")
+        logging.info(startup.report())
+
+@bot.event
+async def on_shard_ready(shard_id):
+    """Called for each shard once it has its guilds (sharded mode only)."""
+    logging.info(f"Shard {shard_id} is ready.")
+
+# --- Background Maintenance ---
+async def compress_existing_messages():
+    """Retires dictionaries trained on message text, and compresses messages stored before compression was enabled (DB_COMPRESS_EXISTING)."""
+    try:
+        compressed = await bot.storage.compress_all(compress=config.DB_COMPRESS_EXISTING)
+        if compressed:
+            logging.info(f"Compressed {compressed} existing messages.")
+    except Exception as e:
+        logging.exception(f"Error compressing existing messages: {e}")
 
 # --- Run the Bot ---
 async def main():
     """Main entry point: Initializes DB, loads cogs, runs bot."""
-    # Ensure DB is initialized *before* starting the bot
-    database.init_db()
-
-    # Load cogs
-    await load_extensions()
-
-    # Start the bot
-    if not config.DISCORD_TOKEN:
-        logging.critical("Cannot start bot: DISCORD_TOKEN is missing.")
-    else:
-        try:
-            await bot.start(config.DISCORD_TOKEN)
-        except discord.errors.LoginFailure:
-            logging.error("Invalid Discord token provided. Please check your .env file.")
-        except discord.errors.PrivilegedIntentsRequired as e:
-            logging.error(f"Privileged Intents Error: {e}. Make sure required intents (e.g., Message Content) are enabled in the Discord Developer Portal.")
-        except Exception as e:
-            logging.exception(f"An unexpected error occurred while running the bot: {e}")
+    startup.mark("imports")
+    runtime.configure_loop()
+    await bot.storage.start()
+    workers = supervisor = compression = None
+
+    try:
+        if config.DEPLOYMENT_MODE == worker.MODE_GATEWAY:
+            bot.job_queue = await asyncio.to_thread(JobQueue, config.JOB_QUEUE_FILE, config.JOB_MAX_ATTEMPTS)
+            if config.AI_WORKERS > 0:
+                workers = worker.WorkerPool(config.AI_WORKERS)
+                workers.start()
+                supervisor = asyncio.create_task(workers.supervise(), name="worker-supervisor")
+            logging.info(f"Gateway mode: mentions are queued in {config.JOB_QUEUE_FILE} for {config.AI_WORKERS or 'external'} AI workers.")
+        elif config.DEPLOYMENT_MODE != worker.MODE_COMBINED:
+            logging.warning(f"Unknown DEPLOYMENT_MODE '{config.DEPLOYMENT_MODE}'; using '{worker.MODE_COMBINED}'.")
+
+        # Schema setup runs on a worker thread while cogs load on the loop
+        await asyncio.gather(asyncio.to_thread(database.init_db), load_extensions())
+        startup.mark("db+extensions")
+        compression = asyncio.create_task(compress_existing_messages(), name="compress-existing")
+
+        # Start the bot
+        if not config.DISCORD_TOKEN:
+            logging.critical("Cannot start bot: DISCORD_TOKEN is missing.")
+        else:
+            try:
+                await bot.start(config.DISCORD_TOKEN)
+            except discord.errors.LoginFailure:
+                logging.error("Invalid Discord token provided. Please check your .env file.")
+            except discord.errors.PrivilegedIntentsRequired as e:
+                logging.error(f"Privileged Intents Error: {e}. Make sure required intents (e.g., Message Content) are enabled in the Discord Developer Portal.")
+            except Exception as e:
+                logging.exception(f"An unexpected error occurred while running the bot: {e}")
+    finally:
+        if not bot.is_closed():
+            await bot.close()
+        if supervisor is not None:
+            supervisor.cancel()
+        if compression is not None:
+            compression.cancel()
+        if workers is not None:
+            # Workers finish their in-flight jobs; replies left in the queue are sent after the next start
+            await asyncio.to_thread(workers.stop)
+        if bot.job_queue is not None:
+            bot.job_queue.close()
+        # Flush queued writes before the loop goes away
+        await bot.storage.close()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        runtime.run(main) # uvloop when available, see EVENT_LOOP in config.py
     except KeyboardInterrupt:
         logging.info("Bot shutting down gracefully.")
     except Exception as e:
-        logging.exception(f"Critical error during startup or shutdown: {e}")
\ No newline at end of file
+        logging.exception(f"Critical error during startup or shutdown: {e}")
+    finally:
+        logging_setup.stop_logging() # Flush queued records before exiting
\ No newline at end of file
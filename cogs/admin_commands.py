@@ -1,9 +1,49 @@
 # cogs/admin_commands.py
+import asyncio
 import logging
+import time
+import discord
 from discord.ext import commands
 import database # Import our database module
 import config # Import config for default prompt reference if needed
 
+PROGRESS_INTERVAL = 2.0 # Minimum seconds between edits of a progress message
+
+class ProgressReporter:
+    """Reports a long operation's progress in one message, edited at most every PROGRESS_INTERVAL seconds.
+
+    Nothing is sent until the first update, so operations that finish in one step only send
+    their final reply.
+    """
+
+    def __init__(self, ctx: commands.Context, interval=PROGRESS_INTERVAL):
+        self.ctx = ctx
+        self.interval = interval
+        self.message = None
+        self._last_update = 0.0
+
+    async def update(self, text):
+        now = time.monotonic()
+        try:
+            if self.message is None:
+                self.message = await self.ctx.send(text)
+                self._last_update = now
+            elif now - self._last_update >= self.interval:
+                self._last_update = now
+                await self.message.edit(content=text)
+        except discord.HTTPException as e:
+            logging.warning(f"Could not update progress message: {e}")
+
+    async def finish(self, text):
+        """Replaces the progress message with the final reply (or sends it, if no progress was shown)."""
+        if self.message is not None:
+            try:
+                await self.message.edit(content=text)
+                return
+            except discord.HTTPException:
+                pass # Progress message is gone; fall back to a new one
+        await self.ctx.send(text)
+
 class AdminCommands(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -21,9 +61,10 @@ class AdminCommands(commands.Cog):
             return
 
         conversation_id = str(ctx.channel.id)
+        guild_id = str(ctx.guild.id)
 
         # Store the new prompt in the database for this channel
-        success = database.set_channel_prompt(conversation_id, new_prompt)
+        success = await self.bot.storage.set_channel_prompt(conversation_id, new_prompt, guild_id=guild_id)
 
         if not success:
             await ctx.send("I encountered an issue trying to save the new prompt for this channel. Please check the logs.")
@@ -35,7 +76,7 @@ class AdminCommands(commands.Cog):
         deleted_count = 0
         try:
             # Call with the specific conversation_id
-            deleted_count = database.clear_conversation_history(conversation_id)
+            deleted_count = await self.bot.storage.clear_conversation_history(conversation_id, guild_id=guild_id)
             logging.info(f"History for channel {conversation_id} cleared by set_prompt command.")
         except Exception as e:
             logging.exception(f"Error clearing history during set_prompt for channel {conversation_id}: {e}")
@@ -65,11 +106,17 @@ class AdminCommands(commands.Cog):
     async def clear_history(self, ctx: commands.Context):
         """Clears Fromage's memory (message history) for this channel."""
         conversation_id = str(ctx.channel.id)
+        guild_id = str(ctx.guild.id)
         deleted_count = 0
+        reporter = ProgressReporter(ctx)
+
+        async def progress(deleted):
+            await reporter.update(f"Clearing my memory of this channel... {deleted:,} messages so far.")
+
         try:
-            # Call with the specific conversation_id
-            deleted_count = database.clear_conversation_history(conversation_id)
-            await ctx.send(f"Very well. I have purged my memory of our last {deleted_count} exchanges in this channel. A fresh start, perhaps?" if deleted_count > 0 else "My memory of this channel is already pristine.")
+            # Call with the specific conversation_id; large histories are deleted in chunks
+            deleted_count = await self.bot.storage.clear_conversation_history(conversation_id, guild_id=guild_id, progress=progress)
+            await reporter.finish(f"Very well. I have purged my memory of our last {deleted_count} exchanges in this channel. A fresh start, perhaps?" if deleted_count > 0 else "My memory of this channel is already pristine.")
         except Exception as e:
             logging.exception(f"Error clearing history for channel {conversation_id}: {e}")
             await ctx.send("I encountered an issue trying to clear the history for this channel. Please check the logs.")
@@ -85,6 +132,52 @@ class AdminCommands(commands.Cog):
             await ctx.send("I encountered an issue trying to clear the history for this channel. Please check the logs.")
 
 
+    @commands.command(name='purgeguild')
+    @commands.has_permissions(manage_guild=True) # Requires 'Manage Server' permission
+    @commands.guild_only()
+    async def purge_guild(self, ctx: commands.Context, confirmation: str = None):
+        """Clears Fromage's memory of every channel in this server. Use `$purgeguild confirm`.
+
+        Channel prompts are kept. Requires 'Manage Server' permission.
+        """
+        if confirmation != "confirm":
+            await ctx.send("This will erase my memory of every channel in this server (custom prompts are kept). Type `$purgeguild confirm` to proceed.")
+            return
+
+        guild_id = str(ctx.guild.id)
+        conversation_ids = {str(channel.id) for channel in list(ctx.guild.channels) + list(ctx.guild.threads)}
+        if config.DB_PARTITION_MODE == database.PARTITION_MODE_GUILD:
+            # The guild's partition also holds channels that were deleted since
+            conversation_ids.update(await self.bot.storage.list_conversations(guild_id=guild_id))
+
+        reporter = ProgressReporter(ctx)
+        await reporter.update(f"Purging my memory of {len(conversation_ids)} channels...")
+        deleted_count = 0
+        cleared_channels = 0
+        for index, conversation_id in enumerate(sorted(conversation_ids), start=1):
+            async def progress(deleted):
+                await reporter.update(f"Purging channel {index}/{len(conversation_ids)}... {deleted_count + deleted:,} messages so far.")
+
+            deleted = await self.bot.storage.clear_conversation_history(conversation_id, guild_id=guild_id, progress=progress)
+            if deleted:
+                deleted_count += deleted
+                cleared_channels += 1
+                await reporter.update(f"Purging channel {index}/{len(conversation_ids)}... {deleted_count:,} messages so far.")
+
+        logging.info(f"Guild {guild_id} purged by {ctx.author}: {deleted_count} messages in {cleared_channels} channels.")
+        await reporter.finish(f"Done. I have let go of {deleted_count:,} messages across {cleared_channels} channels in this server.")
+
+    @purge_guild.error
+    async def purge_guild_error(self, ctx: commands.Context, error):
+        if isinstance(error, commands.MissingPermissions):
+            await ctx.send("Forgetting an entire server is a weighty thing; it requires the 'Manage Server' permission.")
+        elif isinstance(error, commands.NoPrivateMessage):
+            await ctx.send("This command purges a server's memory, so it can only be used within a server.")
+        else:
+            logging.error(f"Unhandled error in purge_guild command: {error}")
+            await ctx.send("I encountered an issue trying to purge this server's history. Please check the logs.")
+
+
     @commands.command(name='resetprompt')
     @commands.has_permissions(manage_messages=True) # Requires 'Manage Messages' permission
     @commands.guild_only()
@@ -95,19 +188,20 @@ class AdminCommands(commands.Cog):
         Requires 'Manage Messages' permission.
         """
         conversation_id = str(ctx.channel.id)
+        guild_id = str(ctx.guild.id)
 
         # Attempt to delete the custom prompt setting
-        deleted = database.delete_channel_prompt(conversation_id)
+        deleted = await self.bot.storage.delete_channel_prompt(conversation_id, guild_id=guild_id)
 
         if deleted:
             # If a custom prompt was deleted, clear the history
-            deleted_count = database.clear_conversation_history(conversation_id)
+            deleted_count = await self.bot.storage.clear_conversation_history(conversation_id, guild_id=guild_id)
             logging.info(f"Custom prompt for channel {conversation_id} reset by {ctx.author}. History cleared ({deleted_count} messages).")
             await ctx.send(f"The custom system prompt for this channel has been reset to the default. I've also cleared our last {deleted_count} exchanges here.")
         elif deleted is False:
             # If delete_channel_prompt returned False, it might be an error or no prompt existed
             # Let's check if a prompt existed to give a better message
-            current_prompt = database.get_channel_prompt(conversation_id)
+            current_prompt = await self.bot.storage.get_channel_prompt(conversation_id, guild_id=guild_id)
             if current_prompt is None:
                  await ctx.send("This channel is already using the default system prompt. No changes made.")
             else:
@@ -125,6 +219,55 @@ class AdminCommands(commands.Cog):
             await ctx.send("I encountered an issue trying to reset the prompt for this channel. Please check the logs.")
 
 
+    @commands.command(name='dbstats')
+    @commands.is_owner()
+    async def db_stats(self, ctx: commands.Context):
+        """Shows message and conversation counts for every database partition (bot owner only)."""
+        stats = await asyncio.to_thread(database.get_storage_stats)
+        if not stats:
+            await ctx.send("No database files found.")
+            return
+
+        lines = [f"Partition mode: `{config.DB_PARTITION_MODE}`"]
+        for entry in stats:
+            label = f"guild {entry['guild_id']}" if entry['guild_id'] else "shared"
+            lines.append(f"- {label}: {entry['messages']} messages ({entry['compressed']} compressed) in {entry['conversations']} conversations ({entry['size_bytes'] / 1024:.0f} KiB)")
+        total = sum(entry['messages'] for entry in stats)
+        lines.append(f"Total: {total} messages across {len(stats)} files.")
+        await ctx.send("\n".join(lines)[:2000])
+
+    @commands.command(name='splitdb')
+    @commands.is_owner()
+    async def split_db(self, ctx: commands.Context):
+        """Moves existing conversations from the shared database into per-guild partitions (bot owner only).
+
+        Only available when DB_PARTITION_MODE is 'guild'. Conversations from channels the bot
+        can no longer see stay in the shared file.
+        """
+        if config.DB_PARTITION_MODE != database.PARTITION_MODE_GUILD:
+            await ctx.send("Partitioning is disabled. Set `DB_PARTITION_MODE=guild` and restart before splitting the database.")
+            return
+
+        channel_guild_map = {}
+        for guild in self.bot.guilds:
+            for channel in list(guild.channels) + list(guild.threads):
+                channel_guild_map[str(channel.id)] = str(guild.id)
+
+        await ctx.send(f"Splitting the shared database across {len(self.bot.guilds)} guilds...")
+        moved = await self.bot.storage.split_into_guild_partitions(channel_guild_map)
+        logging.info(f"Database split requested by {ctx.author}: {moved}")
+        await ctx.send(f"Done. Moved {sum(moved.values())} messages into {len(moved)} guild partitions.")
+
+    @db_stats.error
+    @split_db.error
+    async def owner_command_error(self, ctx: commands.Context, error):
+        if isinstance(error, commands.NotOwner):
+            await ctx.send("My apologies, only the bot owner may inspect or reshape my memory stores.")
+        else:
+            logging.error(f"Unhandled error in {ctx.command} command: {error}")
+            await ctx.send("I encountered an issue running that command. Please check the logs.")
+
+
 # Make sure the setup function is present for the cog to load
 async def setup(bot: commands.Bot):
     await bot.add_cog(AdminCommands(bot))
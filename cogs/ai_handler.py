@@ -1,50 +1,45 @@
 # cogs/ai_handler.py
+import asyncio
 import logging
-import re
+import os
+import time
 import discord
 from discord.ext import commands
-from mistralai import Mistral
 import config  # Import our config module
-import database # Import our database module
-import time
+import conversation
+import logging_setup
+
+PURGE_INTERVAL = 60 # Seconds between removals of finished jobs from the queue (gateway mode)
 
 class AIHandler(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.mistral_client = self.initialize_mistral()
-
-    def initialize_mistral(self):
-        """Initializes the Mistral client."""
-        if config.MISTRAL_API_KEY:
-            try:
-                client = Mistral(api_key=config.MISTRAL_API_KEY)
-                # Optionally, perform a simple test call here if desired
-                logging.info("Mistral AI client initialized successfully.")
-                return client
-            except Exception as e:
-                logging.error(f"Failed to initialize Mistral AI client: {e}")
-                return None
-        else:
-            logging.warning("Mistral API key not found. AI features will be disabled.")
-            return None
-
-    def format_history_for_api(self, history: list[dict]) -> list[dict]:
-        """Formats the database history into dictionaries for the API."""
-        messages = []
-        for msg in history:
-            # Map db roles ('user', 'assistant') to API roles if needed
-            # (Assuming they are already compatible based on previous code)
-            role = msg.get('role', 'user') # Default to user if role is missing? Adjust as needed.
-            content = msg.get('content', '')
-            # Add name field only if role is 'user' and username exists
-            name = msg.get('username') if role == 'user' else None
-
-            # Create dictionary, including name only when appropriate
-            if name:
-                 messages.append({"role": role, "content": content, "name": name})
-            else:
-                 messages.append({"role": role, "content": content})
-        return messages
+        # Created on first use: importing mistralai is the slowest part of loading this cog
+        self.mistral_client = None
+        self._mistral_init_attempted = False
+        self._mistral_init_lock = asyncio.Lock()
+        self._delivery_task = None
+        self._channel_deliveries = {} # channel ID -> task sending that channel's claimed replies (gateway mode)
+
+    async def cog_load(self):
+        # Gateway mode: replies come back from the AI workers through the job queue
+        if self.bot.job_queue is not None:
+            self._delivery_task = asyncio.create_task(self.deliver_responses(), name="response-delivery")
+
+    async def cog_unload(self):
+        if self._delivery_task is not None:
+            self._delivery_task.cancel()
+        for task in list(self._channel_deliveries.values()):
+            task.cancel()
+
+    async def get_mistral_client(self):
+        """Returns the Mistral client, importing mistralai and creating it off the event loop on first use."""
+        if self.mistral_client is None and not self._mistral_init_attempted:
+            async with self._mistral_init_lock:
+                if self.mistral_client is None and not self._mistral_init_attempted:
+                    self._mistral_init_attempted = True
+                    self.mistral_client = await asyncio.to_thread(conversation.create_mistral_client)
+        return self.mistral_client
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -62,72 +57,116 @@ class AIHandler(commands.Cog):
         if message.content.startswith(self.bot.command_prefix):
              return
 
-        # Check if Mistral client is available (stored on the cog instance)
-        if not self.mistral_client:
-            logging.warning("Mistral client not available. Cannot process AI request.")
-            # Maybe send a message indicating AI is offline?
-            # await message.channel.send("My apologies, my connection to the digital ether seems disrupted. I cannot process this request right now.")
-            return
-
-        # Get conversation ID (channel ID)
+        # Get conversation ID (channel ID) and the guild whose partition stores it
         conversation_id = str(message.channel.id)
+        guild_id = str(message.guild.id) if message.guild else None
 
         # Get user display name (use global_name if available, fallback to name)
         user_name = message.author.global_name if message.author.global_name else message.author.name
         # Sanitize username for the 'name' field in dictionary
-        # Must be ^[a-zA-Z0-9_-]{1,64}$
-        sanitized_user_name = re.sub(r'[^a-zA-Z0-9_-]', '_', user_name)
-        if not sanitized_user_name: # Handle empty names after sanitization
-            sanitized_user_name = "user"
-        sanitized_user_name = sanitized_user_name[:64] # Enforce max length
+        sanitized_user_name = conversation.sanitize_username(user_name)
 
         # Extract user input, removing the bot mention
         user_input = message.content.replace(f'<@{self.bot.user.id}>', '').strip()
         if not user_input: # Ignore empty messages after removing mention
              return
 
-        logging.info(f"Processing message from {user_name} ({message.author}) in conv {conversation_id}: \"{user_input[:50]}...\"")
-
-        # Save user message to DB
-        database.save_message(conversation_id, "user", user_input, username=sanitized_user_name)
-
-        # Retrieve history and format for API
-        history = database.get_history(conversation_id, limit=config.HISTORY_LIMIT)
-        formatted_history = self.format_history_for_api(history)
+        # Every log line from here on (including storage work) carries this message's ID.
+        # Hot-path logging uses %-style args so formatting happens lazily on the log listener thread.
+        logging_setup.set_correlation_id(message.id)
+        logging.info('Processing message from %s (%s) in conv %s: "%.50s..."', user_name, message.author, conversation_id, user_input)
+
+        if self.bot.job_queue is not None:
+            # Gateway mode: hand the mention to an AI worker; the reply arrives via deliver_responses()
+            payload = {"content": user_input, "username": sanitized_user_name}
+            queued = await asyncio.to_thread(self.bot.job_queue.enqueue, message.id, conversation_id, guild_id, payload)
+            if not queued:
+                logging.info("Message %s is already queued; ignoring duplicate event.", message.id)
+            return
 
-        # Determine the system prompt to use for this channel
-        custom_prompt = database.get_channel_prompt(conversation_id)
-        system_prompt_content = custom_prompt if custom_prompt else config.DEFAULT_SYSTEM_PROMPT
-        system_message = {"role": "system", "content": system_prompt_content}
+        # Check if Mistral client is available (created on the first mention)
+        mistral_client = await self.get_mistral_client()
+        if not mistral_client:
+            logging.warning("Mistral client not available. Cannot process AI request.")
+            # Maybe send a message indicating AI is offline?
+            # await message.channel.send("My apologies, my connection to the digital ether seems disrupted. I cannot process this request right now.")
+            return
 
-        api_messages = [system_message] + formatted_history
+        # Save user message to DB
+        await self.bot.storage.save_message(conversation_id, "user", user_input, username=sanitized_user_name, guild_id=guild_id)
 
-        # Call Mistral AI API
+        # Call Mistral AI API on the stored history and this channel's prompt
         try:
-            start_time = time.time()
-            chat_response = await self.mistral_client.chat.complete_async(
-                 model="mistral-large-latest", # Or your preferred model
-                 messages=api_messages,
-            )
-
-            if chat_response.choices:
-                ai_response = chat_response.choices[0].message.content
-                end_time = time.time()
-                logging.info(f"Mistral API call successful. Time taken: {end_time - start_time:.2f}s")
+            ai_response = await conversation.generate_reply(self.bot.storage, mistral_client, conversation_id, guild_id)
 
+            if ai_response is not None:
                 # Save AI response
-                database.save_message(conversation_id, "assistant", ai_response)
+                await self.bot.storage.save_message(conversation_id, "assistant", ai_response, guild_id=guild_id)
 
-                # Send AI response to Discord
-                await message.channel.send(ai_response)
+                # Send AI response to Discord (split into chunks if it is too long for one message)
+                await self.bot.delivery.send(message.channel, ai_response)
             else:
-                logging.warning("Mistral API returned no choices.")
-                await message.channel.send("I pondered your words but couldn't quite form a response.")
+                await self.bot.delivery.send(message.channel, conversation.NO_CHOICES_REPLY)
 
         except Exception as e:
-            logging.exception(f"Error during Mistral API call or processing: {e}")
-            await message.channel.send("Forgive me, a fleeting disturbance in the æther has scrambled my thoughts. Could you try again?")
+            logging.exception("Error during Mistral API call or processing: %s", e)
+            await self.bot.delivery.send(message.channel, conversation.ERROR_REPLY)
+
+    # --- Gateway Mode Delivery ---
+
+    async def deliver_responses(self):
+        """Sends replies the AI workers left in the job queue, in order per channel, until cancelled.
+
+        Each channel's replies are sent by a task of their own while this loop keeps claiming, so
+        a channel waiting on its rate limit holds up nobody else. Channels with a task still in
+        flight are left out of claims until it finishes, which keeps their replies in order.
+        """
+        await self.bot.wait_until_ready()
+        queue = self.bot.job_queue
+        owner = f"gateway@{os.getpid()}"
+        last_purge = 0.0
+        while True:
+            try:
+                jobs = await asyncio.to_thread(queue.claim_responses, owner, skip_channels=tuple(self._channel_deliveries))
+                if time.monotonic() - last_purge > PURGE_INTERVAL:
+                    last_purge = time.monotonic()
+                    await asyncio.to_thread(queue.purge, config.JOB_RETENTION_SECONDS)
+            except Exception as e:
+                logging.exception(f"Error polling the job queue: {e}")
+                jobs = []
+            if not jobs:
+                await asyncio.sleep(config.JOB_POLL_INTERVAL)
+                continue
+
+            by_channel = {}
+            for job in jobs:
+                by_channel.setdefault(job.channel_id, []).append(job)
+            for channel_id, channel_jobs in by_channel.items():
+                task = asyncio.create_task(self._deliver_channel(channel_jobs, owner), name=f"deliver-{channel_id}")
+                self._channel_deliveries[channel_id] = task
+                task.add_done_callback(lambda task, channel_id=channel_id: self._delivery_done(channel_id, task))
+
+    def _delivery_done(self, channel_id, task):
+        del self._channel_deliveries[channel_id]
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Error delivering replies to channel {channel_id}: {task.exception()}")
+
+    async def _deliver_channel(self, jobs, owner):
+        queue = self.bot.job_queue
+        # Sending needs only the channel ID, not a cached channel
+        channel = self.bot.get_partial_messageable(int(jobs[0].channel_id))
+        for index, job in enumerate(jobs):
+            logging_setup.set_correlation_id(job.message_id)
+            try:
+                await self.bot.delivery.send(channel, job.response)
+            except Exception as e:
+                logging.error("Failed to send reply for job %s: %s", job.message_id, e)
+                # Put back this reply and the ones queued behind it so the channel stays in order
+                for unsent in jobs[index:]:
+                    await asyncio.to_thread(queue.release_response, unsent.message_id, owner)
+                return
+            await asyncio.to_thread(queue.ack_response, job.message_id, owner)
 
 # This setup function is required for the cog to be loaded by the bot
 async def setup(bot: commands.Bot):
-    await bot.add_cog(AIHandler(bot))
\ No newline at end of file
+    await bot.add_cog(AIHandler(bot))
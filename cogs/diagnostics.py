@@ -0,0 +1,87 @@
+# cogs/diagnostics.py
+import asyncio
+import io
+import logging
+import threading
+import discord
+from discord.ext import commands
+import diagnostics # Import our diagnostics module
+
+MAX_PROFILE_SECONDS = 120
+
+class Diagnostics(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.lag_monitor = diagnostics.LoopLagMonitor()
+        self._profiling = False
+
+    async def cog_load(self):
+        self.lag_monitor.start()
+
+    async def cog_unload(self):
+        self.lag_monitor.stop()
+
+    @commands.command(name='profile')
+    @commands.is_owner()
+    async def profile(self, ctx: commands.Context, seconds: int = 10):
+        """Samples the running event loop for N seconds and reports the busiest functions (bot owner only)."""
+        if self._profiling:
+            await ctx.send("A profile is already running. Patience, please.")
+            return
+        seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+
+        self._profiling = True
+        try:
+            await ctx.send(f"Profiling the event loop for {seconds}s...")
+            profiler = diagnostics.SamplingProfiler(threading.get_ident())
+            await asyncio.to_thread(profiler.run, seconds)
+        finally:
+            self._profiling = False
+
+        report = profiler.report()
+        logging.info(f"Profile requested by {ctx.author} ({seconds}s, {profiler.samples} samples).")
+        if len(report) <= 1900:
+            await ctx.send(f"```\n{report}\n```")
+        else:
+            await ctx.send("Profile complete.", file=discord.File(io.BytesIO(report.encode()), filename="profile.txt"))
+
+    @commands.command(name='stats')
+    @commands.is_owner()
+    async def stats(self, ctx: commands.Context):
+        """Shows per-shard latency and event rates, event-loop lag, context cache hits and reply delivery metrics (bot owner only)."""
+        lag = self.lag_monitor.stats()
+        lines = [f"Loop lag: last {lag['last'] * 1000:.1f}ms, avg {lag['avg'] * 1000:.1f}ms, max {lag['max'] * 1000:.1f}ms, stalls {lag['stalls']}"]
+        for shard in self.bot.shard_metrics.snapshot():
+            lines.append(
+                f"Shard {shard['shard_id']}: latency {shard['latency'] * 1000:.0f}ms, {shard['events_per_sec']:.1f} events/s "
+                f"({shard['events']} total), {shard['guilds']} guilds, {shard['disconnects']} disconnects, {shard['resumes']} resumes"
+            )
+        cache = self.bot.storage.cache_stats()
+        lookups = cache["hits"] + cache["misses"]
+        lines.append(
+            f"Context cache: {cache['conversations']} conversations, "
+            f"{cache['hits'] / lookups * 100 if lookups else 0:.0f}% hits ({lookups} lookups)"
+        )
+        sends = self.bot.delivery.metrics.snapshot()
+        lines.append(
+            f"Delivery: {sends['replies']} replies in {sends['chunks']} messages, send latency avg {sends['latency_avg'] * 1000:.0f}ms "
+            f"p95 {sends['latency_p95'] * 1000:.0f}ms, {sends['retries']} retries, {sends['failures']} failures, "
+            f"{sends['throttled']} throttled ({sends['throttled_seconds']:.1f}s waiting)"
+        )
+        await ctx.send("\n".join(lines)[:2000])
+
+    @profile.error
+    @stats.error
+    async def owner_command_error(self, ctx: commands.Context, error):
+        if isinstance(error, commands.NotOwner):
+            await ctx.send("My apologies, only the bot owner may peer into my inner workings.")
+        elif isinstance(error, commands.BadArgument):
+            await ctx.send("Please give the profiling duration as a whole number of seconds.")
+        else:
+            logging.error(f"Unhandled error in {ctx.command} command: {error}")
+            await ctx.send("I encountered an issue running that command. Please check the logs.")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Diagnostics(bot))
+    logging.info("Diagnostics Cog loaded.")
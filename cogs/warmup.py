@@ -0,0 +1,89 @@
+# cogs/warmup.py
+import asyncio
+import logging
+import math
+import time
+from discord.ext import commands
+import config  # Import our config module
+
+class Warmup(commands.Cog):
+    """Preloads the most recently active conversations after connecting and resuming.
+
+    The first mention in a channel after a (re)start otherwise pays for cold database pages,
+    dictionary loads and an empty context cache. Warm-up reads history and prompts for the
+    WARMUP_CHANNELS most recently active conversations, at most WARMUP_RATE per second so
+    it never competes with live traffic for the reader pool. Only channels this process can
+    see are warmed (with SHARD_IDS, other processes serve the rest), and gateway processes
+    skip it entirely: their AI workers assemble context, not the gateway.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._task = None
+        self.last_run = None # (conversations warmed, seconds taken) of the last completed run
+
+    async def cog_unload(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def schedule(self, reason):
+        """Starts a warm-up run unless one is already in progress."""
+        if config.WARMUP_CHANNELS <= 0 or self.bot.job_queue is not None: # Gateway mode: nothing here reads context
+            return
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self.run(reason), name="warmup")
+
+    def _candidates(self):
+        """Returns how many ranked conversations to consider, allowing for those on other processes' shards."""
+        shard_ids = getattr(self.bot, "shard_ids", None)
+        if shard_ids and self.bot.shard_count:
+            return math.ceil(config.WARMUP_CHANNELS * self.bot.shard_count / len(shard_ids))
+        return config.WARMUP_CHANNELS
+
+    def _visible(self, conversation_id):
+        """Returns True if the conversation's channel is in this process's cache."""
+        try:
+            return self.bot.get_channel(int(conversation_id)) is not None
+        except ValueError:
+            return False
+
+    async def run(self, reason):
+        """Warms the most recently active conversations, pacing reads to WARMUP_RATE per second."""
+        started = time.perf_counter()
+        interval = 1.0 / config.WARMUP_RATE if config.WARMUP_RATE > 0 else 0.0
+        warmed = 0
+        try:
+            ranked = await self.bot.storage.rank_active_conversations(self._candidates())
+            for conversation_id, guild_id in ranked:
+                if warmed >= config.WARMUP_CHANNELS:
+                    break
+                if not self._visible(conversation_id):
+                    continue
+                await self.bot.storage.warm(conversation_id, guild_id=guild_id)
+                warmed += 1
+                if interval:
+                    await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.exception(f"Error warming conversations: {e}")
+        self.last_run = (warmed, time.perf_counter() - started)
+        logging.info(f"Warmed {warmed} recently active conversations after {reason} in {self.last_run[1]:.2f}s.")
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.schedule("connect")
+
+    @commands.Cog.listener()
+    async def on_resumed(self):
+        self.schedule("resume")
+
+    @commands.Cog.listener()
+    async def on_shard_resumed(self, shard_id):
+        self.schedule(f"shard {shard_id} resume")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Warmup(bot))
+    logging.info("Warmup Cog loaded.")
@@ -1,9 +1,8 @@
 import os
 import logging
-from dotenv import load_dotenv
 
-# --- Load Environment Variables ---
-load_dotenv()
+# Importing this module is cheap and side-effect free: settings are read from the process
+# environment as-is. The entry point calls load() once to pull in `.env` and validate secrets.
 
 # --- Constants ---
 HISTORY_LIMIT = 10
@@ -18,13 +17,103 @@ DEFAULT_SYSTEM_PROMPT = (
     "Address the user by name when appropriate, but vary your responses naturally. Do not mention being an AI or a bot."
 )
 
+def _env_flag(name, default='0'):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+# --- Environment-Driven Settings ---
+def _read_env():
+    """(Re)reads every environment-driven setting into this module's globals."""
+    global DISCORD_TOKEN, MISTRAL_API_KEY
+    global DB_PARTITION_MODE, DB_PARTITION_DIR, DB_MAX_OPEN_PARTITIONS, DB_READ_POOL_SIZE
+    global DB_COMPRESSION, DB_COMPRESSION_THRESHOLD, DB_COMPRESS_EXISTING, DB_DELETE_BATCH_SIZE
+    global CONTEXT_CACHE_SIZE, WARMUP_CHANNELS, WARMUP_RATE
+    global SEND_CHANNEL_RATE, SEND_CHANNEL_PERIOD, SEND_GLOBAL_RATE, SEND_MAX_RETRIES
+    global LOG_LEVEL, LOG_JSON
+    global EVENT_LOOP, DEFAULT_EXECUTOR_WORKERS, MEMORY_PROFILE
+    global SHARDING, SHARD_COUNT, SHARD_IDS
+    global LOOP_LAG_INTERVAL, LOOP_LAG_WARN_THRESHOLD, LOOP_STALL_THRESHOLD, ASYNCIO_DEBUG
+    global DEPLOYMENT_MODE, JOB_QUEUE_FILE, AI_WORKERS, AI_WORKER_CONCURRENCY
+    global JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL, JOB_RETENTION_SECONDS
+
+    # Secrets
+    DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
+    MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY')
+
+    # Storage partitioning: 'single' keeps every conversation in DB_FILE,
+    # 'guild' routes each guild's conversations to its own file in DB_PARTITION_DIR.
+    # DMs (no guild) always stay in DB_FILE.
+    DB_PARTITION_MODE = os.getenv('DB_PARTITION_MODE', 'single').lower()
+    DB_PARTITION_DIR = os.getenv('DB_PARTITION_DIR', 'history_partitions')
+    DB_MAX_OPEN_PARTITIONS = int(os.getenv('DB_MAX_OPEN_PARTITIONS', '32')) # Upper bound on pooled partition handles
+    DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', '4')) # Read-only connections serving history/prompt lookups in parallel
+    # Message compression: 'auto' (zstd when installed, else zlib), 'zstd', 'zlib' or 'off'.
+    # Content shorter than DB_COMPRESSION_THRESHOLD characters is always stored as plain text.
+    DB_COMPRESSION = os.getenv('DB_COMPRESSION', 'auto').lower()
+    DB_COMPRESSION_THRESHOLD = int(os.getenv('DB_COMPRESSION_THRESHOLD', '512'))
+    DB_COMPRESS_EXISTING = _env_flag('DB_COMPRESS_EXISTING', '1') # Compress older plain rows in the background after startup
+    DB_DELETE_BATCH_SIZE = int(os.getenv('DB_DELETE_BATCH_SIZE', '2000')) # Rows per transaction when clearing history
+    # Context cache: recent history and prompts of this many conversations stay in memory
+    CONTEXT_CACHE_SIZE = int(os.getenv('CONTEXT_CACHE_SIZE', '1000'))
+    # Warm-up after connecting and resuming: preload the most recently active conversations, at most WARMUP_RATE per second
+    WARMUP_CHANNELS = int(os.getenv('WARMUP_CHANNELS', '200')) # 0 disables warm-up
+    WARMUP_RATE = float(os.getenv('WARMUP_RATE', '50'))
+    # Reply delivery: sends allowed per channel per period and per second overall (0 = unlimited), and retries of failed sends
+    SEND_CHANNEL_RATE = int(os.getenv('SEND_CHANNEL_RATE', '5'))
+    SEND_CHANNEL_PERIOD = float(os.getenv('SEND_CHANNEL_PERIOD', '5'))
+    SEND_GLOBAL_RATE = int(os.getenv('SEND_GLOBAL_RATE', '50'))
+    SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '3'))
+
+    # Logging: LOG_JSON=1 emits one JSON object per line instead of plain text
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_JSON = _env_flag('LOG_JSON')
+
+    # Runtime: EVENT_LOOP is 'auto' (uvloop if installed), 'uvloop' or 'asyncio'
+    EVENT_LOOP = os.getenv('EVENT_LOOP', 'auto').lower()
+    DEFAULT_EXECUTOR_WORKERS = int(os.getenv('DEFAULT_EXECUTOR_WORKERS', '8')) # Threads behind asyncio.to_thread (admin DB jobs, migrations)
+    # Gateway memory: 'default' caches members and messages, 'minimal' only what the cogs need
+    MEMORY_PROFILE = os.getenv('MEMORY_PROFILE', 'default').lower()
+    # Sharding: SHARDING=1 runs an AutoShardedBot. SHARD_COUNT is the total across all processes
+    # (unset = Discord's recommendation); SHARD_IDS (e.g. '0-3' or '0,2') picks this process's shards.
+    SHARDING = _env_flag('SHARDING')
+    SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+    SHARD_IDS = os.getenv('SHARD_IDS', '')
+
+    # Diagnostics: event-loop lag probe interval and thresholds (seconds)
+    LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+    LOOP_LAG_WARN_THRESHOLD = float(os.getenv('LOOP_LAG_WARN_THRESHOLD', '0.1'))
+    LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', '0.5')) # Blocked this long -> log the loop thread's stack
+    ASYNCIO_DEBUG = _env_flag('ASYNCIO_DEBUG') # Also enable asyncio's slow-callback logging
+
+    # Deployment: 'combined' answers mentions inside the bot process; 'gateway' only queues them
+    # in JOB_QUEUE_FILE for AI worker processes (see worker.py), which send replies back the same way.
+    DEPLOYMENT_MODE = os.getenv('DEPLOYMENT_MODE', 'combined').lower()
+    JOB_QUEUE_FILE = os.getenv('JOB_QUEUE_FILE', 'jobs.db')
+    AI_WORKERS = int(os.getenv('AI_WORKERS', '2')) # Worker processes the gateway spawns (0 = started separately with `python worker.py`)
+    AI_WORKER_CONCURRENCY = int(os.getenv('AI_WORKER_CONCURRENCY', '8')) # Jobs each worker processes at once
+    JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '120')) # A job not finished within this is handed to another worker
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '0.1')) # Idle wait between queue polls
+    JOB_RETENTION_SECONDS = float(os.getenv('JOB_RETENTION_SECONDS', '3600')) # Finished jobs are kept this long for dedup
+
+_read_env()
+
 # --- Environment Variable Loading and Validation ---
-DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
-MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY')
-
-if not DISCORD_TOKEN:
-    logging.error("DISCORD_TOKEN not found in .env file.")
-    # Consider raising an exception or exiting differently depending on desired behavior
-    exit()
-if not MISTRAL_API_KEY:
-    logging.warning("MISTRAL_API_KEY not found in .env file. Bot will run but AI features will be disabled.")
+def load(require_discord_token=True):
+    """Loads `.env` into the environment, refreshes all settings and validates secrets.
+
+    Called once by each entry point before anything is built from settings. AI workers pass
+    require_discord_token=False: they never talk to Discord.
+    """
+    from dotenv import load_dotenv # Deferred: only the entry point needs it
+    load_dotenv()
+    _read_env()
+    validate(require_discord_token)
+
+def validate(require_discord_token=True):
+    """Exits if DISCORD_TOKEN is missing (when required); warns if MISTRAL_API_KEY is missing."""
+    if require_discord_token and not DISCORD_TOKEN:
+        logging.error("DISCORD_TOKEN not found in .env file.")
+        # Consider raising an exception or exiting differently depending on desired behavior
+        exit()
+    if not MISTRAL_API_KEY:
+        logging.warning("MISTRAL_API_KEY not found in .env file. Bot will run but AI features will be disabled.")
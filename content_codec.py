@@ -0,0 +1,163 @@
+import hashlib
+import logging
+from functools import lru_cache
+import threading
+import zlib
+
+try:
+    import zstandard # Optional: pip install '.[speed]'
+except ImportError:
+    zstandard = None
+
+# --- Message Content Compression ---
+# Long message content is stored compressed against a built-in dictionary: generic chat and
+# markdown text shipped with the bot, never anything users wrote, so clearing a conversation
+# leaves none of its text behind in a dictionary. Each row records its format (and dictionary)
+# so plain, zlib and zstd rows can coexist in one file and be decoded independently.
+
+FORMAT_PLAIN = 0
+FORMAT_ZLIB = 1
+FORMAT_ZSTD = 2
+
+CODEC_AUTO = "auto"
+CODEC_OFF = "off"
+CODEC_FORMATS = {"zlib": FORMAT_ZLIB, "zstd": FORMAT_ZSTD}
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+ZLIB_DICT_SIZE = 32 * 1024 # zlib's window: dictionary bytes beyond this are never referenced
+
+# Phrases and markup that long replies are made of. zlib matches text near the end of its
+# dictionary most cheaply, so the most common pieces come last. Changing this text creates
+# new dictionary IDs; rows written against the old text keep decoding from their file.
+BUILTIN_CORPUS = "\n".join([
+    "Traceback (most recent call last):",
+    '  File "main.py", line 1, in <module>',
+    "TypeError: ValueError: KeyError: AttributeError: ImportError: ModuleNotFoundError: SyntaxError: IndexError:",
+    "SELECT * FROM users WHERE id = ? ORDER BY created_at DESC LIMIT 10;",
+    "const result = await fetch(url, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(data) });",
+    "function handleClick(event) { event.preventDefault(); console.log(event.target.value); }",
+    "public static void main(String[] args) { System.out.println(\"Hello, world!\"); }",
+    "#include <stdio.h>\nint main(void) {\n    printf(\"%d\\n\", value);\n    return 0;\n}",
+    "```javascript\n```bash\n$ pip install -r requirements.txt\n$ npm install\n$ git commit -m \"\"\n```",
+    "```python\nimport os\nimport sys\nimport json\nfrom typing import List, Optional\n\n"
+    "class Example:\n    def __init__(self, name):\n        self.name = name\n\n"
+    "def main():\n    for i in range(10):\n        if i % 2 == 0:\n            print(f\"{i} is even\")\n"
+    "        else:\n            continue\n    return None\n\n"
+    "if __name__ == \"__main__\":\n    main()\n```",
+    "| Name | Description | Example |\n|------|-------------|---------|\n| | | |",
+    "In summary, the main advantages and disadvantages are the following:",
+    "On the other hand, it is also important to consider the context, the history and the people involved.",
+    "For example, for instance, in other words, that is to say, as a result, in addition, however, therefore, "
+    "furthermore, moreover, nevertheless, meanwhile, similarly, in contrast, in fact, of course, in general.",
+    "There are several factors to consider, including the cost, the time involved, your experience and your goals.",
+    "It depends on what you are trying to achieve, but generally speaking the best approach is to start small.",
+    "This is a great question, and the answer is a little more nuanced than it might seem at first.",
+    "Here is a step-by-step explanation of how it works, along with an example you can try yourself:",
+    "The short answer is yes, but there are a few important exceptions worth knowing about.",
+    "That sounds really difficult, and it makes sense that you would feel that way.",
+    "It's completely normal to feel unsure about something like this.",
+    "I understand how you feel. Would you like to talk about what happened?",
+    "Thank you for sharing that with me. How are you feeling about it now?",
+    "I'm sorry to hear that. Is there anything I can do to help?",
+    "I'm not sure I understand what you mean. Could you clarify or give me a bit more detail?",
+    "As an AI, I don't have personal experiences, but I can tell you what people often say about it.",
+    "Let me know if you have any other questions, or if there is anything else I can help you with!",
+    "I hope this helps! Feel free to ask if you need more information or want me to explain anything in more detail.",
+    "Sure! Here's a quick overview of the key points:",
+    "Here are a few suggestions:\n\n1. **First**, \n2. **Second**, \n3. **Third**, \n4. **Finally**, ",
+    "### Summary\n\n### Example\n\n### Explanation\n\n### Conclusion\n\n## Overview\n\n**Note:** ",
+    "- **Pros:** \n- **Cons:** \n- **Tip:** \n- **Important:** \n\n* \n> ",
+    "the people who are there that this with would have what which when where because about "
+    "their they them your you you're it's there's that's I'm don't can't won't isn't doesn't "
+    "should could might really just also very much more most some other only than then "
+    "into through after before between during without within something anything everything ",
+    "Great question! Here's what you need to know: ",
+    "Of course! Let me explain. ",
+])
+
+class CodecError(ValueError):
+    """A stored value could not be decoded."""
+
+def resolve_format(codec):
+    """Maps a DB_COMPRESSION setting to the format new rows are written in (None = compression off)."""
+    codec = (codec or CODEC_AUTO).lower()
+    if codec == CODEC_OFF:
+        return None
+    if codec == CODEC_AUTO:
+        return FORMAT_ZSTD if zstandard is not None else FORMAT_ZLIB
+    if codec not in CODEC_FORMATS:
+        logging.warning(f"Unknown DB_COMPRESSION '{codec}'; using '{CODEC_AUTO}'.")
+        return resolve_format(CODEC_AUTO)
+    if CODEC_FORMATS[codec] == FORMAT_ZSTD and zstandard is None:
+        logging.warning("DB_COMPRESSION=zstd but the 'zstandard' package is not installed; using zlib.")
+        return FORMAT_ZLIB
+    return CODEC_FORMATS[codec]
+
+def dictionary_id(fmt, data):
+    """Content-derived dictionary ID, so the same dictionary has the same ID in every database file."""
+    digest = hashlib.sha256(bytes([fmt]) + data).digest()
+    return int.from_bytes(digest[:8], "big") >> 1 # Fits SQLite's signed 64-bit INTEGER
+
+class Dictionary:
+    """A compression dictionary plus per-thread (de)compressor objects built from it."""
+
+    def __init__(self, fmt, data, dict_id=None):
+        self.format = fmt
+        self.data = data
+        self.id = dict_id if dict_id is not None else dictionary_id(fmt, data)
+        self._local = threading.local() # zstd (de)compressors must not be shared between threads
+
+    def _zstd(self):
+        local = self._local
+        if not hasattr(local, "compressor"):
+            dict_data = zstandard.ZstdCompressionDict(self.data)
+            local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+            local.decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        return local.compressor, local.decompressor
+
+@lru_cache(maxsize=None)
+def builtin_dictionary(fmt):
+    """Returns the dictionary new rows of the given format are compressed against."""
+    data = BUILTIN_CORPUS.encode("utf-8")[-ZLIB_DICT_SIZE:]
+    return Dictionary(fmt, data)
+
+def builtin_dictionary_ids():
+    """IDs of the built-in dictionaries of every format."""
+    return {builtin_dictionary(fmt).id for fmt in CODEC_FORMATS.values()}
+
+def compress(text, fmt, dictionary=None):
+    """Compresses text to bytes in the given format."""
+    raw = text.encode("utf-8")
+    if fmt == FORMAT_ZSTD:
+        if dictionary is not None:
+            return dictionary._zstd()[0].compress(raw)
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if dictionary is not None:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary.data)
+    else:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS) # Raw deflate: no header/checksum bytes
+    return compressor.compress(raw) + compressor.flush()
+
+def decompress(blob, fmt, dictionary=None):
+    """Decodes a stored value back to text. Raises CodecError if it cannot be decoded."""
+    if fmt == FORMAT_PLAIN:
+        return blob
+    try:
+        if fmt == FORMAT_ZSTD:
+            if zstandard is None:
+                raise CodecError("This database contains zstd-compressed messages; install the 'zstandard' package.")
+            if dictionary is not None:
+                return dictionary._zstd()[1].decompress(blob).decode("utf-8")
+            return zstandard.ZstdDecompressor().decompress(blob).decode("utf-8")
+        if fmt != FORMAT_ZLIB:
+            raise CodecError(f"Unknown content format {fmt}.")
+        if dictionary is not None:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=dictionary.data)
+        else:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return (decompressor.decompress(blob) + decompressor.flush()).decode("utf-8")
+    except CodecError:
+        raise
+    except Exception as e: # zlib.error, zstandard.ZstdError, UnicodeDecodeError
+        raise CodecError(f"Could not decode stored content: {e}") from e
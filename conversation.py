@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from functools import lru_cache
+import config # Import our config module
+
+# --- Conversation Pipeline ---
+# Context assembly and the model call for one mention, shared by the in-process AIHandler
+# (DEPLOYMENT_MODE=combined) and the AI worker processes (DEPLOYMENT_MODE=gateway).
+
+MODEL = "mistral-large-latest" # Or your preferred model
+
+NO_CHOICES_REPLY = "I pondered your words but couldn't quite form a response."
+ERROR_REPLY = "Forgive me, a fleeting disturbance in the æther has scrambled my thoughts. Could you try again?"
+
+def create_mistral_client():
+    """Initializes the Mistral client, or returns None when no key is configured or setup fails."""
+    if config.MISTRAL_API_KEY:
+        try:
+            from mistralai import Mistral # Deferred heavy import: only needed once the first mention arrives
+            client = Mistral(api_key=config.MISTRAL_API_KEY)
+            # Optionally, perform a simple test call here if desired
+            logging.info("Mistral AI client initialized successfully.")
+            return client
+        except Exception as e:
+            logging.error(f"Failed to initialize Mistral AI client: {e}")
+            return None
+    else:
+        logging.warning("Mistral API key not found. AI features will be disabled.")
+        return None
+
+@lru_cache(maxsize=4096) # Mentions mostly come from the same few authors
+def sanitize_username(user_name):
+    """Makes a display name valid for the API's 'name' field (^[a-zA-Z0-9_-]{1,64}$)."""
+    sanitized_user_name = re.sub(r'[^a-zA-Z0-9_-]', '_', user_name or '')
+    if not sanitized_user_name: # Handle empty names after sanitization
+        sanitized_user_name = "user"
+    return sanitized_user_name[:64] # Enforce max length
+
+def format_message_for_api(msg: dict) -> dict:
+    """Formats one database history row into a dictionary for the API."""
+    # Map db roles ('user', 'assistant') to API roles if needed
+    # (Assuming they are already compatible based on previous code)
+    role = msg.get('role', 'user') # Default to user if role is missing? Adjust as needed.
+    content = msg.get('content', '')
+    # Add name field only if role is 'user' and username exists
+    name = msg.get('username') if role == 'user' else None
+
+    # Create dictionary, including name only when appropriate
+    if name:
+        return {"role": role, "content": content, "name": name}
+    return {"role": role, "content": content}
+
+def format_history_for_api(history: list[dict]) -> list[dict]:
+    """Formats the database history into dictionaries for the API."""
+    return [format_message_for_api(msg) for msg in history]
+
+class PreparedContext:
+    """A conversation's API messages, formatted once and then kept current incrementally.
+
+    Storage attaches it to the conversation's cache entry: every saved message is formatted
+    once and appended (the oldest falls off past HISTORY_LIMIT), and a clear or prompt change
+    simply drops it. Messages handed to the API are shared between calls; treat them as read-only.
+    """
+
+    __slots__ = ("system_message", "messages")
+
+    def __init__(self, history, custom_prompt, depth=None):
+        # Determine the system prompt to use for this channel
+        system_prompt_content = custom_prompt if custom_prompt else config.DEFAULT_SYSTEM_PROMPT
+        self.system_message = {"role": "system", "content": system_prompt_content}
+        self.messages = deque(map(format_message_for_api, history), maxlen=depth or config.HISTORY_LIMIT)
+
+    def append(self, row):
+        self.messages.append(format_message_for_api(row))
+
+    def api_messages(self):
+        return [self.system_message, *self.messages]
+
+async def build_api_messages(storage, conversation_id, guild_id=None):
+    """Returns the system prompt plus recent history for a conversation, ready for the API."""
+    context = await storage.get_context(conversation_id, guild_id=guild_id)
+    if context is None:
+        generation = storage.generation(conversation_id, guild_id=guild_id)
+        # Retrieve history and this channel's prompt in parallel (the history read sees any save already submitted)
+        history, custom_prompt = await asyncio.gather(
+            storage.get_history(conversation_id, limit=config.HISTORY_LIMIT, guild_id=guild_id),
+            storage.get_channel_prompt(conversation_id, guild_id=guild_id),
+        )
+        context = PreparedContext(history, custom_prompt)
+        storage.set_context(conversation_id, context, generation, guild_id=guild_id)
+    return context.api_messages()
+
+async def generate_reply(storage, mistral_client, conversation_id, guild_id=None):
+    """Calls the model on the conversation's current context.
+
+    Returns the reply text, or None when the model returns no choices. API errors propagate
+    to the caller. The reply is not saved; callers save it once it is committed to being sent.
+    """
+    api_messages = await build_api_messages(storage, conversation_id, guild_id)
+    start_time = time.time()
+    chat_response = await mistral_client.chat.complete_async(model=MODEL, messages=api_messages)
+    if not chat_response.choices:
+        logging.warning("Mistral API returned no choices.")
+        return None
+    logging.info("Mistral API call successful. Time taken: %.2fs", time.time() - start_time)
+    return chat_response.choices[0].message.content
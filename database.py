@@ -1,6 +1,184 @@
+import os
 import sqlite3
 import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 import config # Import our config module
+import content_codec
+
+# --- Partition Routing ---
+
+PARTITION_MODE_SINGLE = "single"
+PARTITION_MODE_GUILD = "guild"
+
+class ConnectionPool:
+    """A bounded, least-recently-used pool of open SQLite connections keyed by database path.
+
+    Evicted connections are closed, so at most `max_size` file handles stay open at once.
+    """
+
+    def __init__(self, max_size, factory):
+        self.max_size = max(1, max_size)
+        self.factory = factory
+        self._connections = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Returns the open connection for `path`, opening (and possibly evicting) as needed."""
+        with self._lock:
+            db_conn = self._connections.get(path)
+            if db_conn is not None:
+                self._connections.move_to_end(path)
+                return db_conn
+
+            db_conn = self.factory(path)
+            self._connections[path] = db_conn
+            while len(self._connections) > self.max_size:
+                _, evicted = self._connections.popitem(last=False)
+                evicted.close()
+            return db_conn
+
+    def __contains__(self, path):
+        return path in self._connections
+
+    def __len__(self):
+        return len(self._connections)
+
+    def close_all(self):
+        """Closes every pooled connection."""
+        with self._lock:
+            while self._connections:
+                _, db_conn = self._connections.popitem(last=False)
+                db_conn.close()
+
+def partition_path(guild_id):
+    """Returns the database file that holds conversations for `guild_id` in guild partition mode."""
+    return os.path.join(config.DB_PARTITION_DIR, f"guild_{guild_id}.db")
+
+def get_db_path(guild_id=None):
+    """Returns the database file a conversation in `guild_id` is routed to under the current partition mode."""
+    if config.DB_PARTITION_MODE == PARTITION_MODE_GUILD and guild_id is not None:
+        return partition_path(guild_id)
+    return config.DB_FILE
+
+_ADDED_COLUMNS = [("content_format", "INTEGER NOT NULL DEFAULT 0"), ("dict_id", "INTEGER")]
+_upgrade_lock = threading.Lock() # Serializes first-time schema setup of files opened read-only
+
+def _create_tables(cursor):
+    """Creates the schema on the given cursor if it doesn't exist yet."""
+    # Create messages table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            role TEXT NOT NULL, -- 'user' or 'assistant'
+            content TEXT NOT NULL,
+            username TEXT, -- Store the display name for user messages
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            content_format INTEGER NOT NULL DEFAULT 0, -- 0 = plain text; otherwise `content` holds a compressed BLOB (see content_codec)
+            dict_id INTEGER -- compression_dicts.id the content was compressed against, if any
+        )
+    ''')
+
+    # Create channel_prompts table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS channel_prompts (
+        conversation_id TEXT PRIMARY KEY,
+        system_prompt TEXT NOT NULL
+    )
+    ''')
+
+    # Compression dictionaries referenced by messages.dict_id (IDs are content hashes, see content_codec)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS compression_dicts (
+        id INTEGER PRIMARY KEY,
+        format INTEGER NOT NULL,
+        data BLOB NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # Progress of background maintenance passes (e.g. compressing existing rows)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS maintenance_state (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    ''')
+
+    # History lookups read one conversation's newest rows; without this they scan the whole table
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, timestamp)")
+
+    # Columns added after the first release, for files created before them
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(messages)").fetchall()}
+    for column, definition in _ADDED_COLUMNS:
+        if column not in columns:
+            try:
+                cursor.execute(f"ALTER TABLE messages ADD COLUMN {column} {definition}")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e): # Another process upgraded the file first
+                    raise
+
+def _schema_is_current(path):
+    """Returns True if the file exists and already has the current schema."""
+    if not os.path.exists(path):
+        return False
+    db_conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        columns = {row[1] for row in db_conn.execute("PRAGMA table_info(messages)").fetchall()}
+        return "dict_id" in columns
+    finally:
+        db_conn.close()
+
+def open_connection(path, read_only=False):
+    """Opens a long-lived connection to `path` for pooled use, creating the file and schema on first use.
+
+    Writable connections switch the file to WAL journaling so readers never block the writer.
+    Read-only connections can be shared across threads but never modify the file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if read_only:
+        # Reader threads can race to open the same file first (history and prompt are read in parallel)
+        with _upgrade_lock:
+            if not _schema_is_current(path):
+                open_connection(path).close() # Create or upgrade the file and schema before opening read-only
+        db_conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        db_conn = sqlite3.connect(path, check_same_thread=False)
+        db_conn.execute("PRAGMA journal_mode=WAL")
+        db_conn.execute("PRAGMA synchronous=NORMAL") # Safe with WAL; commits no longer fsync the main file
+        _create_tables(db_conn.cursor())
+        db_conn.commit()
+    db_conn.row_factory = sqlite3.Row
+    return db_conn
+
+_partition_pool = None # Created on first use so DB_MAX_OPEN_PARTITIONS is read after config.load()
+
+def _get_partition_pool():
+    global _partition_pool
+    if _partition_pool is None:
+        _partition_pool = ConnectionPool(config.DB_MAX_OPEN_PARTITIONS, open_connection)
+    return _partition_pool
+
+def close_partition_pool():
+    """Closes all pooled partition connections (used on shutdown and by tests)."""
+    if _partition_pool is not None:
+        _partition_pool.close_all()
+
+def _connection_for(conn, guild_id):
+    """Resolves the connection a database function should use.
+
+    Returns (connection, owned). Owned connections were created for this call and must be
+    closed by the caller; pooled partition connections and caller-provided ones must not.
+    """
+    if conn is not None:
+        return conn, False
+    if config.DB_PARTITION_MODE == PARTITION_MODE_GUILD:
+        return _get_partition_pool().get(get_db_path(guild_id)), False
+    return sqlite3.connect(config.DB_FILE), True
 
 # --- Database Setup and Functions ---
 
@@ -10,32 +188,18 @@ def init_db(conn=None):
     db_conn = conn or sqlite3.connect(config.DB_FILE)
     try:
         # No need for context manager if we handle closing explicitly for created connections
-        cursor = db_conn.cursor()
-
-        # Create messages table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                conversation_id TEXT NOT NULL,
-                role TEXT NOT NULL, -- 'user' or 'assistant'
-                content TEXT NOT NULL,
-                username TEXT, -- Store the display name for user messages
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Create channel_prompts table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS channel_prompts (
-            conversation_id TEXT PRIMARY KEY,
-            system_prompt TEXT NOT NULL
-        )
-        ''')
+        _create_tables(db_conn.cursor())
 
         # Commit changes if we created the connection
         # If conn was passed, the caller is responsible for commits/closing
         if not conn:
             db_conn.commit()
+            if config.DB_PARTITION_MODE == PARTITION_MODE_GUILD:
+                os.makedirs(config.DB_PARTITION_DIR, exist_ok=True)
+                # Bring existing partition files up to the current schema too
+                for guild_id, path in list_partitions()[1:]:
+                    if not _schema_is_current(path):
+                        open_connection(path).close()
         logging.info(f"Database '{config.DB_FILE}' initialized.")
 
     except sqlite3.Error as e:
@@ -45,75 +209,173 @@ def init_db(conn=None):
         if not conn and db_conn:
             db_conn.close()
 
-def save_message(conversation_id, role, content, username=None, conn=None):
-    """Saves a message to the database. Uses provided connection or creates new."""
-    db_conn = conn or sqlite3.connect(config.DB_FILE)
+def save_message(conversation_id, role, content, username=None, conn=None, guild_id=None):
+    """Saves a message to the database. Uses provided connection or creates new (routed by guild_id).
+
+    Returns True once the row is committed, False if the write failed (the error is logged).
+    """
+    saved = False
+    db_conn, owned = _connection_for(conn, guild_id)
     try:
         with db_conn as current_conn:
             cursor = current_conn.cursor()
+            stored, content_format, dict_id = _encode_content(current_conn, content)
             cursor.execute('''
-                INSERT INTO messages (conversation_id, role, content, username)
-                VALUES (?, ?, ?, ?)
-            ''', (conversation_id, role, content, username))
+                INSERT INTO messages (conversation_id, role, content, username, content_format, dict_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (conversation_id, role, stored, username, content_format, dict_id))
             current_conn.commit()
+        saved = True
     except sqlite3.Error as e:
         logging.error(f"Error saving message to database: {e}")
     finally:
-        if not conn and db_conn: # Only close if connection was created here
+        if owned: # Only close if connection was created here
             db_conn.close()
+    return saved
+
+def get_history(conversation_id, limit=config.HISTORY_LIMIT, conn=None, guild_id=None, strict=False):
+    """Retrieves the last 'limit' messages for a conversation. Uses provided connection or creates new (routed by guild_id).
 
-def get_history(conversation_id, limit=config.HISTORY_LIMIT, conn=None):
-    """Retrieves the last 'limit' messages for a conversation. Uses provided connection or creates new."""
+    Errors are logged and give an empty history, or are re-raised with `strict` (for callers that cache the result).
+    """
     messages = []
-    db_conn = conn or sqlite3.connect(config.DB_FILE)
-    connection_created = False # Flag to track if we need to close connection
+    db_conn, owned = _connection_for(conn, guild_id)
     try:
-        # Ensure connection is treated as context manager if created here
-        if not conn:
-            db_conn.row_factory = sqlite3.Row # Get dict-like rows
-            connection_created = True
+        # Get dict-like rows when the connection was created here
+        if owned:
+            db_conn.row_factory = sqlite3.Row
 
         cursor = db_conn.cursor()
 
+        # Fetch only the newest 'limit' rows, so only those are ever decompressed
         cursor.execute('''
-            SELECT role, content, username FROM messages
+            SELECT role, content, username, content_format, dict_id FROM messages
             WHERE conversation_id = ?
-            ORDER BY timestamp ASC
-        ''', (conversation_id,))
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        ''', (conversation_id, limit))
         rows = cursor.fetchall()
-        # Slice the last 'limit' rows from the results ordered chronologically
-        messages = [dict(row) for row in rows[-limit:]]
+        # Return them chronologically
+        messages = [
+            {"role": row[0], "content": _decode_content(db_conn, row[1], row[3], row[4]), "username": row[2]}
+            for row in reversed(rows)
+        ]
 
-    except sqlite3.Error as e:
+    except (sqlite3.Error, content_codec.CodecError) as e:
         logging.error(f"Error retrieving history from database: {e}")
+        if strict:
+            raise
     finally:
-        if connection_created and db_conn:
+        if owned:
             db_conn.close()
     return messages
 
-def clear_conversation_history(conversation_id, conn=None):
-    """Clears all messages for a specific conversation. Returns number of deleted rows. Uses provided connection or creates new."""
+def get_last_message_id(conversation_id, conn=None, guild_id=None):
+    """Returns the ID of the newest message in a conversation, or None if it has none."""
+    last_id = None
+    db_conn, owned = _connection_for(conn, guild_id)
+    try:
+        cursor = db_conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM messages WHERE conversation_id = ?", (conversation_id,))
+        last_id = cursor.fetchone()[0]
+    except sqlite3.Error as e:
+        logging.error(f"Error reading last message ID for {conversation_id}: {e}")
+    finally:
+        if owned:
+            db_conn.close()
+    return last_id
+
+def delete_history_batch(conversation_id, up_to_id=None, batch_size=None, conn=None, guild_id=None):
+    """Deletes up to `batch_size` of a conversation's oldest messages in one short transaction.
+
+    Only messages with IDs up to `up_to_id` are deleted when it is given, so messages saved
+    while a chunked clear is running survive it. Returns the number of deleted rows.
+    """
     deleted_count = 0
-    db_conn = conn or sqlite3.connect(config.DB_FILE)
+    batch_size = batch_size or config.DB_DELETE_BATCH_SIZE
+    db_conn, owned = _connection_for(conn, guild_id)
     try:
         with db_conn as current_conn:
             cursor = current_conn.cursor()
-            cursor.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            cursor.execute('''
+                DELETE FROM messages WHERE id IN (
+                    SELECT id FROM messages
+                    WHERE conversation_id = ? AND (? IS NULL OR id <= ?)
+                    ORDER BY timestamp, id
+                    LIMIT ?
+                )
+            ''', (conversation_id, up_to_id, up_to_id, batch_size))
             deleted_count = cursor.rowcount
             current_conn.commit()
     except sqlite3.Error as e:
         logging.error(f"Error clearing history from database: {e}")
     finally:
-        if not conn and db_conn: # Only close if connection was created here
+        if owned: # Only close if connection was created here
             db_conn.close()
     return deleted_count
 
+def clear_conversation_history(conversation_id, conn=None, guild_id=None):
+    """Clears all messages for a specific conversation. Returns number of deleted rows. Uses provided connection or creates new (routed by guild_id).
+
+    Rows are deleted in batches of DB_DELETE_BATCH_SIZE, each its own transaction, so the
+    write lock is never held for long. The async storage layer runs the batches as separate
+    writer jobs instead (see Storage.clear_conversation_history).
+    """
+    deleted_count = 0
+    db_conn, owned = _connection_for(conn, guild_id)
+    try:
+        while True:
+            deleted = delete_history_batch(conversation_id, conn=db_conn)
+            deleted_count += deleted
+            if deleted < config.DB_DELETE_BATCH_SIZE:
+                break
+    finally:
+        if owned: # Only close if connection was created here
+            db_conn.close()
+    return deleted_count
+
+def list_conversations(conn=None, guild_id=None):
+    """Returns the IDs of every conversation with stored messages in the guild's database file."""
+    conversation_ids = []
+    db_conn, owned = _connection_for(conn, guild_id)
+    try:
+        cursor = db_conn.cursor()
+        cursor.execute("SELECT DISTINCT conversation_id FROM messages")
+        conversation_ids = [row[0] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logging.error(f"Error listing conversations: {e}")
+    finally:
+        if owned:
+            db_conn.close()
+    return conversation_ids
+
+def rank_active_conversations(limit, conn=None, guild_id=None):
+    """Returns up to `limit` (conversation_id, last message timestamp) pairs, most recently active first."""
+    ranked = []
+    db_conn, owned = _connection_for(conn, guild_id)
+    try:
+        cursor = db_conn.cursor()
+        # Reads only the covering index idx_messages_conversation, never the message contents
+        cursor.execute('''
+            SELECT conversation_id, MAX(timestamp) AS last_active FROM messages
+            GROUP BY conversation_id
+            ORDER BY last_active DESC
+            LIMIT ?
+        ''', (limit,))
+        ranked = [(row[0], row[1]) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logging.error(f"Error ranking active conversations: {e}")
+    finally:
+        if owned:
+            db_conn.close()
+    return ranked
+
 # --- Prompt Management ---
 
-def set_channel_prompt(conversation_id, prompt, conn=None):
-    """Sets or updates the system prompt for a specific channel. Uses provided connection or creates new."""
+def set_channel_prompt(conversation_id, prompt, conn=None, guild_id=None):
+    """Sets or updates the system prompt for a specific channel. Uses provided connection or creates new (routed by guild_id)."""
     success = False
-    db_conn = conn or sqlite3.connect(config.DB_FILE)
+    db_conn, owned = _connection_for(conn, guild_id)
     try:
         with db_conn as current_conn:
             cursor = current_conn.cursor()
@@ -126,14 +388,17 @@ def set_channel_prompt(conversation_id, prompt, conn=None):
     except sqlite3.Error as e:
         logging.error(f"Error setting prompt for channel {conversation_id}: {e}")
     finally:
-        if not conn and db_conn: # Only close if connection was created here
+        if owned: # Only close if connection was created here
             db_conn.close()
     return success
 
-def get_channel_prompt(conversation_id, conn=None):
-    """Gets the system prompt for a specific channel. Returns None if not set. Uses provided connection or creates new."""
+def get_channel_prompt(conversation_id, conn=None, guild_id=None, strict=False):
+    """Gets the system prompt for a specific channel. Returns None if not set. Uses provided connection or creates new (routed by guild_id).
+
+    Errors are logged and give None, or are re-raised with `strict`.
+    """
     prompt = None
-    db_conn = conn or sqlite3.connect(config.DB_FILE)
+    db_conn, owned = _connection_for(conn, guild_id)
     try:
         # No need for context manager if using existing conn directly
         cursor = db_conn.cursor()
@@ -143,15 +408,17 @@ def get_channel_prompt(conversation_id, conn=None):
             prompt = result[0]
     except sqlite3.Error as e:
         logging.error(f"Error getting prompt for channel {conversation_id}: {e}")
+        if strict:
+            raise
     finally:
-        if not conn and db_conn: # Only close if connection was created here
+        if owned: # Only close if connection was created here
             db_conn.close()
     return prompt
 
-def delete_channel_prompt(conversation_id, conn=None):
-    """Deletes the system prompt for a specific channel. Returns True if deleted, False otherwise. Uses provided connection or creates new."""
+def delete_channel_prompt(conversation_id, conn=None, guild_id=None):
+    """Deletes the system prompt for a specific channel. Returns True if deleted, False otherwise. Uses provided connection or creates new (routed by guild_id)."""
     deleted = False
-    db_conn = conn or sqlite3.connect(config.DB_FILE)
+    db_conn, owned = _connection_for(conn, guild_id)
     try:
         with db_conn as current_conn:
             cursor = current_conn.cursor()
@@ -163,6 +430,272 @@ def delete_channel_prompt(conversation_id, conn=None):
     except sqlite3.Error as e:
         logging.error(f"Error deleting prompt for channel {conversation_id}: {e}")
     finally:
-        if not conn and db_conn: # Only close if connection was created here
+        if owned: # Only close if connection was created here
             db_conn.close()
     return deleted
+
+# --- Content Compression ---
+# Messages of at least DB_COMPRESSION_THRESHOLD characters are stored compressed (DB_COMPRESSION
+# picks zstd or zlib) against the built-in dictionary for that format, which is stored in each
+# file on first use. Rows record their format and dictionary, so changing settings never breaks
+# old rows.
+
+_dictionaries = {} # dict_id -> content_codec.Dictionary; IDs are content hashes, so this is safe across files
+_dictionaries_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def _write_format(codec):
+    return content_codec.resolve_format(codec) # Cached so a bad setting is only warned about once
+
+def compression_format():
+    """Returns the content format new long messages are written in, or None when compression is off."""
+    return _write_format(config.DB_COMPRESSION)
+
+def _load_dictionary(db_conn, dict_id):
+    """Returns the dictionary with this ID, reading it from the connection's file on first use."""
+    dictionary = _dictionaries.get(dict_id)
+    if dictionary is None:
+        row = db_conn.execute("SELECT format, data FROM compression_dicts WHERE id = ?", (dict_id,)).fetchone()
+        if row is None:
+            raise content_codec.CodecError(f"Compression dictionary {dict_id} is missing.")
+        with _dictionaries_lock:
+            dictionary = _dictionaries.setdefault(dict_id, content_codec.Dictionary(row[0], bytes(row[1]), dict_id))
+    return dictionary
+
+def _builtin_dictionary(db_conn, content_format, schema="main"):
+    """Returns the built-in dictionary for the format, storing it in the file (`schema` of the connection) if needed."""
+    dictionary = content_codec.builtin_dictionary(content_format)
+    if db_conn.execute(f"SELECT 1 FROM {schema}.compression_dicts WHERE id = ?", (dictionary.id,)).fetchone() is None:
+        db_conn.execute(
+            f"INSERT INTO {schema}.compression_dicts (id, format, data) VALUES (?, ?, ?)",
+            (dictionary.id, dictionary.format, dictionary.data),
+        )
+    return dictionary
+
+def _encode_content(db_conn, content, schema="main"):
+    """Returns (stored value, content_format, dict_id) for new message content in the file `schema` names."""
+    content_format = compression_format()
+    if content_format is None or len(content) < config.DB_COMPRESSION_THRESHOLD:
+        return content, content_codec.FORMAT_PLAIN, None
+    dictionary = _builtin_dictionary(db_conn, content_format, schema)
+    blob = content_codec.compress(content, content_format, dictionary)
+    if len(blob) >= len(content.encode("utf-8")): # Incompressible: keep it readable
+        return content, content_codec.FORMAT_PLAIN, None
+    return blob, content_format, dictionary.id
+
+def _decode_content(db_conn, stored, content_format, dict_id):
+    """Returns the text of a stored message."""
+    if content_format == content_codec.FORMAT_PLAIN:
+        return stored
+    dictionary = _load_dictionary(db_conn, dict_id) if dict_id is not None else None
+    return content_codec.decompress(stored, content_format, dictionary)
+
+def compress_existing(batch_size=500, conn=None, guild_id=None):
+    """Compresses long plain-text rows among the next `batch_size` message IDs not yet scanned.
+
+    Progress is kept in the file (maintenance_state), so the pass scans each ID once and
+    resumes where it stopped after a restart. Each call is one short transaction.
+    Returns (rows compressed, done).
+    """
+    compressed = 0
+    done = True
+    content_format = compression_format()
+    if content_format is None:
+        return compressed, done
+    db_conn, owned = _connection_for(conn, guild_id)
+    try:
+        with db_conn as current_conn:
+            cursor = current_conn.cursor()
+            cursor.execute("SELECT value FROM maintenance_state WHERE name = 'compressed_through'")
+            row = cursor.fetchone()
+            after_id = row[0] if row else 0
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+            last_id = cursor.fetchone()[0]
+            upper_id = min(after_id + batch_size, last_id)
+            dictionary = _builtin_dictionary(current_conn, content_format)
+            cursor.execute('''
+                SELECT id, content FROM messages
+                WHERE id > ? AND id <= ? AND content_format = 0 AND length(content) >= ?
+            ''', (after_id, upper_id, config.DB_COMPRESSION_THRESHOLD))
+            for message_id, content in cursor.fetchall():
+                blob = content_codec.compress(content, content_format, dictionary)
+                if len(blob) < len(content.encode("utf-8")):
+                    cursor.execute(
+                        "UPDATE messages SET content = ?, content_format = ?, dict_id = ? WHERE id = ?",
+                        (blob, content_format, dictionary.id, message_id),
+                    )
+                    compressed += 1
+            cursor.execute(
+                "INSERT OR REPLACE INTO maintenance_state (name, value) VALUES ('compressed_through', ?)",
+                (max(upper_id, after_id),),
+            )
+            current_conn.commit()
+            done = upper_id >= last_id
+    except (sqlite3.Error, content_codec.CodecError) as e:
+        logging.error(f"Error compressing existing messages: {e}")
+    finally:
+        if owned:
+            db_conn.close()
+    return compressed, done
+
+def retire_trained_dictionaries(batch_size=500, conn=None, guild_id=None):
+    """Rewrites rows compressed against a dictionary trained on the file's own messages.
+
+    Earlier versions trained dictionaries from message text, which then outlived cleared
+    history. Rows among the next `batch_size` message IDs that use such a dictionary are
+    stored again (against the built-in dictionary, or plain when compression is off); after
+    the last ID the old dictionaries are deleted. Progress is kept in maintenance_state.
+    Returns (rows rewritten, done).
+    """
+    rewritten = 0
+    done = True
+    builtin_ids = tuple(content_codec.builtin_dictionary_ids())
+    builtin_placeholders = ", ".join("?" for _ in builtin_ids)
+    db_conn, owned = _connection_for(conn, guild_id)
+    try:
+        with db_conn as current_conn:
+            cursor = current_conn.cursor()
+            cursor.execute(f"SELECT id FROM compression_dicts WHERE id NOT IN ({builtin_placeholders})", builtin_ids)
+            retired_ids = [row[0] for row in cursor.fetchall()]
+            if retired_ids:
+                cursor.execute("SELECT value FROM maintenance_state WHERE name = 'retired_through'")
+                row = cursor.fetchone()
+                after_id = row[0] if row else 0
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+                last_id = cursor.fetchone()[0]
+                upper_id = min(after_id + batch_size, last_id)
+                cursor.execute(f'''
+                    SELECT id, content, content_format, dict_id FROM messages
+                    WHERE id > ? AND id <= ? AND dict_id IS NOT NULL AND dict_id NOT IN ({builtin_placeholders})
+                ''', (after_id, upper_id, *builtin_ids))
+                for message_id, stored, content_format, dict_id in cursor.fetchall():
+                    content = _decode_content(current_conn, stored, content_format, dict_id)
+                    cursor.execute(
+                        "UPDATE messages SET content = ?, content_format = ?, dict_id = ? WHERE id = ?",
+                        (*_encode_content(current_conn, content), message_id),
+                    )
+                    rewritten += 1
+                done = upper_id >= last_id
+                if done:
+                    retired_placeholders = ", ".join("?" for _ in retired_ids)
+                    cursor.execute(f"DELETE FROM compression_dicts WHERE id IN ({retired_placeholders})", retired_ids)
+                    cursor.execute("DELETE FROM maintenance_state WHERE name = 'retired_through'")
+                else:
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO maintenance_state (name, value) VALUES ('retired_through', ?)",
+                        (max(upper_id, after_id),),
+                    )
+            current_conn.commit()
+        if retired_ids and done:
+            with _dictionaries_lock:
+                for dict_id in retired_ids:
+                    _dictionaries.pop(dict_id, None)
+            logging.info(f"Deleted {len(retired_ids)} compression dictionaries trained on message text.")
+    except (sqlite3.Error, content_codec.CodecError) as e:
+        logging.error(f"Error retiring trained compression dictionaries: {e}")
+    finally:
+        if owned:
+            db_conn.close()
+    return rewritten, done
+
+# --- Partition Administration ---
+
+def list_partitions():
+    """Returns (guild_id, path) for every database file, starting with the shared DB_FILE (guild_id None)."""
+    partitions = [(None, config.DB_FILE)]
+    if os.path.isdir(config.DB_PARTITION_DIR):
+        for filename in sorted(os.listdir(config.DB_PARTITION_DIR)):
+            if filename.startswith("guild_") and filename.endswith(".db"):
+                guild_id = filename[len("guild_"):-len(".db")]
+                partitions.append((guild_id, os.path.join(config.DB_PARTITION_DIR, filename)))
+    return partitions
+
+def get_storage_stats():
+    """Collects per-partition conversation/message counts and file sizes across all database files."""
+    stats = []
+    for guild_id, path in list_partitions():
+        if not os.path.exists(path):
+            continue
+        db_conn = sqlite3.connect(path)
+        try:
+            cursor = db_conn.cursor()
+            _create_tables(cursor) # Files from older releases lack the compression columns
+            db_conn.commit()
+            cursor.execute("SELECT COUNT(DISTINCT conversation_id), COUNT(*), COALESCE(SUM(content_format != 0), 0) FROM messages")
+            conversations, messages, compressed = cursor.fetchone()
+            stats.append({
+                "guild_id": guild_id,
+                "path": path,
+                "conversations": conversations,
+                "messages": messages,
+                "compressed": compressed,
+                "size_bytes": os.path.getsize(path),
+            })
+        except sqlite3.Error as e:
+            logging.error(f"Error reading stats from partition '{path}': {e}")
+        finally:
+            db_conn.close()
+    return stats
+
+def split_into_guild_partitions(channel_guild_map, source_path=None):
+    """Moves conversations out of a monolithic database into per-guild partition files.
+
+    `channel_guild_map` maps conversation IDs (channel IDs) to guild IDs. Each guild is moved in
+    its own transaction: rows are copied into the guild's partition (preserving order and
+    timestamps; compressed rows are re-encoded against the partition's own dictionary) and then
+    deleted from the source. Conversations without a mapped guild (DMs,
+    deleted channels) stay in the source file. Returns a dict of guild_id -> messages moved.
+    """
+    source_path = source_path or config.DB_FILE
+    guild_conversations = {}
+    for conversation_id, guild_id in channel_guild_map.items():
+        guild_conversations.setdefault(str(guild_id), []).append(str(conversation_id))
+
+    moved = {}
+    db_conn = sqlite3.connect(source_path)
+    try:
+        _create_tables(db_conn.cursor())
+        db_conn.commit()
+        for guild_id, conversation_ids in guild_conversations.items():
+            target_path = partition_path(guild_id)
+            open_connection(target_path).close() # Ensure the target exists with a schema
+            placeholders = ", ".join("?" for _ in conversation_ids)
+            db_conn.execute("ATTACH DATABASE ? AS part", (target_path,))
+            try:
+                with db_conn:
+                    cursor = db_conn.cursor()
+                    rows = cursor.execute(f'''
+                        SELECT conversation_id, role, content, username, timestamp, content_format, dict_id FROM main.messages
+                        WHERE conversation_id IN ({placeholders})
+                        ORDER BY id ASC
+                    ''', conversation_ids).fetchall()
+                    moved_rows = []
+                    for conversation_id, role, content, username, timestamp, content_format, dict_id in rows:
+                        if content_format != content_codec.FORMAT_PLAIN:
+                            # Stored again against the partition's own dictionary; the shared file's are not copied
+                            content = _decode_content(db_conn, content, content_format, dict_id)
+                            content, content_format, dict_id = _encode_content(db_conn, content, schema="part")
+                        moved_rows.append((conversation_id, role, content, username, timestamp, content_format, dict_id))
+                    cursor.executemany('''
+                        INSERT INTO part.messages (conversation_id, role, content, username, timestamp, content_format, dict_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', moved_rows)
+                    moved_count = len(moved_rows)
+                    # A prompt already set in the partition is newer than the shared file's copy
+                    cursor.execute(f'''
+                        INSERT OR IGNORE INTO part.channel_prompts (conversation_id, system_prompt)
+                        SELECT conversation_id, system_prompt FROM main.channel_prompts
+                        WHERE conversation_id IN ({placeholders})
+                    ''', conversation_ids)
+                    cursor.execute(f"DELETE FROM main.messages WHERE conversation_id IN ({placeholders})", conversation_ids)
+                    cursor.execute(f"DELETE FROM main.channel_prompts WHERE conversation_id IN ({placeholders})", conversation_ids)
+            finally:
+                db_conn.execute("DETACH DATABASE part")
+            if moved_count:
+                moved[guild_id] = moved_count
+                logging.info(f"Moved {moved_count} messages for guild {guild_id} into '{target_path}'.")
+    except (sqlite3.Error, content_codec.CodecError) as e:
+        logging.error(f"Error splitting '{source_path}' into guild partitions: {e}")
+    finally:
+        db_conn.close()
+    return moved
@@ -0,0 +1,238 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+import discord
+import config # Import our config module
+
+# --- Outbound Delivery ---
+# Replies are split into Discord-sized chunks along markdown boundaries and sent through one
+# ordered lane per channel: a reply's chunks go out back to back, and replies leave in the
+# order they were handed over. Lanes for different channels run in parallel. Before every
+# send the lane takes a token from its channel's bucket (Discord's message-create route
+# allows about 5 per 5s per channel) and from a global bucket, so bursts wait here instead
+# of running into 429s.
+
+MESSAGE_LIMIT = 2000 # Discord's maximum message length
+FENCE = "```"
+MAX_BACKOFF = 8.0
+MAX_IDLE_BUCKETS = 1024 # Per-channel buckets kept before full (idle) ones are dropped
+
+def _find_cut(text, limit, in_fence):
+    """Returns where to end a chunk of at most `limit` characters: after a paragraph outside
+    code if there is one in the second half, else after a line, else at a space, else at `limit`."""
+    paragraph = line = None
+    fence = in_fence
+    position = 0
+    while True:
+        end = text.find("\n", position)
+        if end == -1 or end + 1 > limit:
+            break
+        current = text[position:end]
+        closes_fence = False
+        if current.lstrip().startswith(FENCE):
+            closes_fence = fence
+            fence = not fence
+        position = end + 1
+        line = position
+        if not fence and (closes_fence or not current.strip()):
+            paragraph = position
+    if paragraph is not None and paragraph >= limit // 2:
+        return paragraph
+    if line is not None:
+        return line
+    space = text.rfind(" ", 0, limit)
+    return space + 1 if space > 0 else limit
+
+def _fence_after(text, opening):
+    """Returns the code fence still open after `text` (its opening line), or None."""
+    for current in text.split("\n"):
+        if current.lstrip().startswith(FENCE):
+            opening = None if opening else current.strip()
+    return opening
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Splits text into chunks of at most `limit` characters, preferring paragraph and line breaks.
+
+    A code block cut in two is closed at the end of one chunk and reopened (with its language
+    tag) at the start of the next, so every chunk renders on its own.
+    """
+    if len(text) <= limit:
+        return [text]
+    chunks = []
+    opening = None
+    while text:
+        prefix = opening + "\n" if opening else ""
+        if len(prefix) + len(text) <= limit:
+            chunks.append(prefix + text)
+            break
+        budget = limit - len(prefix) - len("\n" + FENCE) # Room to close a fence left open
+        cut = _find_cut(text, budget, opening is not None)
+        piece, text = text[:cut], text[cut:]
+        opening_after = _fence_after(piece, opening)
+        chunk = prefix + piece.rstrip("\n")
+        if opening_after:
+            chunk += "\n" + FENCE
+        else:
+            text = text.lstrip("\n") # Blank lines between paragraphs are not worth a chunk of their own
+        if chunk.strip():
+            chunks.append(chunk)
+        if opening_after and len(opening_after) > limit // 4: # Reopen with a bare fence rather than starve the chunk
+            opening_after = FENCE
+        opening = opening_after
+    return chunks
+
+class TokenBucket:
+    """Allows `capacity` acquisitions per `period` seconds, refilling continuously."""
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def full(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        """Takes one token, sleeping until one is available. Returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            delay = (1 - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+class DeliveryMetrics:
+    """Counters and recent send latencies for $stats."""
+
+    def __init__(self, window=1000):
+        self.replies = 0
+        self.chunks = 0
+        self.retries = 0
+        self.failures = 0
+        self.throttled = 0 # Sends that waited for a bucket
+        self.throttled_seconds = 0.0
+        self.latencies = deque(maxlen=window) # Seconds per successful send (excluding bucket waits)
+
+    def snapshot(self):
+        latencies = sorted(self.latencies)
+        return {
+            "replies": self.replies,
+            "chunks": self.chunks,
+            "retries": self.retries,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "throttled_seconds": self.throttled_seconds,
+            "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
+
+def _retry_delay(error, attempt):
+    """Returns seconds to wait before retrying a failed send, or None if it should not be retried."""
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, discord.DiscordServerError) or (isinstance(error, discord.HTTPException) and error.status == 429):
+        return min(0.5 * 2 ** attempt, MAX_BACKOFF)
+    return None
+
+class Delivery:
+    """Sends replies in order per channel, in parallel across channels, within Discord's rate limits.
+
+    A rate of 0 disables that bucket (the offline harness does this; its channels have no limits).
+    """
+
+    def __init__(self, channel_rate=None, channel_period=None, global_rate=None, max_retries=None):
+        self.channel_rate = config.SEND_CHANNEL_RATE if channel_rate is None else channel_rate
+        self.channel_period = channel_period or config.SEND_CHANNEL_PERIOD
+        global_rate = config.SEND_GLOBAL_RATE if global_rate is None else global_rate
+        self.global_bucket = TokenBucket(global_rate, 1.0) if global_rate > 0 else None
+        self.max_retries = config.SEND_MAX_RETRIES if max_retries is None else max_retries
+        self.metrics = DeliveryMetrics()
+        self._lanes = {} # channel ID -> deque of (channel, chunks, future, context) waiting to be sent
+        self._tasks = set()
+        self._buckets = {} # channel ID -> TokenBucket
+
+    async def send(self, channel, text):
+        """Queues a reply on the channel's lane and waits until every chunk is sent.
+
+        Returns the sent messages. Raises the send error if a chunk could not be delivered
+        (the rest of that reply is dropped; later replies in the channel still go out).
+        """
+        future = asyncio.get_running_loop().create_future()
+        lane = self._lanes.get(channel.id)
+        if lane is None:
+            lane = self._lanes[channel.id] = deque()
+            task = asyncio.create_task(self._drain(channel.id, lane), name=f"delivery-{channel.id}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        # The sender's context travels with the reply, so its log lines keep the sender's correlation ID
+        lane.append((channel, split_message(text), future, contextvars.copy_context()))
+        return await future
+
+    async def _drain(self, channel_id, lane):
+        try:
+            while lane:
+                channel, chunks, future, context = lane.popleft()
+                try:
+                    sent = await asyncio.create_task(self._send_chunks(channel, chunks), context=context)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                self.metrics.replies += 1
+                if not future.done():
+                    future.set_result(sent)
+        finally:
+            del self._lanes[channel_id]
+            for channel, chunks, future, context in lane: # Only left over if this task was cancelled
+                future.cancel()
+
+    async def _send_chunks(self, channel, chunks):
+        return [await self._send_chunk(channel, chunk) for chunk in chunks]
+
+    def _bucket(self, channel_id):
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_IDLE_BUCKETS:
+                self._buckets = {key: value for key, value in self._buckets.items() if not value.full}
+            bucket = self._buckets[channel_id] = TokenBucket(self.channel_rate, self.channel_period)
+        return bucket
+
+    async def _send_chunk(self, channel, chunk):
+        attempt = 0
+        while True:
+            waited = await self._bucket(channel.id).acquire() if self.channel_rate > 0 else 0.0
+            if self.global_bucket is not None:
+                waited += await self.global_bucket.acquire()
+            if waited:
+                self.metrics.throttled += 1
+                self.metrics.throttled_seconds += waited
+
+            started = time.perf_counter()
+            try:
+                message = await channel.send(chunk)
+            except Exception as e:
+                delay = _retry_delay(e, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    self.metrics.failures += 1
+                    raise
+                attempt += 1
+                self.metrics.retries += 1
+                logging.warning("Send to channel %s failed (%s); retry %d in %.1fs.", channel.id, e, attempt, delay)
+                await asyncio.sleep(delay)
+                continue
+            self.metrics.latencies.append(time.perf_counter() - started)
+            self.metrics.chunks += 1
+            return message
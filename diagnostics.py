@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+import config # Import our config module
+
+# --- Runtime Diagnostics ---
+# A sampling profiler for the event loop thread and a loop-lag monitor. Both inspect the
+# loop from a separate thread via sys._current_frames(), so they still see what is running
+# while the loop itself is blocked.
+
+def _frame_key(frame):
+    code = frame.f_code
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+def _describe(key):
+    filename, lineno, name = key
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+class SamplingProfiler:
+    """Periodically samples the call stack of one thread and aggregates per-function counts."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = Counter() # Function on top of the stack
+        self.total_counts = Counter() # Function anywhere on the stack
+
+    def run(self, duration):
+        """Samples for `duration` seconds. Blocking: call from a thread other than the profiled one."""
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples += 1
+                self.self_counts[_frame_key(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    key = _frame_key(frame)
+                    if key not in seen: # Count recursive functions once per sample
+                        seen.add(key)
+                        self.total_counts[key] += 1
+                    frame = frame.f_back
+            time.sleep(self.interval)
+        return self
+
+    def report(self, top=25):
+        """Returns a plain-text table of the functions with the most self time, then cumulative time."""
+        if not self.samples:
+            return "No samples collected."
+        lines = [f"{self.samples} samples every {self.interval * 1000:.0f}ms", "", "Top functions by self time:"]
+        lines.append(f"{'self%':>7} {'total%':>7}  function")
+        for key, count in self.self_counts.most_common(top):
+            lines.append(f"{count / self.samples:>7.1%} {self.total_counts[key] / self.samples:>7.1%}  {_describe(key)}")
+        lines += ["", "Top functions by cumulative time:"]
+        for key, count in self.total_counts.most_common(top):
+            lines.append(f"{count / self.samples:>7.1%}  {_describe(key)}")
+        return "\n".join(lines)
+
+class LoopLagMonitor:
+    """Measures event-loop scheduling lag and logs the loop thread's stack when it stalls.
+
+    A probe task sleeps for `interval` and records how late it wakes up; lag above
+    `warn_threshold` is logged. A watchdog thread notices when the probe has not run for
+    `stall_threshold` beyond its interval and logs the stack of whatever is blocking the loop,
+    once per stall.
+    """
+
+    def __init__(self, interval=None, warn_threshold=None, stall_threshold=None):
+        self.interval = interval or config.LOOP_LAG_INTERVAL
+        self.warn_threshold = warn_threshold or config.LOOP_LAG_WARN_THRESHOLD
+        self.stall_threshold = stall_threshold or config.LOOP_STALL_THRESHOLD
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+        self._loop_thread_id = None
+
+    def start(self):
+        """Starts the probe task and watchdog thread. Must be called from the running event loop."""
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if config.ASYNCIO_DEBUG:
+            # asyncio's own slow-callback report names the callback but not where it blocked
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.warn_threshold
+        self._stop.clear()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._probe(), name="loop-lag-probe")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        """Stops the probe task and watchdog thread."""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=self.interval * 2)
+            self._watchdog = None
+
+    def stats(self):
+        """Returns a snapshot of lag statistics in seconds."""
+        return {"last": self.last_lag, "max": self.max_lag, "avg": self.avg_lag, "stalls": self.stalls}
+
+    async def _probe(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.avg_lag = lag if not self.avg_lag else 0.9 * self.avg_lag + 0.1 * lag
+            if lag > self.warn_threshold:
+                logging.warning("Event loop lag: %.0fms (threshold %.0fms)", lag * 1000, self.warn_threshold * 1000)
+
+    def _watch(self):
+        reported_heartbeat = None
+        while not self._stop.wait(min(self.interval, self.stall_threshold) / 2):
+            heartbeat = self._heartbeat
+            overdue = time.monotonic() - heartbeat - self.interval
+            if overdue < self.stall_threshold or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat # Report each stall once
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<loop thread not found>\n"
+            logging.warning("Event loop blocked for %.0fms; loop thread stack:\n%s", overdue * 1000, stack)
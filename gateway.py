@@ -0,0 +1,196 @@
+import logging
+import time
+from collections import Counter, deque
+import discord
+from discord.ext import commands
+import config # Import our config module
+
+# --- Gateway Client Construction ---
+# Builds the bot with intents and caches sized by MEMORY_PROFILE, sharded when SHARDING is on,
+# and attaches per-shard metrics.
+
+PROFILE_DEFAULT = "default"
+PROFILE_MINIMAL = "minimal"
+
+COMMAND_PREFIX = "$"
+
+def build_client_options(profile=None):
+    """Returns the intents and cache settings for a memory profile as Bot keyword arguments.
+
+    'default' keeps discord.py's full caches: the members intent, every member cached and
+    chunked at startup, and the last 1000 messages cached.
+    'minimal' receives only what the cogs use (guild metadata, message events with content;
+    authors and mentions come with each message payload), caches no members or messages
+    and never requests member chunks.
+    """
+    profile = (profile or config.MEMORY_PROFILE).lower()
+    if profile == PROFILE_MINIMAL:
+        intents = discord.Intents.none()
+        intents.guilds = True # Guild/channel/role cache: guild_only and permission checks
+        intents.guild_messages = True
+        intents.dm_messages = True
+        intents.message_content = True # Required for reading message content
+        return {
+            "intents": intents,
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+            "max_messages": None,
+            "chunk_guilds_at_startup": False,
+        }
+
+    if profile != PROFILE_DEFAULT:
+        logging.warning(f"Unknown MEMORY_PROFILE '{profile}'; using '{PROFILE_DEFAULT}'.")
+    intents = discord.Intents.default()
+    intents.message_content = True  # Required for reading message content
+    intents.members = True # Potentially needed for username resolution, enable if needed
+    intents.guilds = True # Needed for guild-only commands and context
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags.from_intents(intents),
+        "max_messages": 1000,
+        "chunk_guilds_at_startup": True,
+    }
+
+def parse_shard_ids(value):
+    """Parses a shard ID spec like '0-3,8' into a sorted list of IDs. Empty values mean None (all shards)."""
+    if not value or not value.strip():
+        return None
+    shard_ids = set()
+    for part in value.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = (int(bound) for bound in part.split("-", 1))
+            shard_ids.update(range(start, end + 1))
+        elif part:
+            shard_ids.add(int(part))
+    return sorted(shard_ids)
+
+def create_bot(profile=None):
+    """Creates the bot with the configured memory profile and sharding, with shard metrics attached.
+
+    With SHARDING enabled the bot is an AutoShardedBot. SHARD_COUNT fixes the total number of
+    shards (Discord's recommendation when unset) and SHARD_IDS limits this process to a subset,
+    which requires SHARD_COUNT.
+    """
+    options = build_client_options(profile)
+    if config.SHARDING:
+        shard_ids = parse_shard_ids(config.SHARD_IDS)
+        if shard_ids is not None and config.SHARD_COUNT is None:
+            raise ValueError("SHARD_IDS requires SHARD_COUNT to be set.")
+        bot = commands.AutoShardedBot(command_prefix=COMMAND_PREFIX, shard_count=config.SHARD_COUNT, shard_ids=shard_ids, **options)
+    else:
+        bot = commands.Bot(command_prefix=COMMAND_PREFIX, **options)
+    bot.shard_metrics = ShardMetrics(bot)
+    bot.shard_metrics.install()
+    return bot
+
+# --- Shard Metrics ---
+
+class ShardMetrics:
+    """Per-shard gateway event counts and rates, plus latency and reconnect counters.
+
+    Events are counted by wrapping discord.py's gateway parsers, which run synchronously for
+    every dispatched event, so counting costs no extra tasks. The shard is derived from the
+    event's guild ID with Discord's sharding formula; events without a guild (DMs, READY)
+    belong to shard 0.
+    """
+
+    RATE_WINDOW = 60 # Seconds of history used for events/sec
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.events = Counter() # shard_id -> events since start
+        self.disconnects = Counter()
+        self.resumes = Counter()
+        self._buckets = {} # shard_id -> deque of [second, count]
+
+    @property
+    def sharded(self):
+        return isinstance(self.bot, commands.AutoShardedBot)
+
+    def shard_for(self, guild_id):
+        """Returns the shard that receives events for `guild_id`."""
+        if guild_id is None:
+            return 0
+        return (int(guild_id) >> 22) % (self.bot.shard_count or 1)
+
+    def record(self, event, data):
+        """Counts one gateway event."""
+        guild_id = None
+        if isinstance(data, dict):
+            guild_id = data.get("guild_id")
+            if guild_id is None and event.startswith("GUILD_"):
+                guild_id = data.get("id") # GUILD_CREATE/UPDATE/DELETE carry the guild itself
+        shard_id = self.shard_for(guild_id)
+        self.events[shard_id] += 1
+        second = int(time.monotonic())
+        buckets = self._buckets.setdefault(shard_id, deque())
+        if buckets and buckets[-1][0] == second:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([second, 1])
+            while buckets and buckets[0][0] <= second - self.RATE_WINDOW:
+                buckets.popleft()
+
+    def rate(self, shard_id):
+        """Average events/sec for a shard over the last RATE_WINDOW seconds."""
+        cutoff = int(time.monotonic()) - self.RATE_WINDOW
+        return sum(count for second, count in self._buckets.get(shard_id, ()) if second > cutoff) / self.RATE_WINDOW
+
+    def install(self):
+        """Wraps the connection state's parsers and registers reconnect listeners. Call before connecting."""
+        parsers = self.bot._connection.parsers
+        for event, parser in list(parsers.items()):
+            parsers[event] = self._counting(event, parser)
+
+        if self.sharded:
+            self.bot.add_listener(self._on_shard_disconnect, "on_shard_disconnect")
+            self.bot.add_listener(self._on_shard_resumed, "on_shard_resumed")
+        else:
+            self.bot.add_listener(self._on_disconnect, "on_disconnect")
+            self.bot.add_listener(self._on_resumed, "on_resumed")
+
+    def _counting(self, event, parser):
+        def parse(data):
+            self.record(event, data)
+            return parser(data)
+        return parse
+
+    async def _on_shard_disconnect(self, shard_id):
+        self.disconnects[shard_id] += 1
+
+    async def _on_shard_resumed(self, shard_id):
+        self.resumes[shard_id] += 1
+
+    async def _on_disconnect(self):
+        self.disconnects[0] += 1
+
+    async def _on_resumed(self):
+        self.resumes[0] += 1
+
+    def shard_ids(self):
+        """IDs of the shards this process runs."""
+        if self.sharded:
+            if self.bot.shard_ids is not None:
+                return list(self.bot.shard_ids)
+            return list(range(self.bot.shard_count or 0)) or sorted(self.bot.shards)
+        return [self.bot.shard_id or 0]
+
+    def snapshot(self):
+        """Returns one dict per shard with latency (seconds), event totals/rates, guild count and reconnects."""
+        if self.sharded:
+            latencies = dict(self.bot.latencies)
+        else:
+            latencies = {self.bot.shard_id or 0: self.bot.latency}
+        guilds = Counter(guild.shard_id for guild in self.bot.guilds)
+        return [
+            {
+                "shard_id": shard_id,
+                "latency": latencies.get(shard_id, float("nan")),
+                "events": self.events[shard_id],
+                "events_per_sec": self.rate(shard_id),
+                "guilds": guilds[shard_id],
+                "disconnects": self.disconnects[shard_id],
+                "resumes": self.resumes[shard_id],
+            }
+            for shard_id in self.shard_ids()
+        ]
@@ -0,0 +1,222 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Local Job Queue ---
+# Hands mentions from the gateway process to AI worker processes and replies back, through a
+# SQLite file that every process opens (DEPLOYMENT_MODE=gateway).
+#
+# A job is one mention, keyed by its Discord message ID, and moves through these states:
+#   queued  -> working (leased by a worker) -> ready (reply stored) -> sending (leased by a gateway) -> done
+# Enqueueing the same message twice is a no-op, so a redelivered gateway event never produces a
+# second reply. A lease that expires (its holder crashed or hung) makes the job claimable again,
+# so delivery is at-least-once: after a crash a reply may be generated or sent twice, but a job
+# is never lost.
+
+QUEUED = "queued"
+WORKING = "working"
+READY = "ready"
+SENDING = "sending"
+DONE = "done"
+FAILED = "failed"
+
+class Job:
+    """One claimed row of the jobs table."""
+
+    __slots__ = ("message_id", "channel_id", "guild_id", "payload", "attempts", "user_saved", "response", "lease_expires")
+
+    def __init__(self, row):
+        self.message_id = row["message_id"]
+        self.channel_id = row["channel_id"]
+        self.guild_id = row["guild_id"]
+        self.payload = json.loads(row["payload"])
+        self.attempts = row["attempts"]
+        self.user_saved = bool(row["user_saved"])
+        self.response = row["response"]
+        self.lease_expires = row["lease_expires"]
+
+class JobQueue:
+    """SQLite-backed job queue shared by the gateway and worker processes.
+
+    Methods are blocking and thread-safe; async callers run them with asyncio.to_thread.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE so that a
+        # claim's select and update happen under one write lock across processes
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                message_id TEXT PRIMARY KEY, -- Dedup key: one job per Discord message
+                channel_id TEXT NOT NULL,
+                guild_id TEXT,
+                payload TEXT NOT NULL, -- JSON: user input and author names
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0, -- Times a worker has claimed the job
+                deliveries INTEGER NOT NULL DEFAULT 0, -- Times a gateway has claimed the reply
+                user_saved INTEGER NOT NULL DEFAULT 0, -- The user message is already in history
+                response TEXT,
+                owner TEXT,
+                lease_expires REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, created_at)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # --- Gateway Side ---
+
+    def enqueue(self, message_id, channel_id, guild_id, payload):
+        """Queues a mention for the workers. Returns False if the message was already queued."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (message_id, channel_id, guild_id, payload, state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(message_id), str(channel_id), guild_id, json.dumps(payload), QUEUED, now, now),
+            )
+            return cursor.rowcount == 1
+
+    def claim_responses(self, owner, limit=10, lease=30.0, skip_channels=()):
+        """Leases up to `limit` stored replies for sending, leaving out replies to `skip_channels`.
+
+        Unacknowledged replies are retried after `lease` seconds.
+        """
+        return self._claim(READY, SENDING, "deliveries", owner, limit, lease, skip_channels)
+
+    def ack_response(self, message_id, owner):
+        """Marks a reply as sent. Returns False if the lease had already passed to another gateway."""
+        return self._finish(message_id, SENDING, owner, state=DONE)
+
+    def release_response(self, message_id, owner):
+        """Puts back a reply that could not be sent, or marks it failed once it used up max_attempts."""
+        self._release(message_id, SENDING, READY, "deliveries", owner)
+
+    # --- Worker Side ---
+
+    def claim(self, owner, limit=1, lease=120.0):
+        """Leases up to `limit` queued jobs, oldest first, including jobs whose previous lease expired."""
+        return self._claim(QUEUED, WORKING, "attempts", owner, limit, lease)
+
+    def mark_user_saved(self, message_id, owner):
+        """Records that the job's user message is in history, so a retry does not save it again."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET user_saved = 1, updated_at = ? WHERE message_id = ? AND state = ? AND owner = ?",
+                (time.time(), str(message_id), WORKING, owner),
+            )
+
+    def complete(self, message_id, owner, response):
+        """Stores a job's reply for the gateway (no reply: the job is simply done).
+
+        Returns False if the lease expired and another worker now owns the job; that worker's
+        reply is the one that will be sent.
+        """
+        if response is None:
+            return self._finish(message_id, WORKING, owner, state=DONE)
+        return self._finish(message_id, WORKING, owner, state=READY, response=response)
+
+    def release(self, message_id, owner):
+        """Returns a job whose processing failed to the queue, or marks it failed once it used up max_attempts."""
+        self._release(message_id, WORKING, QUEUED, "attempts", owner)
+
+    # --- Maintenance ---
+
+    def purge(self, older_than):
+        """Deletes finished jobs last updated more than `older_than` seconds ago. Returns the number removed.
+
+        Finished jobs are kept for a while so that a late duplicate of the same message is still ignored.
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - older_than),
+            )
+            return cursor.rowcount
+
+    def counts(self):
+        """Returns the number of jobs in each state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) AS jobs FROM jobs GROUP BY state").fetchall()
+        return {row["state"]: row["jobs"] for row in rows}
+
+    # --- Internals ---
+
+    def _claim(self, from_state, to_state, counter, owner, limit, lease, skip_channels=()):
+        now = time.time()
+        rows = []
+        with self._transaction() as conn:
+            # An expired lease whose holder already used up max_attempts is not handed out again
+            exhausted = [row["message_id"] for row in conn.execute(
+                f"SELECT message_id FROM jobs WHERE state = ? AND lease_expires < ? AND {counter} >= ?",
+                (to_state, now, self.max_attempts),
+            )]
+            if exhausted:
+                placeholders = ",".join("?" * len(exhausted))
+                conn.execute(
+                    f"UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL, updated_at = ? WHERE message_id IN ({placeholders})",
+                    (FAILED, now, *exhausted),
+                )
+            skipped = ",".join("?" * len(skip_channels))
+            ids = [row["message_id"] for row in conn.execute(
+                f"SELECT message_id FROM jobs WHERE (state = ? OR (state = ? AND lease_expires < ?)) AND channel_id NOT IN ({skipped}) ORDER BY created_at LIMIT ?",
+                (from_state, to_state, now, *skip_channels, limit),
+            )]
+            if ids:
+                placeholders = ",".join("?" * len(ids))
+                conn.execute(
+                    f"UPDATE jobs SET state = ?, owner = ?, lease_expires = ?, {counter} = {counter} + 1, updated_at = ? WHERE message_id IN ({placeholders})",
+                    (to_state, owner, now + lease, now, *ids),
+                )
+                rows = conn.execute(f"SELECT * FROM jobs WHERE message_id IN ({placeholders}) ORDER BY created_at", ids).fetchall()
+        for message_id in exhausted:
+            logging.error(f"Job {message_id} failed after {self.max_attempts} tries in state '{to_state}' (its last lease expired).")
+        return [Job(row) for row in rows]
+
+    def _finish(self, message_id, from_state, owner, **changes):
+        assignments = ", ".join(f"{column} = ?" for column in changes)
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, owner = NULL, lease_expires = NULL, updated_at = ? WHERE message_id = ? AND state = ? AND owner = ?",
+                (*changes.values(), time.time(), str(message_id), from_state, owner),
+            )
+            return cursor.rowcount == 1
+
+    def _release(self, message_id, from_state, retry_state, counter, owner):
+        with self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT {counter} AS tries FROM jobs WHERE message_id = ? AND state = ? AND owner = ?",
+                (str(message_id), from_state, owner),
+            ).fetchone()
+            if row is None:
+                return
+            state = FAILED if row["tries"] >= self.max_attempts else retry_state
+            conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL, updated_at = ? WHERE message_id = ?",
+                (state, time.time(), str(message_id)),
+            )
+        if state == FAILED:
+            logging.error(f"Job {message_id} failed after {row['tries']} tries in state '{from_state}'.")
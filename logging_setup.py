@@ -0,0 +1,89 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import config # Import our config module
+
+# --- Off-Loop Logging ---
+# Handlers that do I/O run on a listener thread; the event loop only pushes records onto a
+# queue. Messages are formatted on that thread too, so `%`-style arguments cost nothing on
+# the loop (and nothing at all when the level filters the record out).
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] %(message)s'
+
+# ID of the request (Discord message) currently being processed; follows tasks and executor jobs
+correlation_id = contextvars.ContextVar("correlation_id", default="-")
+
+_listener = None
+
+class CorrelationIdFilter(logging.Filter):
+    """Stamps each record with the current correlation ID while still on the emitting thread."""
+
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread.
+
+    The stock handler formats in the caller's thread so records can be pickled; ours never
+    leave the process, so the record is queued as-is.
+    """
+
+    def prepare(self, record):
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "correlation_id": getattr(record, "correlation_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+def set_correlation_id(value):
+    """Sets the correlation ID for the current task/context. Returns a token for `correlation_id.reset`."""
+    return correlation_id.set(str(value))
+
+def setup_logging(level=None, json_output=None):
+    """Routes the root logger through a queue to a background listener thread.
+
+    Safe to call again (e.g. after config changes); the previous listener is stopped first.
+    """
+    global _listener
+    stop_logging()
+
+    level_name = (level or config.LOG_LEVEL).upper()
+    json_output = config.LOG_JSON if json_output is None else json_output
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(CorrelationIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level_name, logging.INFO))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def stop_logging():
+    """Stops the listener thread after it drains the queue."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import config # Import our config module
+
+# --- Event Loop Runtime ---
+# Picks the event loop implementation (uvloop when available, unless disabled) and tunes
+# the loop before the bot starts.
+
+LOOP_AUTO = "auto"
+LOOP_UVLOOP = "uvloop"
+LOOP_ASYNCIO = "asyncio"
+
+def select_loop_factory(preference=None):
+    """Returns (loop_factory, name) for the requested implementation.
+
+    'auto' uses uvloop if it is installed, 'uvloop' requires it (falling back with a warning),
+    'asyncio' always uses the standard loop. A factory of None means asyncio's default.
+    """
+    preference = (preference or config.EVENT_LOOP).lower()
+    if preference in (LOOP_AUTO, LOOP_UVLOOP):
+        try:
+            import uvloop # Optional dependency, see the 'speed' extra in pyproject.toml
+            return uvloop.new_event_loop, LOOP_UVLOOP
+        except ImportError:
+            if preference == LOOP_UVLOOP:
+                logging.warning("EVENT_LOOP=uvloop but uvloop is not installed; falling back to asyncio.")
+    elif preference != LOOP_ASYNCIO:
+        logging.warning(f"Unknown EVENT_LOOP '{preference}'; using asyncio.")
+    return None, LOOP_ASYNCIO
+
+def configure_loop(loop=None):
+    """Applies runtime tuning to the running loop: sizes the default executor used by asyncio.to_thread."""
+    loop = loop or asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=config.DEFAULT_EXECUTOR_WORKERS, thread_name_prefix="offload"))
+
+def describe_loop(loop=None):
+    """Returns a short description of the running loop implementation, e.g. 'uvloop 0.19.0 (Loop)'."""
+    loop = loop or asyncio.get_running_loop()
+    module = type(loop).__module__.split(".")[0]
+    if module == LOOP_UVLOOP:
+        import uvloop
+        return f"uvloop {uvloop.__version__} ({type(loop).__name__})"
+    return f"asyncio ({type(loop).__name__})"
+
+def run(main, preference=None):
+    """Runs the coroutine function `main` to completion on the selected event loop."""
+    loop_factory, _ = select_loop_factory(preference)
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(main())
+
+class StartupTimer:
+    """Records how long each startup phase takes, for a one-line breakdown once the bot is ready."""
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases = [] # (name, seconds) in order
+        self.finished = False
+        self._last = self.started
+
+    def mark(self, phase):
+        """Ends `phase` now; its duration is the time since the previous mark (or since start)."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def finish(self, phase):
+        """Ends the last phase; later marks are ignored by callers checking `finished`."""
+        self.mark(phase)
+        self.finished = True
+
+    @property
+    def total(self):
+        return self._last - self.started
+
+    def report(self):
+        breakdown = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.phases)
+        return f"Startup timing: {breakdown} (total {self.total:.3f}s)"
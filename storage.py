@@ -0,0 +1,445 @@
+import asyncio
+import contextvars
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import config # Import our config module
+import content_codec
+import database # Import our database module
+
+# --- Async Storage Facade ---
+# All mutations go through one writer task that runs them, in submission order, on a
+# single dedicated thread with one long-lived connection per database file. Reads run on a
+# small pool of threads, each holding its own read-only connections, so history and prompt
+# lookups proceed in parallel with each other and with the writer (the files use WAL).
+
+_WRITE_BATCH_SIZE = 64 # Max queued writes handed to the writer thread in one hop
+
+class _CachedConversation:
+    """Recent history rows and the prompt of one conversation, as last read or written by this process."""
+
+    __slots__ = ("history", "prompt", "prompt_loaded", "context")
+
+    def __init__(self):
+        self.history = None # Newest rows (up to the cache depth), oldest first; None = not cached
+        self.prompt = None
+        self.prompt_loaded = False
+        # State derived from history and prompt (conversation.PreparedContext): its append(row)
+        # is called for every saved message, and it is dropped whenever history or prompt change otherwise
+        self.context = None
+
+class Storage:
+    """Async API over `database` with a single writer and parallel readers.
+
+    Reads are read-your-writes per conversation: a read waits for any write already
+    submitted for the same conversation before it queries the database.
+
+    Recent history (HISTORY_LIMIT rows) and prompts of up to `cache_size` conversations are
+    cached, per database file and conversation, and kept current by this instance's own writes.
+    Only enable the cache when this process is the only writer for the conversations it serves
+    (not in AI workers, which share conversations with each other).
+    """
+
+    def __init__(self, read_pool_size=None, cache_size=None):
+        self.read_pool_size = read_pool_size or config.DB_READ_POOL_SIZE
+        self.cache_size = config.CONTEXT_CACHE_SIZE if cache_size is None else cache_size
+        self.cache_depth = config.HISTORY_LIMIT
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict() # (db path, conversation_id) -> _CachedConversation, least recently used first
+        self._generations = {} # (db path, conversation_id) -> write counter, so reads racing a write don't cache stale rows
+        self._write_queue = None
+        self._writer_task = None
+        self._writer_executor = None
+        self._read_executor = None
+        self._writer_connections = database.ConnectionPool(config.DB_MAX_OPEN_PARTITIONS, database.open_connection)
+        self._reader_local = threading.local()
+        self._reader_pools = []
+        self._reader_pools_lock = threading.Lock()
+        self._pending_writes = {} # conversation_id -> future of the latest submitted write
+
+    @property
+    def running(self):
+        return self._writer_task is not None and not self._writer_task.done()
+
+    async def start(self):
+        """Starts the writer task and thread pools. Must be called from the running event loop."""
+        if self.running:
+            return
+        self._write_queue = asyncio.Queue()
+        self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._read_executor = ThreadPoolExecutor(max_workers=self.read_pool_size, thread_name_prefix="db-reader")
+        self._writer_task = asyncio.create_task(self._writer_loop(), name="db-writer")
+        logging.info(f"Storage started with 1 writer and {self.read_pool_size} readers.")
+
+    async def close(self):
+        """Flushes queued writes, stops the writer and closes every connection."""
+        if not self.running:
+            return
+        await self._write_queue.put(None) # Sentinel: everything queued before it is still written
+        await self._writer_task
+        self._writer_task = None
+        self._writer_executor.submit(self._writer_connections.close_all).result()
+        self._writer_executor.shutdown()
+        self._read_executor.shutdown()
+        with self._reader_pools_lock:
+            for pool in self._reader_pools:
+                pool.close_all()
+            self._reader_pools.clear()
+        logging.info("Storage closed.")
+
+    # --- Writer ---
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            jobs = [await self._write_queue.get()]
+            while len(jobs) < _WRITE_BATCH_SIZE and not self._write_queue.empty():
+                jobs.append(self._write_queue.get_nowait())
+            if jobs[-1] is None:
+                stopping = True
+                jobs.pop()
+            if not jobs:
+                continue
+
+            results = await loop.run_in_executor(self._writer_executor, self._run_write_batch, jobs)
+            for (_, future), (ok, value) in zip(jobs, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _run_write_batch(self, jobs):
+        """Runs queued write calls one after another on the writer thread."""
+        results = []
+        for call, _ in jobs:
+            try:
+                results.append((True, call()))
+            except Exception as e:
+                logging.exception("Unexpected error in storage writer: %s", e)
+                results.append((False, e))
+        return results
+
+    def _writer_connection(self, guild_id):
+        return self._writer_connections.get(database.get_db_path(guild_id))
+
+    async def _submit_write(self, conversation_id, guild_id, func, *args, **kwargs):
+        """Queues `func(*args, conn=<writer connection>, **kwargs)` and waits for it to commit."""
+        if not self.running:
+            raise RuntimeError("Storage is not running; call start() first.")
+
+        def call():
+            return func(*args, conn=self._writer_connection(guild_id), **kwargs)
+
+        # Run in the submitter's context so log lines keep its correlation ID
+        call = partial(contextvars.copy_context().run, call)
+        future = asyncio.get_running_loop().create_future()
+        if conversation_id is not None:
+            self._pending_writes[conversation_id] = future
+            # Bumped on submission and again on commit: a read that started before either
+            # may or may not see this write, so it must not be cached
+            key = self._key(conversation_id, guild_id)
+            self._bump(key)
+        await self._write_queue.put((call, future))
+        try:
+            return await future
+        finally:
+            if conversation_id is not None:
+                self._bump(key)
+                if self._pending_writes.get(conversation_id) is future:
+                    del self._pending_writes[conversation_id]
+
+    # --- Readers ---
+
+    def _reader_connection(self, guild_id):
+        """Returns this reader thread's read-only connection for the guild's database file."""
+        pool = getattr(self._reader_local, "pool", None)
+        if pool is None:
+            pool = database.ConnectionPool(config.DB_MAX_OPEN_PARTITIONS, partial(database.open_connection, read_only=True))
+            self._reader_local.pool = pool
+            with self._reader_pools_lock:
+                self._reader_pools.append(pool)
+        return pool.get(database.get_db_path(guild_id))
+
+    async def _submit_read(self, conversation_id, guild_id, func, *args, **kwargs):
+        """Runs `func(*args, conn=<reader connection>, **kwargs)` on a reader thread after pending writes for the conversation."""
+        if not self.running:
+            raise RuntimeError("Storage is not running; call start() first.")
+        pending = self._pending_writes.get(conversation_id)
+        if pending is not None:
+            # Only ordering matters here; the writer's caller handles its own failure
+            await asyncio.wait([pending])
+
+        def call():
+            return func(*args, conn=self._reader_connection(guild_id), **kwargs)
+
+        call = partial(contextvars.copy_context().run, call)
+        return await asyncio.get_running_loop().run_in_executor(self._read_executor, call)
+
+    # --- Conversation Cache ---
+
+    @staticmethod
+    def _key(conversation_id, guild_id):
+        # The file a conversation routes to, not the guild itself: in single-file mode warm-up
+        # (which doesn't know guilds) and mentions must share entries
+        return database.get_db_path(guild_id), conversation_id
+
+    def _cached(self, key, create=False):
+        if not self.cache_size:
+            return None
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+        elif create:
+            entry = self._cache[key] = _CachedConversation()
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return entry
+
+    def _bump(self, key):
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _forget(self, keys):
+        """Drops cache entries and fences off in-flight reads for conversations changed outside the cached paths."""
+        for key in keys:
+            self._bump(key)
+            self._cache.pop(key, None)
+
+    async def _wait_for_pending_write(self, conversation_id):
+        pending = self._pending_writes.get(conversation_id)
+        if pending is not None:
+            await asyncio.wait([pending])
+
+    def generation(self, conversation_id, guild_id=None):
+        """Returns a counter that changes with every write to the conversation made through this instance."""
+        return self._generations.get(self._key(conversation_id, guild_id), 0)
+
+    async def get_context(self, conversation_id, guild_id=None):
+        """Returns the prepared context attached to a cached conversation, once writes already submitted for it are applied."""
+        if not self.cache_size:
+            return None
+        await self._wait_for_pending_write(conversation_id)
+        entry = self._cached(self._key(conversation_id, guild_id))
+        if entry is None or entry.context is None:
+            return None
+        self.cache_hits += 1
+        return entry.context
+
+    def set_context(self, conversation_id, context, generation, guild_id=None):
+        """Attaches a prepared context built from the conversation's state at `generation`.
+
+        Ignored if the conversation was written to since, or its history and prompt are not cached.
+        """
+        key = self._key(conversation_id, guild_id)
+        entry = self._cached(key)
+        if entry is not None and entry.history is not None and entry.prompt_loaded and self._generations.get(key, 0) == generation:
+            entry.context = context
+
+    def cache_stats(self):
+        """Returns the number of cached conversations and history/prompt cache hits and misses."""
+        return {"conversations": len(self._cache), "hits": self.cache_hits, "misses": self.cache_misses}
+
+    async def warm(self, conversation_id, guild_id=None):
+        """Loads a conversation's recent history and prompt into the cache (and the OS page cache)."""
+        await asyncio.gather(
+            self.get_history(conversation_id, limit=self.cache_depth, guild_id=guild_id),
+            self.get_channel_prompt(conversation_id, guild_id=guild_id),
+        )
+
+    async def rank_active_conversations(self, limit):
+        """Returns up to `limit` (conversation_id, guild_id) pairs, most recently active first, across all database files."""
+        guild_ids = [None]
+        if config.DB_PARTITION_MODE == database.PARTITION_MODE_GUILD:
+            guild_ids += [guild_id for guild_id, _ in (await asyncio.to_thread(database.list_partitions))[1:]]
+        ranked = []
+        for guild_id in guild_ids:
+            rows = await self._submit_read(None, guild_id, database.rank_active_conversations, limit)
+            ranked.extend((last_active, conversation_id, guild_id) for conversation_id, last_active in rows)
+        ranked.sort(reverse=True)
+        return [(conversation_id, guild_id) for _, conversation_id, guild_id in ranked[:limit]]
+
+    # --- Public API ---
+
+    async def save_message(self, conversation_id, role, content, username=None, guild_id=None):
+        """Saves a message; returns True once it is committed, False if the write failed."""
+        key = self._key(conversation_id, guild_id)
+        saved = await self._submit_write(conversation_id, guild_id, database.save_message, conversation_id, role, content, username=username)
+        if not saved:
+            self._forget([key]) # The cache must not show a message the database does not have
+            return False
+        entry = self._cached(key)
+        if entry is not None and entry.history is not None:
+            row = {"role": role, "content": content, "username": username}
+            entry.history.append(row)
+            if len(entry.history) > self.cache_depth:
+                del entry.history[0]
+            if entry.context is not None:
+                entry.context.append(row)
+        return True
+
+    async def get_history(self, conversation_id, limit=config.HISTORY_LIMIT, guild_id=None):
+        """Returns the last `limit` messages for a conversation, including any writes already submitted for it.
+
+        Rows may be shared with the cache; treat them as read-only.
+        """
+        key = self._key(conversation_id, guild_id)
+        if self.cache_size and limit <= self.cache_depth:
+            await self._wait_for_pending_write(conversation_id)
+            entry = self._cached(key)
+            if entry is not None and entry.history is not None:
+                self.cache_hits += 1
+                return entry.history[-limit:]
+            self.cache_misses += 1
+
+        generation = self._generations.get(key, 0)
+        try:
+            history = await self._submit_read(conversation_id, guild_id, database.get_history, conversation_id, limit=limit, strict=True)
+        except (sqlite3.Error, content_codec.CodecError):
+            return [] # Already logged; not cached, so the next read tries again
+        if self.cache_size and limit >= self.cache_depth and self._generations.get(key, 0) == generation:
+            self._cached(key, create=True).history = history[-self.cache_depth:]
+        return history
+
+    async def clear_conversation_history(self, conversation_id, guild_id=None, progress=None):
+        """Clears all messages for a conversation. Returns number of deleted rows.
+
+        Rows are deleted in chunks of DB_DELETE_BATCH_SIZE, each a separate writer job, so
+        writes queued meanwhile (for any conversation) run between chunks instead of waiting
+        for the whole clear. Only messages saved before the call are cleared.
+        `progress(deleted_so_far)` is awaited between chunks, if given.
+        """
+        up_to_id = await self._submit_read(conversation_id, guild_id, database.get_last_message_id, conversation_id)
+        if up_to_id is None:
+            return 0
+        batch_size = config.DB_DELETE_BATCH_SIZE
+        deleted_count = 0
+        while True:
+            deleted = await self._submit_write(conversation_id, guild_id, database.delete_history_batch, conversation_id, up_to_id=up_to_id, batch_size=batch_size)
+            entry = self._cached(self._key(conversation_id, guild_id))
+            if entry is not None:
+                entry.history = entry.context = None # Reloaded on the next read
+            deleted_count += deleted
+            if deleted < batch_size:
+                return deleted_count
+            if progress is not None:
+                await progress(deleted_count)
+
+    async def list_conversations(self, guild_id=None):
+        """Returns the IDs of every conversation with stored messages in the guild's database file."""
+        return await self._submit_read(None, guild_id, database.list_conversations)
+
+    async def set_channel_prompt(self, conversation_id, prompt, guild_id=None):
+        """Sets or updates the system prompt for a channel. Returns True on success."""
+        success = await self._submit_write(conversation_id, guild_id, database.set_channel_prompt, conversation_id, prompt)
+        self._remember_prompt(self._key(conversation_id, guild_id), prompt if success else None, loaded=success)
+        return success
+
+    async def get_channel_prompt(self, conversation_id, guild_id=None):
+        """Gets the system prompt for a channel, or None if not set."""
+        key = self._key(conversation_id, guild_id)
+        if self.cache_size:
+            await self._wait_for_pending_write(conversation_id)
+            entry = self._cached(key)
+            if entry is not None and entry.prompt_loaded:
+                self.cache_hits += 1
+                return entry.prompt
+            self.cache_misses += 1
+
+        generation = self._generations.get(key, 0)
+        try:
+            prompt = await self._submit_read(conversation_id, guild_id, database.get_channel_prompt, conversation_id, strict=True)
+        except sqlite3.Error:
+            return None # Already logged; not cached, so the next read tries again
+        if self._generations.get(key, 0) == generation:
+            self._remember_prompt(key, prompt, loaded=True, written=False)
+        return prompt
+
+    async def delete_channel_prompt(self, conversation_id, guild_id=None):
+        """Deletes the system prompt for a channel. Returns True if one was deleted."""
+        deleted = await self._submit_write(conversation_id, guild_id, database.delete_channel_prompt, conversation_id)
+        self._remember_prompt(self._key(conversation_id, guild_id), None, loaded=True)
+        return deleted
+
+    def _remember_prompt(self, key, prompt, loaded, written=True):
+        entry = self._cached(key, create=loaded)
+        if entry is not None:
+            entry.prompt = prompt
+            entry.prompt_loaded = loaded
+            if written:
+                entry.context = None # Rebuilt with the new system message on the next mention
+
+    # --- Maintenance ---
+
+    async def split_into_guild_partitions(self, channel_guild_map):
+        """Moves conversations into per-guild partition files (see database.split_into_guild_partitions).
+
+        Each guild is its own writer job, so regular saves run between guilds, and the moved
+        conversations are dropped from the cache. Returns a dict of guild_id -> messages moved.
+        """
+        guild_maps = {}
+        for conversation_id, guild_id in channel_guild_map.items():
+            guild_maps.setdefault(str(guild_id), {})[str(conversation_id)] = str(guild_id)
+
+        moved = {}
+        for guild_id, guild_map in guild_maps.items():
+            keys = [
+                key
+                for conversation_id in guild_map
+                for key in (self._key(conversation_id, None), self._key(conversation_id, guild_id))
+            ]
+
+            def split(conn=None, guild_map=guild_map): # Opens its own connections to the source and partition files
+                return database.split_into_guild_partitions(guild_map)
+
+            self._forget(keys)
+            try:
+                moved.update(await self._submit_write(None, None, split))
+            finally:
+                self._forget(keys) # Reads that ran during the move may have cached half-moved state
+        return moved
+
+    async def retire_trained_dictionaries(self, guild_id=None, batch_size=500):
+        """Rewrites one file's rows that use a dictionary trained on message text (see
+        database.retire_trained_dictionaries). Returns the number of rows rewritten.
+
+        Each batch of IDs is its own short writer job, so regular saves interleave with the pass.
+        """
+        total, done = 0, False
+        while not done:
+            rewritten, done = await self._submit_write(None, guild_id, database.retire_trained_dictionaries, batch_size=batch_size)
+            total += rewritten
+        return total
+
+    async def compress_existing(self, guild_id=None, batch_size=500):
+        """Compresses older plain-text messages in one database file. Returns the number of rows compressed.
+
+        Each batch of IDs is its own short writer job, so regular saves interleave with the pass.
+        """
+        if database.compression_format() is None:
+            return 0
+        total, done = 0, False
+        while not done:
+            compressed, done = await self._submit_write(None, guild_id, database.compress_existing, batch_size=batch_size)
+            total += compressed
+        return total
+
+    async def compress_all(self, compress=True):
+        """Retires trained dictionaries in every database file, then (if `compress`) runs
+        compress_existing over them. Returns the number of rows compressed."""
+        guild_ids = [None]
+        if config.DB_PARTITION_MODE == database.PARTITION_MODE_GUILD:
+            guild_ids += [guild_id for guild_id, _ in (await asyncio.to_thread(database.list_partitions))[1:]]
+        total = 0
+        for guild_id in guild_ids:
+            rewritten = await self.retire_trained_dictionaries(guild_id)
+            if rewritten:
+                logging.info(f"Recompressed {rewritten} messages that used a dictionary trained on message text.")
+            if compress:
+                total += await self.compress_existing(guild_id)
+        return total
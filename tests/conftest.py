@@ -0,0 +1,34 @@
+import pytest
+import os
+import sys
+import asyncio
+
+# Add project root to the Python path to allow importing 'storage', 'database' and 'config'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import config
+import database
+from storage import Storage
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    """Points the database module at a temporary file with the schema initialized."""
+    db_path = tmp_path / "history.db"
+    monkeypatch.setattr(config, 'DB_FILE', str(db_path))
+    database.init_db()
+    return db_path
+
+@pytest.fixture
+def run_with_storage():
+    """Returns a function that runs `test_coro(storage)` on a fresh event loop with a started Storage, closing it afterwards."""
+    def run(test_coro, read_pool_size=2):
+        async def runner():
+            storage = Storage(read_pool_size=read_pool_size)
+            await storage.start()
+            try:
+                return await test_coro(storage)
+            finally:
+                await storage.close()
+        return asyncio.run(runner())
+    return run
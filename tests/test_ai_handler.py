@@ -0,0 +1,79 @@
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+
+# Add project root to the Python path to allow importing 'cogs.ai_handler' and 'job_queue'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import config
+import job_queue
+from cogs.ai_handler import AIHandler
+from delivery import Delivery
+from job_queue import JobQueue
+
+class GatedChannel:
+    """Records sends; channels listed in `blocked` wait until `gate` is set."""
+
+    def __init__(self, channel_id, sent, gate, blocked):
+        self.id = channel_id
+        self.sent = sent
+        self.gate = gate
+        self.blocked = blocked
+
+    async def send(self, content):
+        if self.id in self.blocked:
+            await self.gate.wait()
+        self.sent.append((self.id, content))
+        return SimpleNamespace(id=len(self.sent), content=content)
+
+def test_throttled_channel_does_not_hold_up_others(tmp_path, monkeypatch):
+    """Test that gateway delivery keeps sending to other channels while one channel's send is stuck."""
+    monkeypatch.setattr(config, 'JOB_POLL_INTERVAL', 0.01)
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    sent = []
+
+    def ready_reply(message_id, channel_id):
+        queue.enqueue(message_id, channel_id, None, {"content": "Hi", "username": "bob"})
+        queue.complete(queue.claim("w1")[0].message_id, "w1", f"Reply {message_id}")
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def wait_until_ready():
+            pass
+
+        bot = SimpleNamespace(
+            job_queue=queue,
+            delivery=Delivery(channel_rate=0, global_rate=0),
+            wait_until_ready=wait_until_ready,
+            get_partial_messageable=lambda channel_id: GatedChannel(channel_id, sent, gate, blocked={10}),
+        )
+        cog = AIHandler(bot)
+        task = asyncio.create_task(cog.deliver_responses())
+        try:
+            ready_reply(1, 10)
+            while not cog._channel_deliveries:
+                await asyncio.sleep(0.01)
+            ready_reply(2, 20)
+            ready_reply(3, 10) # Waits behind reply 1 instead of being sent out of order
+            for _ in range(200):
+                if sent:
+                    break
+                await asyncio.sleep(0.01)
+            assert sent == [(20, "Reply 2")]
+
+            gate.set()
+            while queue.counts().get(job_queue.DONE, 0) < 3:
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+            await cog.cog_unload()
+            await asyncio.gather(task, return_exceptions=True)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        queue.close()
+    assert sent == [(20, "Reply 2"), (10, "Reply 1"), (10, "Reply 3")]
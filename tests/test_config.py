@@ -21,14 +21,13 @@ def test_missing_discord_token_exits(monkeypatch, caplog):
     with patch('dotenv.load_dotenv'), \
          patch('builtins.exit') as mock_exit:
         with caplog.at_level(logging.ERROR):
-            # Reload the config module to trigger the check
-            # Need to use importlib.reload because the check happens at import time
-            importlib.reload(config)
+            # Loading the config triggers the check (importing the module no longer does)
+            config.load()
 
     # Assertions
     mock_exit.assert_called_once()
     assert "DISCORD_TOKEN not found in .env file." in caplog.text
-    # Ensure the variable is still None in the reloaded module
+    # Ensure the variable is still None in the loaded module
     assert config.DISCORD_TOKEN is None
 
     # Restore the token (monkeypatch handles cleanup, but explicit reload ensures module state)
@@ -36,6 +35,33 @@ def test_missing_discord_token_exits(monkeypatch, caplog):
         monkeypatch.setenv("DISCORD_TOKEN", ORIGINAL_DISCORD_TOKEN)
         importlib.reload(config)
 
+def test_import_has_no_side_effects(monkeypatch):
+    """Test that importing config neither reads .env nor exits when secrets are missing."""
+    monkeypatch.delenv("DISCORD_TOKEN", raising=False)
+
+    with patch('dotenv.load_dotenv') as mock_load_dotenv, \
+         patch('builtins.exit') as mock_exit:
+        importlib.reload(config)
+
+    mock_load_dotenv.assert_not_called()
+    mock_exit.assert_not_called()
+    assert config.DISCORD_TOKEN is None
+
+def test_load_refreshes_settings(monkeypatch):
+    """Test that load() re-reads environment-driven settings."""
+    monkeypatch.setenv("DISCORD_TOKEN", "token-from-env")
+    monkeypatch.setenv("DB_PARTITION_MODE", "GUILD")
+
+    with patch('dotenv.load_dotenv'):
+        config.load()
+
+    assert config.DISCORD_TOKEN == "token-from-env"
+    assert config.DB_PARTITION_MODE == "guild"
+
+    # Leave module state matching the real environment for the following tests
+    monkeypatch.undo()
+    config._read_env()
+
 def test_missing_mistral_api_key_warns(monkeypatch, caplog):
     """Test that a warning is logged if MISTRAL_API_KEY is missing."""
     # Ensure DISCORD_TOKEN is present, otherwise the exit() check stops the test
@@ -52,7 +78,7 @@ def test_missing_mistral_api_key_warns(monkeypatch, caplog):
     with patch('dotenv.load_dotenv'), \
          patch('builtins.exit') as mock_exit:
         with caplog.at_level(logging.WARNING):
-            importlib.reload(config)
+            config.load()
 
     # Assertions
     mock_exit.assert_not_called()
@@ -0,0 +1,52 @@
+import pytest
+import os
+import sys
+
+# Add project root to the Python path to allow importing 'content_codec'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import content_codec
+
+FORMATS = [content_codec.FORMAT_ZLIB]
+if content_codec.zstandard is not None:
+    FORMATS.append(content_codec.FORMAT_ZSTD)
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_round_trip_with_and_without_dictionary(fmt):
+    """Test that text survives compression, with and without the built-in dictionary."""
+    text = "Ünïcode and plain text alike. " * 40
+    assert content_codec.decompress(content_codec.compress(text, fmt), fmt) == text
+
+    dictionary = content_codec.builtin_dictionary(fmt)
+    blob = content_codec.compress(text, fmt, dictionary)
+    assert content_codec.decompress(blob, fmt, dictionary) == text
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_dictionary_helps_short_replies(fmt):
+    """Test that the built-in dictionary shrinks a typical reply further."""
+    dictionary = content_codec.builtin_dictionary(fmt)
+    text = "Sure! Here's a quick overview of the key points. I hope this helps! Let me know if you have any other questions."
+    assert len(content_codec.compress(text, fmt, dictionary)) < len(content_codec.compress(text, fmt))
+
+def test_dictionary_ids_are_content_derived():
+    """Test that the same dictionary bytes get the same ID wherever they are stored."""
+    first = content_codec.Dictionary(content_codec.FORMAT_ZLIB, b"shared bytes")
+    second = content_codec.Dictionary(content_codec.FORMAT_ZLIB, b"shared bytes")
+    assert first.id == second.id
+    assert first.id != content_codec.Dictionary(content_codec.FORMAT_ZLIB, b"other bytes").id
+    assert content_codec.builtin_dictionary(content_codec.FORMAT_ZLIB).id in content_codec.builtin_dictionary_ids()
+
+def test_corrupt_content_raises_codec_error():
+    """Test that undecodable content raises CodecError instead of a codec-specific exception."""
+    with pytest.raises(content_codec.CodecError):
+        content_codec.decompress(b"definitely not deflate \xff\xfe", content_codec.FORMAT_ZLIB)
+    with pytest.raises(content_codec.CodecError):
+        content_codec.decompress(b"anything", 99)
+
+def test_resolve_format():
+    """Test mapping of DB_COMPRESSION settings to formats."""
+    assert content_codec.resolve_format("off") is None
+    assert content_codec.resolve_format("zlib") == content_codec.FORMAT_ZLIB
+    expected_auto = content_codec.FORMAT_ZSTD if content_codec.zstandard is not None else content_codec.FORMAT_ZLIB
+    assert content_codec.resolve_format("auto") == expected_auto
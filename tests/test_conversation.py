@@ -0,0 +1,62 @@
+import pytest
+import os
+import sys
+import asyncio
+
+# Add project root to the Python path to allow importing 'conversation', 'storage' and 'database'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import config
+import conversation
+import database
+
+@pytest.fixture(autouse=True)
+def short_history(monkeypatch):
+    """Keeps HISTORY_LIMIT small, so a few saves already push messages out of the window."""
+    monkeypatch.setattr(config, 'HISTORY_LIMIT', 3)
+
+def test_prepared_context_matches_full_rebuild(db_file, run_with_storage):
+    """Test that an incrementally maintained context equals formatting the stored history from scratch."""
+    async def scenario(storage):
+        await storage.set_channel_prompt("conv", "Be brief.")
+        for i in range(4):
+            await storage.save_message("conv", "user", f"Question {i}", username=f"user_{i}")
+            await conversation.build_api_messages(storage, "conv")
+            await storage.save_message("conv", "assistant", f"Answer {i}")
+        incremental = await conversation.build_api_messages(storage, "conv")
+        rebuilt = [{"role": "system", "content": "Be brief."}] + conversation.format_history_for_api(await asyncio.to_thread(database.get_history, "conv", 3))
+        return incremental, rebuilt
+
+    incremental, rebuilt = run_with_storage(scenario)
+    assert incremental == rebuilt
+    assert [msg["content"] for msg in incremental[1:]] == ["Answer 2", "Question 3", "Answer 3"]
+    assert incremental[2]["name"] == "user_3"
+
+def test_prepared_context_formats_each_message_once(db_file, run_with_storage, monkeypatch):
+    """Test that repeated mentions reuse formatted messages, and that clears and prompt changes rebuild the context."""
+    formatted = []
+    original_format = conversation.format_message_for_api
+
+    def counting_format(msg):
+        formatted.append(msg["content"])
+        return original_format(msg)
+
+    monkeypatch.setattr(conversation, 'format_message_for_api', counting_format)
+
+    async def scenario(storage):
+        await storage.save_message("conv", "user", "Hello", username="alice")
+        first = await conversation.build_api_messages(storage, "conv")
+        await storage.save_message("conv", "assistant", "Hi there")
+        second = await conversation.build_api_messages(storage, "conv")
+        assert formatted == ["Hello", "Hi there"]
+        assert second[1] is first[1] # Reused, not re-formatted
+
+        await storage.set_channel_prompt("conv", "Speak like a pirate.")
+        assert (await conversation.build_api_messages(storage, "conv"))[0]["content"] == "Speak like a pirate."
+        await storage.clear_conversation_history("conv")
+        return await conversation.build_api_messages(storage, "conv")
+
+    after_clear = run_with_storage(scenario)
+    assert after_clear == [{"role": "system", "content": "Speak like a pirate."}]
+    assert formatted == ["Hello", "Hi there", "Hello", "Hi there"]
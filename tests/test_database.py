@@ -3,6 +3,7 @@ import os
 import sys
 import sqlite3
 import logging
+import threading
 
 # Add project root to the Python path to allow importing 'database' and 'config'
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -10,6 +11,7 @@ sys.path.insert(0, PROJECT_ROOT)
 
 import database
 import config
+import content_codec
 
 # Helper Context Manager for Mocks
 class MockConnectionContextManager:
@@ -129,6 +131,25 @@ def test_clear_history(test_db):
     deleted_count_non_existent = database.clear_conversation_history("non_existent_clear", conn=test_db)
     assert deleted_count_non_existent == 0
 
+def test_delete_history_batch_is_bounded(test_db, monkeypatch):
+    """Test that batched deletes remove the oldest rows first and never go past up_to_id."""
+    for i in range(5):
+        database.save_message("conv", "user", f"Msg {i}", conn=test_db)
+    last_id = database.get_last_message_id("conv", conn=test_db)
+    database.save_message("conv", "user", "Saved during the clear", conn=test_db)
+
+    assert database.delete_history_batch("conv", up_to_id=last_id, batch_size=2, conn=test_db) == 2
+    assert [msg["content"] for msg in database.get_history("conv", conn=test_db)] == ["Msg 2", "Msg 3", "Msg 4", "Saved during the clear"]
+    assert database.delete_history_batch("conv", up_to_id=last_id, batch_size=10, conn=test_db) == 3
+    assert [msg["content"] for msg in database.get_history("conv", conn=test_db)] == ["Saved during the clear"]
+
+    # The synchronous clear loops over batches until the conversation is empty
+    monkeypatch.setattr(config, 'DB_DELETE_BATCH_SIZE', 2)
+    for i in range(4):
+        database.save_message("conv", "user", f"More {i}", conn=test_db)
+    assert database.clear_conversation_history("conv", conn=test_db) == 5
+    assert database.get_last_message_id("conv", conn=test_db) is None
+
 # --- Tests for Prompt Management ---
 
 def test_set_and_get_channel_prompt(test_db):
@@ -342,5 +363,274 @@ def test_delete_prompt_error(mocker, caplog):
     assert deleted is False # Should return False on error
     assert f"Error deleting prompt for channel {conv_id}: Mock delete prompt error" in caplog.text
 
+# --- Tests for Guild Partitioning ---
+
+@pytest.fixture
+def partitioned_db(tmp_path, monkeypatch):
+    """Switches the database module into guild partition mode backed by temporary files."""
+    monkeypatch.setattr(config, 'DB_FILE', str(tmp_path / "shared.db"))
+    monkeypatch.setattr(config, 'DB_PARTITION_MODE', database.PARTITION_MODE_GUILD)
+    monkeypatch.setattr(config, 'DB_PARTITION_DIR', str(tmp_path / "partitions"))
+    database.close_partition_pool()
+    database.init_db()
+    yield tmp_path
+    database.close_partition_pool()
+
+def test_guild_partition_routing(partitioned_db):
+    """Test that conversations are routed to their guild's file, and DMs to the shared file."""
+    database.save_message("chan_a", "user", "In guild 1", guild_id="1")
+    database.save_message("chan_b", "user", "In guild 2", guild_id="2")
+    database.save_message("dm_chan", "user", "In a DM")
+    database.set_channel_prompt("chan_a", "Guild 1 prompt", guild_id="1")
+
+    assert os.path.exists(database.partition_path("1"))
+    assert os.path.exists(database.partition_path("2"))
+    assert database.get_history("chan_a", guild_id="1")[0]["content"] == "In guild 1"
+    assert database.get_history("chan_a", guild_id="2") == [] # Not visible from another partition
+    assert database.get_history("dm_chan")[0]["content"] == "In a DM"
+    assert database.get_channel_prompt("chan_a", guild_id="1") == "Guild 1 prompt"
+    assert database.clear_conversation_history("chan_b", guild_id="2") == 1
+
+def test_partition_pool_is_bounded(tmp_path):
+    """Test that the connection pool evicts and closes the least recently used handle."""
+    pool = database.ConnectionPool(2, database.open_connection)
+    first = pool.get(str(tmp_path / "a.db"))
+    pool.get(str(tmp_path / "b.db"))
+    pool.get(str(tmp_path / "a.db")) # Touch 'a' so 'b' becomes least recently used
+    pool.get(str(tmp_path / "c.db"))
+
+    assert len(pool) == 2
+    assert str(tmp_path / "b.db") not in pool
+    assert pool.get(str(tmp_path / "a.db")) is first
+    pool.close_all()
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.execute("SELECT 1")
+
+def test_split_into_guild_partitions(partitioned_db):
+    """Test migrating a monolithic database into per-guild partitions."""
+    shared = sqlite3.connect(config.DB_FILE)
+    shared.row_factory = sqlite3.Row
+    database.save_message("chan_a", "user", "First", username="alice", conn=shared)
+    database.save_message("chan_a", "assistant", "Second", conn=shared)
+    database.save_message("chan_b", "user", "Other guild", conn=shared)
+    database.save_message("dm_chan", "user", "Unmapped", conn=shared)
+    database.set_channel_prompt("chan_a", "Moved prompt", conn=shared)
+    shared.close()
+
+    moved = database.split_into_guild_partitions({"chan_a": "1", "chan_b": "2"})
+
+    assert moved == {"1": 2, "2": 1}
+    history = database.get_history("chan_a", guild_id="1")
+    assert [msg["content"] for msg in history] == ["First", "Second"]
+    assert history[0]["username"] == "alice"
+    assert database.get_channel_prompt("chan_a", guild_id="1") == "Moved prompt"
+    assert database.get_history("chan_b", guild_id="2")[0]["content"] == "Other guild"
+    # Unmapped conversations stay behind, and moved ones are gone from the shared file
+    assert database.get_history("dm_chan")[0]["content"] == "Unmapped"
+    assert database.get_history("chan_a") == []
+    assert database.get_channel_prompt("chan_a") is None
+
+def test_split_keeps_newer_partition_prompt(partitioned_db):
+    """Test that a prompt already set in the partition is not overwritten by the shared file's older one."""
+    shared = sqlite3.connect(config.DB_FILE)
+    database.save_message("chan_a", "user", "Before the split", conn=shared)
+    database.set_channel_prompt("chan_a", "OLD prompt", conn=shared)
+    shared.close()
+    database.set_channel_prompt("chan_a", "NEW prompt", guild_id="1")
+
+    database.split_into_guild_partitions({"chan_a": "1"})
+
+    assert database.get_channel_prompt("chan_a", guild_id="1") == "NEW prompt"
+    assert database.get_channel_prompt("chan_a") is None
+
+def test_storage_stats_span_partitions(partitioned_db):
+    """Test that storage stats cover the shared file and every guild partition."""
+    database.save_message("chan_a", "user", "One", guild_id="1")
+    database.save_message("chan_a", "user", "Two", guild_id="1")
+    database.save_message("dm_chan", "user", "Three")
+
+    stats = {entry["guild_id"]: entry for entry in database.get_storage_stats()}
+
+    assert stats[None]["messages"] == 1
+    assert stats["1"]["messages"] == 2
+    assert stats["1"]["conversations"] == 1
+
+# --- Tests for Content Compression ---
+
+@pytest.fixture
+def file_db(tmp_path, monkeypatch):
+    """A file-backed database with compression on for messages of 100+ characters."""
+    monkeypatch.setattr(config, 'DB_FILE', str(tmp_path / "history.db"))
+    monkeypatch.setattr(config, 'DB_COMPRESSION', 'zlib')
+    monkeypatch.setattr(config, 'DB_COMPRESSION_THRESHOLD', 100)
+    database.init_db()
+    return tmp_path
+
+def raw_rows(conversation_id):
+    conn = sqlite3.connect(config.DB_FILE)
+    try:
+        return conn.execute("SELECT content, content_format, dict_id FROM messages WHERE conversation_id = ? ORDER BY id", (conversation_id,)).fetchall()
+    finally:
+        conn.close()
+
+def test_long_messages_are_stored_compressed(file_db):
+    """Test that only messages above the threshold are compressed, and history reads them back transparently."""
+    long_text = "A long, thoughtful reply about cheese. " * 20
+    database.save_message("conv", "user", "Short question?", username="alice")
+    database.save_message("conv", "assistant", long_text)
+
+    rows = raw_rows("conv")
+    assert rows[0] == ("Short question?", 0, None)
+    assert rows[1][1] == content_codec.FORMAT_ZLIB
+    assert len(rows[1][0]) < len(long_text)
+    history = database.get_history("conv")
+    assert [msg["content"] for msg in history] == ["Short question?", long_text]
+    assert database.get_storage_stats()[0]["compressed"] == 1
+
+def test_history_limit_returns_newest_in_order(file_db):
+    """Test that the limited query returns the newest rows, oldest first."""
+    for i in range(5):
+        database.save_message("conv", "user", f"Msg {i}")
+    assert [msg["content"] for msg in database.get_history("conv", limit=2)] == ["Msg 3", "Msg 4"]
+
+def test_compress_existing_with_dictionary(file_db, monkeypatch):
+    """Test the background pass: plain rows get compressed against the built-in dictionary, in resumable batches."""
+    monkeypatch.setattr(config, 'DB_COMPRESSION', 'off')
+    texts = [f"Message {i}: the moon is made of a particularly pleasant aged gouda, I think. " * 3 for i in range(80)]
+    for text in texts:
+        database.save_message("conv", "user", text)
+    assert all(fmt == 0 for _, fmt, _ in raw_rows("conv"))
+
+    monkeypatch.setattr(config, 'DB_COMPRESSION', 'zlib')
+    assert database.compress_existing(batch_size=50) == (50, False)
+    assert database.compress_existing(batch_size=50) == (30, True)
+    assert database.compress_existing(batch_size=50) == (0, True) # Resumes after the last scanned ID
+    assert {dict_id for _, _, dict_id in raw_rows("conv")} == {content_codec.builtin_dictionary(content_codec.FORMAT_ZLIB).id}
+    assert [msg["content"] for msg in database.get_history("conv", limit=100)] == texts
+
+def save_with_trained_dictionary(conversation_id, texts, path=None):
+    """Stores texts the way earlier versions did: zlib-compressed against a dictionary made of message text."""
+    trained = content_codec.Dictionary(content_codec.FORMAT_ZLIB, "".join(texts).encode())
+    conn = sqlite3.connect(path or config.DB_FILE)
+    try:
+        conn.execute("INSERT INTO compression_dicts (id, format, data) VALUES (?, ?, ?)", (trained.id, trained.format, trained.data))
+        for text in texts:
+            conn.execute(
+                "INSERT INTO messages (conversation_id, role, content, content_format, dict_id) VALUES (?, 'user', ?, ?, ?)",
+                (conversation_id, content_codec.compress(text, trained.format, trained), trained.format, trained.id),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return trained
+
+def dictionary_data(path=None):
+    conn = sqlite3.connect(path or config.DB_FILE)
+    try:
+        return {row[0]: bytes(row[1]) for row in conn.execute("SELECT id, data FROM compression_dicts")}
+    finally:
+        conn.close()
+
+def test_trained_dictionaries_are_retired(file_db, monkeypatch):
+    """Test that rows compressed against a dictionary of message text are rewritten in batches, then the dictionary is deleted."""
+    monkeypatch.setattr(config, 'DB_COMPRESSION', 'zlib')
+    texts = [f"Secret {i}: my bank PIN is 4321, please keep it safe for me. " * 3 for i in range(30)]
+    trained = save_with_trained_dictionary("conv", texts)
+    database.save_message("conv", "user", "Short and plain")
+
+    assert database.retire_trained_dictionaries(batch_size=20) == (20, False)
+    assert trained.id in dictionary_data() # Still needed by the rows not yet rewritten
+    assert database.retire_trained_dictionaries(batch_size=20) == (10, True)
+    assert database.retire_trained_dictionaries(batch_size=20) == (0, True)
+
+    builtin_id = content_codec.builtin_dictionary(content_codec.FORMAT_ZLIB).id
+    assert set(dictionary_data()) == {builtin_id}
+    assert not any(b"4321" in data for data in dictionary_data().values())
+    assert {dict_id for _, fmt, dict_id in raw_rows("conv") if fmt} == {builtin_id}
+    assert [msg["content"] for msg in database.get_history("conv", limit=100)] == texts + ["Short and plain"]
+
+def test_legacy_schema_is_upgraded(tmp_path, monkeypatch):
+    """Test that files created before compression gain the new columns, even when first opened read-only."""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, username TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute("INSERT INTO messages (conversation_id, role, content) VALUES ('conv', 'user', 'Old message')")
+    conn.commit()
+    conn.close()
+
+    reader = database.open_connection(path, read_only=True)
+    try:
+        assert [msg["content"] for msg in database.get_history("conv", conn=reader)] == ["Old message"]
+    finally:
+        reader.close()
+
+def test_concurrent_first_opens_upgrade_once(tmp_path):
+    """Test that reader threads opening a legacy file at the same time all succeed (only one runs the upgrade)."""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, username TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    conn.commit()
+    conn.close()
+
+    errors = []
+    readers = []
+    start = threading.Barrier(8)
+
+    def open_reader():
+        start.wait()
+        try:
+            readers.append(database.open_connection(path, read_only=True))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_reader) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for reader in readers:
+        reader.close()
+    assert errors == []
+    assert database._schema_is_current(path)
+
+def test_init_db_upgrades_partitions(partitioned_db):
+    """Test that init_db brings existing legacy partition files up to the current schema."""
+    path = database.partition_path("7")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, username TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    conn.commit()
+    conn.close()
+
+    database.init_db()
+    assert database._schema_is_current(path)
+
+def test_split_keeps_compressed_rows_readable(partitioned_db, monkeypatch):
+    """Test that compressed rows are re-encoded against the partition's own dictionary rather than copying the shared one."""
+    monkeypatch.setattr(config, 'DB_COMPRESSION', 'zlib')
+    monkeypatch.setattr(config, 'DB_COMPRESSION_THRESHOLD', 10)
+    texts = ["a long reply about cheese in guild one, again and again", "and another long one about the quiet evening"]
+    save_with_trained_dictionary("chan_a", texts)
+    save_with_trained_dictionary("chan_b", ["a private note from guild two that must stay there"])
+    database._dictionaries.clear() # Force a lookup in the partition file
+
+    database.split_into_guild_partitions({"chan_a": "1"})
+
+    assert [msg["content"] for msg in database.get_history("chan_a", guild_id="1")] == texts
+    partition_dictionaries = dictionary_data(database.partition_path("1"))
+    assert set(partition_dictionaries) == {content_codec.builtin_dictionary(content_codec.FORMAT_ZLIB).id}
+    assert not any(b"guild two" in data for data in partition_dictionaries.values())
+
+def test_rank_active_conversations(file_db):
+    """Test that conversations are ranked by their newest message, most recent first."""
+    conn = sqlite3.connect(config.DB_FILE)
+    for conversation_id, timestamp in [("old", "2024-01-01 10:00:00"), ("new", "2024-03-01 10:00:00"),
+                                       ("old", "2024-02-01 10:00:00"), ("middle", "2024-02-15 10:00:00")]:
+        conn.execute("INSERT INTO messages (conversation_id, role, content, timestamp) VALUES (?, 'user', 'hi', ?)", (conversation_id, timestamp))
+    conn.commit()
+    conn.close()
+
+    assert [row[0] for row in database.rank_active_conversations(10)] == ["new", "middle", "old"]
+    assert database.rank_active_conversations(1) == [("new", "2024-03-01 10:00:00")]
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
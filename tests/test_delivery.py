@@ -0,0 +1,137 @@
+import pytest
+import os
+import sys
+import asyncio
+import time
+from types import SimpleNamespace
+
+import discord
+
+# Add project root to the Python path to allow importing 'delivery'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import logging_setup
+from delivery import Delivery, split_message
+
+class RecordingChannel:
+    """Records sends (with a shared log across channels); fails the first `failures` sends with a server error."""
+
+    def __init__(self, channel_id, log, latency=0.0, failures=0):
+        self.id = channel_id
+        self.log = log
+        self.latency = latency
+        self.failures = failures
+
+    async def send(self, content):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failures:
+            self.failures -= 1
+            raise discord.DiscordServerError(SimpleNamespace(status=503, reason="Service Unavailable"), "try again")
+        self.log.append((self.id, content))
+        return SimpleNamespace(id=len(self.log), content=content)
+
+def test_split_message_respects_limit_and_paragraphs():
+    """Test that long text is cut at paragraph breaks and every chunk fits."""
+    paragraphs = [f"Paragraph {i}: " + "words " * 60 for i in range(12)]
+    chunks = split_message("\n\n".join(paragraphs), limit=1000)
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert all(chunk.startswith("Paragraph") and chunk.endswith("words ") for chunk in chunks)
+    assert "\n\n".join(chunks) == "\n\n".join(paragraphs)
+    assert split_message("short") == ["short"]
+
+def test_split_message_reopens_code_blocks():
+    """Test that a code block cut between chunks is closed and reopened with its language tag."""
+    code = "\n".join(f"value_{i} = compute({i})" for i in range(100))
+    chunks = split_message(f"Here you go:\n```python\n{code}\n```\nDone.", limit=500)
+    assert len(chunks) > 2
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    for chunk in chunks[:-1]:
+        assert chunk.count("```") % 2 == 0 # Every chunk renders on its own
+    assert all(chunk.startswith("```python\n") for chunk in chunks[1:])
+    body = "".join(chunk.replace("```python\n", "").replace("\n```", "\n") for chunk in chunks)
+    assert all(f"value_{i} = compute({i})" in body for i in range(100))
+
+def test_replies_stay_ordered_per_channel_and_parallel_across_channels():
+    """Test that chunks of concurrent replies never interleave within a channel, while channels send in parallel."""
+    log = []
+
+    async def scenario():
+        delivery = Delivery(channel_rate=0, global_rate=0)
+        channels = [RecordingChannel(c, log, latency=0.02) for c in range(4)]
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            delivery.send(channel, f"{'x' * 2500} reply {r}") for r in range(3) for channel in channels
+        ))
+        return time.perf_counter() - started, delivery.metrics.snapshot()
+
+    elapsed, metrics = asyncio.run(scenario())
+    for c in range(4):
+        sent = [content for channel_id, content in log if channel_id == c]
+        assert len(sent) == 6
+        assert [content[-7:] for content in sent[1::2]] == [f"reply {r}" for r in range(3)]
+    assert elapsed < 6 * 0.02 * 4 # Channels overlapped rather than running one after another
+    assert metrics["replies"] == 12 and metrics["chunks"] == 24
+
+def test_buckets_throttle_before_sending():
+    """Test that a channel's bucket spaces out sends beyond its capacity instead of sending a burst."""
+    log = []
+
+    async def scenario():
+        delivery = Delivery(channel_rate=2, channel_period=0.2, global_rate=0)
+        channel = RecordingChannel(1, log)
+        started = time.perf_counter()
+        await asyncio.gather(*(delivery.send(channel, f"Reply {i}") for i in range(4)))
+        return time.perf_counter() - started, delivery.metrics.snapshot()
+
+    elapsed, metrics = asyncio.run(scenario())
+    assert [content for _, content in log] == [f"Reply {i}" for i in range(4)]
+    assert elapsed >= 0.18 # Two sends had to wait for tokens
+    assert metrics["throttled"] == 2
+
+def test_server_errors_are_retried():
+    """Test that transient server errors are retried and counted, and persistent ones surface to the caller."""
+    log = []
+
+    async def scenario():
+        delivery = Delivery(channel_rate=0, global_rate=0, max_retries=1)
+        await delivery.send(RecordingChannel(1, log, failures=1), "Eventually")
+        with pytest.raises(discord.DiscordServerError):
+            await delivery.send(RecordingChannel(2, log, failures=2), "Never")
+        await delivery.send(RecordingChannel(2, log), "Next reply")
+        return delivery.metrics.snapshot()
+
+    metrics = asyncio.run(scenario())
+    assert log == [(1, "Eventually"), (2, "Next reply")]
+    assert metrics["retries"] == 2
+    assert metrics["failures"] == 1
+
+def test_sends_log_under_each_senders_correlation_id(caplog):
+    """Test that retries of every reply on a lane are logged with that reply's correlation ID, not the first sender's."""
+    log = []
+
+    class FirstAttemptFails(RecordingChannel):
+        async def send(self, content):
+            if content not in self.attempted:
+                self.attempted.add(content)
+                self.failures = 1
+            return await super().send(content)
+
+    async def scenario():
+        delivery = Delivery(channel_rate=0, global_rate=0, max_retries=1)
+        channel = FirstAttemptFails(1, log)
+        channel.attempted = set()
+
+        async def reply(message_id):
+            logging_setup.set_correlation_id(message_id)
+            await delivery.send(channel, f"Reply to {message_id}")
+
+        await asyncio.gather(reply("first"), reply("second"))
+
+    caplog.handler.addFilter(logging_setup.CorrelationIdFilter())
+    with caplog.at_level("WARNING"):
+        asyncio.run(scenario())
+    retries = [record for record in caplog.records if "retry" in record.getMessage()]
+    assert [record.correlation_id for record in retries] == ["first", "second"]
+    assert log == [(1, "Reply to first"), (1, "Reply to second")]
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+
+# Add project root to the Python path to allow importing 'diagnostics' and 'config'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import diagnostics
+
+def busy_wait(seconds):
+    """Burns CPU on the calling thread, standing in for a blocking callback."""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+def test_sampling_profiler_finds_hot_function():
+    """Test that the profiler attributes samples to the function hogging the sampled thread."""
+    profiler = diagnostics.SamplingProfiler(threading.get_ident(), interval=0.001)
+    sampler = threading.Thread(target=profiler.run, args=(0.2,))
+    sampler.start()
+    busy_wait(0.25)
+    sampler.join()
+
+    assert profiler.samples > 0
+    hottest = profiler.self_counts.most_common(1)[0][0]
+    assert hottest[2] == "busy_wait"
+    report = profiler.report()
+    assert "busy_wait (test_diagnostics.py:" in report
+
+def test_sampling_profiler_empty_report():
+    """Test the report when nothing was sampled."""
+    assert diagnostics.SamplingProfiler(thread_id=-1).report() == "No samples collected."
+
+def test_loop_lag_monitor_reports_blocking_stack(caplog):
+    """Test that a blocked loop is reported once, with the blocking function in the logged stack."""
+    monitor = diagnostics.LoopLagMonitor(interval=0.02, warn_threshold=0.05, stall_threshold=0.1)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        busy_wait(0.3) # Block the loop
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(scenario())
+
+    stats = monitor.stats()
+    assert stats["stalls"] == 1
+    assert stats["max"] >= 0.2
+    assert "Event loop blocked for" in caplog.text
+    assert "busy_wait" in caplog.text
+    assert "Event loop lag:" in caplog.text
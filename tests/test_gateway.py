@@ -0,0 +1,94 @@
+import pytest
+import os
+import sys
+import logging
+
+# Add project root to the Python path to allow importing 'gateway' and 'config'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import config
+import gateway
+
+def test_minimal_profile_drops_member_and_message_caches():
+    """Test that the minimal profile keeps only the intents the cogs need and disables caches."""
+    options = gateway.build_client_options(gateway.PROFILE_MINIMAL)
+    intents = options["intents"]
+
+    assert intents.message_content and intents.guild_messages and intents.dm_messages and intents.guilds
+    assert not intents.members
+    assert not intents.presences
+    assert options["member_cache_flags"].value == 0
+    assert options["max_messages"] is None
+    assert options["chunk_guilds_at_startup"] is False
+
+def test_default_profile_matches_previous_behavior():
+    """Test that the default profile keeps the members intent and discord.py's caches."""
+    options = gateway.build_client_options(gateway.PROFILE_DEFAULT)
+
+    assert options["intents"].members and options["intents"].message_content
+    assert options["max_messages"] == 1000
+    assert options["chunk_guilds_at_startup"] is True
+
+def test_profile_comes_from_config(monkeypatch):
+    """Test that create_bot uses MEMORY_PROFILE when no profile is passed."""
+    monkeypatch.setattr(config, 'MEMORY_PROFILE', gateway.PROFILE_MINIMAL)
+    bot = gateway.create_bot()
+
+    assert bot._connection.max_messages is None
+    assert not bot.intents.members
+    assert bot.command_prefix == "$"
+
+def test_unknown_profile_falls_back_to_default(caplog):
+    """Test that an unknown profile warns and uses the default settings."""
+    with caplog.at_level(logging.WARNING):
+        options = gateway.build_client_options("tiny")
+    assert options["intents"].members
+    assert "Unknown MEMORY_PROFILE 'tiny'" in caplog.text
+
+def test_parse_shard_ids():
+    """Test shard ID specs with ranges, lists and blanks."""
+    assert gateway.parse_shard_ids("") is None
+    assert gateway.parse_shard_ids("0-3") == [0, 1, 2, 3]
+    assert gateway.parse_shard_ids("4, 0-1 ,1") == [0, 1, 4]
+
+def test_sharded_bot_runs_configured_subset(monkeypatch):
+    """Test that SHARDING builds an AutoShardedBot limited to SHARD_IDS."""
+    monkeypatch.setattr(config, 'SHARDING', True)
+    monkeypatch.setattr(config, 'SHARD_COUNT', 8)
+    monkeypatch.setattr(config, 'SHARD_IDS', "2-3")
+    bot = gateway.create_bot(gateway.PROFILE_MINIMAL)
+
+    assert isinstance(bot, gateway.commands.AutoShardedBot)
+    assert bot.shard_count == 8
+    assert bot.shard_metrics.shard_ids() == [2, 3]
+
+def test_shard_ids_require_shard_count(monkeypatch):
+    """Test that a shard subset without a total shard count is rejected."""
+    monkeypatch.setattr(config, 'SHARDING', True)
+    monkeypatch.setattr(config, 'SHARD_COUNT', None)
+    monkeypatch.setattr(config, 'SHARD_IDS', "0")
+    with pytest.raises(ValueError):
+        gateway.create_bot()
+
+def test_shard_metrics_count_events_per_shard(monkeypatch):
+    """Test that parsed gateway events are attributed to the shard owning their guild."""
+    monkeypatch.setattr(config, 'SHARDING', True)
+    monkeypatch.setattr(config, 'SHARD_COUNT', 2)
+    monkeypatch.setattr(config, 'SHARD_IDS', "")
+    bot = gateway.create_bot(gateway.PROFILE_MINIMAL)
+    metrics = bot.shard_metrics
+    guild_on_shard_1 = str(1 << 22) # (guild_id >> 22) % 2 == 1
+
+    metrics.record("MESSAGE_CREATE", {"guild_id": guild_on_shard_1})
+    metrics.record("GUILD_UPDATE", {"id": guild_on_shard_1})
+    metrics.record("MESSAGE_CREATE", {"channel_id": "5"}) # DM -> shard 0
+    # Parsers are wrapped, so events that reach the connection state are counted too
+    bot._connection.parsers["TYPING_START"]({"guild_id": guild_on_shard_1, "channel_id": "1", "user_id": "2", "timestamp": 0})
+
+    assert metrics.events[1] == 3
+    assert metrics.events[0] == 1
+    assert metrics.rate(1) == pytest.approx(3 / metrics.RATE_WINDOW)
+    snapshot = {shard["shard_id"]: shard for shard in metrics.snapshot()}
+    assert set(snapshot) == {0, 1}
+    assert snapshot[1]["events"] == 3
@@ -0,0 +1,96 @@
+import pytest
+import os
+import sys
+import time
+
+# Add project root to the Python path to allow importing 'job_queue'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import job_queue
+from job_queue import JobQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    """A job queue in a temporary file."""
+    jobs = JobQueue(str(tmp_path / "jobs.db"), max_attempts=2)
+    yield jobs
+    jobs.close()
+
+def test_enqueue_dedups_by_message_id(queue):
+    """Test that the same Discord message is only queued once."""
+    assert queue.enqueue(1, 10, "900", {"content": "Hello", "username": "alice"}) is True
+    assert queue.enqueue(1, 10, "900", {"content": "Hello", "username": "alice"}) is False
+    assert queue.counts() == {job_queue.QUEUED: 1}
+
+    jobs = queue.claim("w1", limit=5)
+    assert [job.message_id for job in jobs] == ["1"]
+    assert jobs[0].payload == {"content": "Hello", "username": "alice"}
+    assert jobs[0].guild_id == "900"
+    assert queue.claim("w2", limit=5) == [] # Leased to w1
+
+def test_job_round_trip(queue):
+    """Test a job moving from worker to gateway and being acknowledged."""
+    queue.enqueue(1, 10, None, {"content": "Hi", "username": "bob"})
+    job = queue.claim("w1")[0]
+    queue.mark_user_saved(job.message_id, "w1")
+    assert queue.complete(job.message_id, "w1", "Hello, bob.") is True
+
+    replies = queue.claim_responses("gw")
+    assert [(reply.channel_id, reply.response) for reply in replies] == [("10", "Hello, bob.")]
+    assert queue.ack_response("1", "gw") is True
+    assert queue.counts() == {job_queue.DONE: 1}
+    # A late duplicate of the finished message is still ignored until purged
+    assert queue.enqueue(1, 10, None, {"content": "Hi", "username": "bob"}) is False
+    assert queue.purge(older_than=0) == 1
+
+def test_expired_lease_is_redelivered(queue):
+    """Test that a job whose worker stopped responding is claimed again, and the stale owner can't complete it."""
+    queue.enqueue(1, 10, None, {"content": "Hi", "username": "bob"})
+    first = queue.claim("w1", lease=0.01)[0]
+    queue.mark_user_saved(first.message_id, "w1")
+    time.sleep(0.02)
+
+    retry = queue.claim("w2")[0]
+    assert retry.message_id == "1"
+    assert retry.attempts == 2
+    assert retry.user_saved is True # w1 already saved the user message
+    assert queue.complete("1", "w1", "stale reply") is False
+    assert queue.complete("1", "w2", "fresh reply") is True
+    assert queue.claim_responses("gw")[0].response == "fresh reply"
+
+def test_expired_lease_fails_job_after_max_attempts(queue):
+    """Test that a job whose lease keeps expiring is marked failed once it used up max_attempts, not leased forever."""
+    queue.enqueue(1, 10, None, {"content": "Hi", "username": "bob"})
+    assert queue.claim("w1", lease=0.01)[0].attempts == 1
+    time.sleep(0.02)
+    assert queue.claim("w2", lease=0.01)[0].attempts == 2
+    time.sleep(0.02)
+
+    assert queue.claim("w3") == []
+    assert queue.counts() == {job_queue.FAILED: 1}
+
+def test_release_fails_job_after_max_attempts(queue):
+    """Test that released jobs are retried until max_attempts, then marked failed."""
+    queue.enqueue(1, 10, None, {"content": "Hi", "username": "bob"})
+    queue.release(queue.claim("w1")[0].message_id, "w1")
+    assert queue.counts() == {job_queue.QUEUED: 1}
+    queue.release(queue.claim("w1")[0].message_id, "w1")
+    assert queue.counts() == {job_queue.FAILED: 1}
+    assert queue.claim("w1") == []
+
+def test_released_response_is_sent_again(queue):
+    """Test that a reply that failed to send goes back to the gateway queue."""
+    queue.enqueue(1, 10, None, {"content": "Hi", "username": "bob"})
+    queue.complete(queue.claim("w1")[0].message_id, "w1", "Hello")
+    queue.release_response(queue.claim_responses("gw")[0].message_id, "gw")
+    assert [reply.response for reply in queue.claim_responses("gw")] == ["Hello"]
+
+def test_claim_responses_skips_busy_channels(queue):
+    """Test that replies to channels still being sent to stay queued for a later claim."""
+    for message_id, channel_id in [(1, 10), (2, 20), (3, 10)]:
+        queue.enqueue(message_id, channel_id, None, {"content": "Hi", "username": "bob"})
+        queue.complete(queue.claim("w1")[0].message_id, "w1", f"Reply {message_id}")
+
+    assert [reply.message_id for reply in queue.claim_responses("gw", skip_channels=("10",))] == ["2"]
+    assert [reply.message_id for reply in queue.claim_responses("gw")] == ["1", "3"]
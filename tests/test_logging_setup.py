@@ -0,0 +1,72 @@
+import pytest
+import os
+import sys
+import json
+import asyncio
+import logging
+import threading
+
+# Add project root to the Python path to allow importing 'logging_setup' and 'config'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import logging_setup
+
+@pytest.fixture
+def restore_root_logger():
+    """Restores the root logger's handlers and level after a test reconfigures logging."""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    logging_setup.stop_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+def test_json_output_with_correlation_id(restore_root_logger, capsys):
+    """Test that JSON lines carry the correlation ID of the task that logged them."""
+    logging_setup.setup_logging(level="INFO", json_output=True)
+
+    async def handle(message_id):
+        logging_setup.set_correlation_id(message_id)
+        await asyncio.sleep(0)
+        logging.info("handled %s", message_id)
+
+    async def main():
+        await asyncio.gather(handle(111), handle(222))
+
+    asyncio.run(main())
+    logging_setup.stop_logging()
+
+    entries = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    by_message = {entry["message"]: entry for entry in entries}
+    assert by_message["handled 111"]["correlation_id"] == "111"
+    assert by_message["handled 222"]["correlation_id"] == "222"
+    assert by_message["handled 111"]["level"] == "INFO"
+
+def test_messages_are_formatted_on_listener_thread(restore_root_logger, capsys):
+    """Test that %-style arguments are rendered off the logging thread."""
+    formatted_on = []
+
+    class Probe:
+        def __str__(self):
+            formatted_on.append(threading.current_thread())
+            return "probe"
+
+    logging_setup.setup_logging(level="INFO", json_output=False)
+    logging.info("value: %s", Probe())
+    logging_setup.stop_logging()
+
+    assert "value: probe" in capsys.readouterr().err
+    assert formatted_on and formatted_on[0] is not threading.current_thread()
+
+def test_filtered_records_are_never_formatted(restore_root_logger):
+    """Test that records below the configured level skip formatting entirely."""
+    class Exploding:
+        def __str__(self):
+            raise AssertionError("debug message should not be formatted")
+
+    logging_setup.setup_logging(level="INFO", json_output=False)
+    logging.debug("expensive: %s", Exploding())
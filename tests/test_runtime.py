@@ -0,0 +1,66 @@
+import pytest
+import os
+import sys
+import asyncio
+import builtins
+import logging
+
+# Add project root to the Python path to allow importing 'runtime' and 'config'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import config
+import runtime
+
+@pytest.fixture
+def without_uvloop(monkeypatch):
+    """Makes 'import uvloop' fail as if it were not installed."""
+    real_import = builtins.__import__
+
+    def fake_import(name, *args, **kwargs):
+        if name == "uvloop":
+            raise ImportError("No module named 'uvloop'")
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', fake_import)
+
+def test_asyncio_preference():
+    """Test that 'asyncio' always selects the standard loop."""
+    assert runtime.select_loop_factory("asyncio") == (None, runtime.LOOP_ASYNCIO)
+
+def test_auto_falls_back_silently(without_uvloop, caplog):
+    """Test that 'auto' falls back to asyncio without a warning when uvloop is missing."""
+    with caplog.at_level(logging.WARNING):
+        assert runtime.select_loop_factory("auto") == (None, runtime.LOOP_ASYNCIO)
+    assert caplog.text == ""
+
+def test_explicit_uvloop_falls_back_with_warning(without_uvloop, caplog):
+    """Test that requiring uvloop without it installed warns and falls back."""
+    with caplog.at_level(logging.WARNING):
+        assert runtime.select_loop_factory("uvloop") == (None, runtime.LOOP_ASYNCIO)
+    assert "uvloop is not installed" in caplog.text
+
+def test_run_configures_default_executor(monkeypatch):
+    """Test that configure_loop sizes the executor used by asyncio.to_thread."""
+    monkeypatch.setattr(config, 'DEFAULT_EXECUTOR_WORKERS', 3)
+
+    async def main():
+        runtime.configure_loop()
+        loop = asyncio.get_running_loop()
+        await asyncio.to_thread(lambda: None)
+        return loop._default_executor._max_workers, runtime.describe_loop()
+
+    workers, description = runtime.run(main, "asyncio")
+    assert workers == 3
+    assert description.startswith("asyncio (")
+
+def test_startup_timer_phases():
+    """Test that startup phases are measured back to back and summed into the total."""
+    timer = runtime.StartupTimer()
+    timer.mark("imports")
+    timer.finish("connect")
+
+    assert [name for name, _ in timer.phases] == ["imports", "connect"]
+    assert timer.finished
+    assert timer.total == pytest.approx(sum(seconds for _, seconds in timer.phases))
+    assert timer.report().startswith("Startup timing: imports ")
@@ -0,0 +1,316 @@
+import pytest
+import os
+import sys
+import asyncio
+import sqlite3
+import threading
+
+# Add project root to the Python path to allow importing 'storage', 'database' and 'config'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import config
+import content_codec
+import conversation
+import database
+from storage import Storage
+
+def test_read_your_writes(db_file, run_with_storage):
+    """Test that a read issued right after a write (without awaiting it) sees that write."""
+    async def scenario(storage):
+        save = asyncio.create_task(storage.save_message("conv", "user", "Hello", username="alice"))
+        await asyncio.sleep(0) # Let the save get queued, but don't wait for it to commit
+        history = await storage.get_history("conv", limit=5)
+        await save
+        return history
+
+    history = run_with_storage(scenario)
+    assert [msg["content"] for msg in history] == ["Hello"]
+    assert history[0]["username"] == "alice"
+
+def test_writes_are_serialized_in_order(db_file, run_with_storage):
+    """Test that concurrent writes commit in submission order."""
+    async def scenario(storage):
+        await asyncio.gather(*(storage.save_message("conv", "user", f"Msg {i}") for i in range(50)))
+        return await storage.get_history("conv", limit=50)
+
+    history = run_with_storage(scenario)
+    assert [msg["content"] for msg in history] == [f"Msg {i}" for i in range(50)]
+
+def test_prompt_round_trip(db_file, run_with_storage):
+    """Test prompt set/get/delete and history clearing through the async API."""
+    async def scenario(storage):
+        assert await storage.set_channel_prompt("conv", "Be brief.") is True
+        assert await storage.get_channel_prompt("conv") == "Be brief."
+        assert await storage.delete_channel_prompt("conv") is True
+        assert await storage.get_channel_prompt("conv") is None
+        await storage.save_message("conv", "user", "To clear")
+        assert await storage.clear_conversation_history("conv") == 1
+        return await storage.get_history("conv")
+
+    assert run_with_storage(scenario) == []
+
+def test_reads_use_reader_threads(db_file, run_with_storage):
+    """Test that reads run on the reader pool while writes stay on the single writer thread."""
+    seen_threads = {"read": set(), "write": set()}
+    original_get_history = database.get_history
+    original_save_message = database.save_message
+
+    def tracking_get_history(*args, **kwargs):
+        seen_threads["read"].add(threading.current_thread().name)
+        return original_get_history(*args, **kwargs)
+
+    def tracking_save_message(*args, **kwargs):
+        seen_threads["write"].add(threading.current_thread().name)
+        return original_save_message(*args, **kwargs)
+
+    async def scenario(storage):
+        await asyncio.gather(*(storage.save_message(f"conv{i}", "user", "Hi") for i in range(10)))
+        await asyncio.gather(*(storage.get_history(f"conv{i}") for i in range(10)))
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(database, 'get_history', tracking_get_history)
+        mp.setattr(database, 'save_message', tracking_save_message)
+        run_with_storage(scenario)
+
+    assert len(seen_threads["write"]) == 1
+    assert all(name.startswith("db-writer") for name in seen_threads["write"])
+    assert all(name.startswith("db-reader") for name in seen_threads["read"])
+
+def test_close_flushes_queued_writes(db_file, run_with_storage):
+    """Test that closing the storage commits writes that were still queued."""
+    async def scenario(storage):
+        for i in range(5):
+            asyncio.create_task(storage.save_message("conv", "user", f"Msg {i}"))
+        await asyncio.sleep(0)
+
+    run_with_storage(scenario)
+    assert len(database.get_history("conv", limit=10)) == 5
+
+def test_requires_start(db_file):
+    """Test that using the storage before start() raises a clear error."""
+    with pytest.raises(RuntimeError):
+        asyncio.run(Storage().get_history("conv"))
+
+def test_compression_pass_keeps_no_message_text(db_file, monkeypatch, run_with_storage):
+    """Test the background pass: it retires a dictionary trained on messages and compresses older rows, so a clear leaves no text behind."""
+    monkeypatch.setattr(config, 'DB_COMPRESSION_THRESHOLD', 100)
+    secret = "Please remember that my bank PIN is 4321, thank you so much. " * 3
+    trained = content_codec.Dictionary(content_codec.FORMAT_ZLIB, secret.encode() * 20)
+    conn = sqlite3.connect(config.DB_FILE)
+    conn.execute("INSERT INTO compression_dicts (id, format, data) VALUES (?, ?, ?)", (trained.id, trained.format, trained.data))
+    conn.execute(
+        "INSERT INTO messages (conversation_id, role, content, content_format, dict_id) VALUES ('conv', 'user', ?, ?, ?)",
+        (content_codec.compress(secret, trained.format, trained), trained.format, trained.id),
+    )
+    conn.commit()
+    conn.close()
+    texts = [f"Reply {i}: some contemplative words about patience, cheese and the evening sky. " * 3 for i in range(100)]
+    monkeypatch.setattr(config, 'DB_COMPRESSION', 'off')
+    for text in texts:
+        database.save_message("conv", "assistant", text)
+    monkeypatch.setattr(config, 'DB_COMPRESSION', 'zlib')
+
+    async def scenario(storage):
+        compressed = await storage.compress_all()
+        history = await storage.get_history("conv", limit=200)
+        await storage.clear_conversation_history("conv")
+        return compressed, history
+
+    compressed, history = run_with_storage(scenario)
+    assert compressed == 100
+    assert [msg["content"] for msg in history] == [secret] + texts
+    conn = sqlite3.connect(config.DB_FILE)
+    dictionaries = conn.execute("SELECT data FROM compression_dicts").fetchall()
+    conn.close()
+    assert dictionaries and not any(b"4321" in bytes(row[0]) for row in dictionaries)
+
+def test_failed_save_is_not_cached(db_file, run_with_storage):
+    """Test that a save the database rejected never shows up in cached history or the prepared context."""
+    conn = sqlite3.connect(config.DB_FILE)
+    conn.execute("CREATE TRIGGER reject_save BEFORE INSERT ON messages WHEN NEW.content = 'Lost' BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+    conn.commit()
+    conn.close()
+
+    async def scenario(storage):
+        assert await storage.save_message("conv", "user", "Kept") is True
+        await conversation.build_api_messages(storage, "conv") # Caches history and the prepared context
+        assert await storage.save_message("conv", "user", "Lost") is False
+        return await storage.get_history("conv"), await conversation.build_api_messages(storage, "conv")
+
+    history, messages = run_with_storage(scenario)
+    assert [msg["content"] for msg in history] == ["Kept"]
+    assert [msg["content"] for msg in messages[1:]] == ["Kept"]
+
+def test_chunked_clear_interleaves_writes(db_file, monkeypatch, run_with_storage):
+    """Test that a large clear runs in chunks, lets other writes through between them and spares messages saved meanwhile."""
+    monkeypatch.setattr(config, 'DB_DELETE_BATCH_SIZE', 10)
+    for i in range(35):
+        database.save_message("big", "user", f"Old {i}")
+    order = []
+
+    async def scenario(storage):
+        async def progress(deleted):
+            order.append(("progress", deleted))
+            if deleted == 10: # Arrives while the clear is still running
+                await storage.save_message("big", "user", "New message")
+                await storage.save_message("other", "user", "Unrelated")
+                order.append(("saved", None))
+
+        deleted = await storage.clear_conversation_history("big", progress=progress)
+        return deleted, await storage.get_history("big", limit=10)
+
+    deleted, history = run_with_storage(scenario)
+    assert deleted == 35
+    assert order == [("progress", 10), ("saved", None), ("progress", 20), ("progress", 30)]
+    assert [msg["content"] for msg in history] == ["New message"]
+    assert database.get_history("other")[0]["content"] == "Unrelated"
+
+def test_context_cache_follows_writes(db_file, run_with_storage):
+    """Test that cached history and prompts are served without queries and stay current through saves, prompt changes and clears."""
+    queries = []
+    original_get_history = database.get_history
+
+    def counting_get_history(*args, **kwargs):
+        queries.append(args[0])
+        return original_get_history(*args, **kwargs)
+
+    async def scenario(storage):
+        storage.cache_depth = 3
+        for i in range(3):
+            await storage.save_message("conv", "user", f"Msg {i}")
+        await storage.warm("conv")
+        await storage.save_message("conv", "assistant", "Msg 3", username=None)
+        history = await storage.get_history("conv", limit=3)
+        assert [msg["content"] for msg in history] == ["Msg 1", "Msg 2", "Msg 3"]
+        assert len(queries) == 1
+
+        await storage.set_channel_prompt("conv", "Be brief.")
+        assert await storage.get_channel_prompt("conv") == "Be brief."
+        await storage.clear_conversation_history("conv")
+        assert await storage.get_history("conv") == []
+        assert len(queries) == 2
+        return storage.cache_stats()
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(database, 'get_history', counting_get_history)
+        stats = run_with_storage(scenario)
+    assert stats["conversations"] == 1
+    assert stats["hits"] == 2
+
+def test_context_cache_skips_reads_racing_writes(db_file, run_with_storage):
+    """Test that a history read overtaken by a save is not cached, so the save is never lost from the cache."""
+    read_started = threading.Event()
+    release_read = threading.Event()
+    original_get_history = database.get_history
+
+    def slow_get_history(*args, **kwargs):
+        history = original_get_history(*args, **kwargs)
+        read_started.set()
+        release_read.wait(5)
+        return history
+
+    async def scenario(storage):
+        read = asyncio.create_task(storage.get_history("conv"))
+        await asyncio.to_thread(read_started.wait, 5)
+        await storage.save_message("conv", "user", "Saved during the read")
+        release_read.set()
+        assert await read == []
+        return await storage.get_history("conv")
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(database, 'get_history', slow_get_history)
+        history = run_with_storage(scenario)
+    assert [msg["content"] for msg in history] == ["Saved during the read"]
+
+def test_context_cache_skips_reads_overlapping_a_commit(db_file, run_with_storage):
+    """Test that a read which queries after a save commits, but resumes before the saver, doesn't cache the row twice."""
+    read_started = threading.Event()
+    committed = threading.Event()
+    read_done = threading.Event()
+    original_get_history = database.get_history
+
+    def late_get_history(*args, **kwargs):
+        read_started.set()
+        committed.wait(5) # Query only once the save is committed
+        try:
+            return original_get_history(*args, **kwargs)
+        finally:
+            read_done.set()
+
+    async def scenario(storage):
+        original_batch = storage._run_write_batch
+
+        def slow_batch(jobs):
+            results = original_batch(jobs)
+            committed.set()
+            read_done.wait(5) # The read returns before the writer loop resolves the save
+            return results
+
+        storage._run_write_batch = slow_batch
+        read = asyncio.create_task(storage.get_history("conv"))
+        await asyncio.to_thread(read_started.wait, 5)
+        await storage.save_message("conv", "user", "Hello")
+        await read
+        return await storage.get_history("conv")
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(database, 'get_history', late_get_history)
+        history = run_with_storage(scenario)
+    assert [msg["content"] for msg in history] == ["Hello"]
+
+def test_failed_reads_are_not_cached(db_file, run_with_storage):
+    """Test that a history or prompt read that fails is retried next time instead of being cached as empty."""
+    database.save_message("conv", "user", "Remember me")
+    database.set_channel_prompt("conv", "Be kind.")
+    failures = {"history": 1, "prompt": 1}
+    original_get_history = database.get_history
+    original_get_prompt = database.get_channel_prompt
+
+    def flaky(name, original):
+        def read(*args, **kwargs):
+            if failures[name]:
+                failures[name] -= 1
+                raise sqlite3.OperationalError("database is locked")
+            return original(*args, **kwargs)
+        return read
+
+    async def scenario(storage):
+        first = await storage.get_history("conv"), await storage.get_channel_prompt("conv")
+        second = await storage.get_history("conv"), await storage.get_channel_prompt("conv")
+        return first, second
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(database, 'get_history', flaky("history", original_get_history))
+        mp.setattr(database, 'get_channel_prompt', flaky("prompt", original_get_prompt))
+        first, second = run_with_storage(scenario)
+    assert first == ([], None)
+    assert [msg["content"] for msg in second[0]] == ["Remember me"]
+    assert second[1] == "Be kind."
+
+def test_split_drops_moved_conversations_from_cache(tmp_path, monkeypatch, run_with_storage):
+    """Test that $splitdb's move is visible to cached conversations right away."""
+    monkeypatch.setattr(config, 'DB_FILE', str(tmp_path / "shared.db"))
+    monkeypatch.setattr(config, 'DB_PARTITION_MODE', database.PARTITION_MODE_GUILD)
+    monkeypatch.setattr(config, 'DB_PARTITION_DIR', str(tmp_path / "partitions"))
+    database.close_partition_pool()
+    database.init_db()
+    shared = sqlite3.connect(config.DB_FILE)
+    database.save_message("chan", "user", "Ahoy", conn=shared)
+    database.save_message("other", "user", "Elsewhere", conn=shared)
+    database.set_channel_prompt("chan", "Pirate prompt", conn=shared)
+    shared.close()
+
+    async def scenario(storage):
+        before = await conversation.build_api_messages(storage, "chan", guild_id="9") # Caches the empty partition's view
+        moved = await storage.split_into_guild_partitions({"chan": "9", "other": "8"})
+        return before, moved, await conversation.build_api_messages(storage, "chan", guild_id="9")
+
+    try:
+        before, moved, after = run_with_storage(scenario)
+    finally:
+        database.close_partition_pool()
+    assert len(before) == 1
+    assert moved == {"9": 1, "8": 1}
+    assert after[0]["content"] == "Pirate prompt"
+    assert [msg["content"] for msg in after[1:]] == ["Ahoy"]
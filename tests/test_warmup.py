@@ -0,0 +1,57 @@
+import pytest
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+
+# Add project root to the Python path to allow importing 'cogs.warmup' and 'config'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import config
+from cogs.warmup import Warmup
+
+class RecordingStorage:
+    """Ranks a fixed list of conversations and records which ones get warmed."""
+
+    def __init__(self, ranked):
+        self.ranked = ranked
+        self.limits = []
+        self.warmed = []
+
+    async def rank_active_conversations(self, limit):
+        self.limits.append(limit)
+        return self.ranked[:limit]
+
+    async def warm(self, conversation_id, guild_id=None):
+        self.warmed.append(conversation_id)
+
+def make_bot(ranked, visible, job_queue=None, **shards):
+    return SimpleNamespace(
+        storage=RecordingStorage(ranked),
+        job_queue=job_queue,
+        get_channel=lambda channel_id: object() if channel_id in visible else None,
+        **shards,
+    )
+
+@pytest.fixture
+def warmup_settings(monkeypatch):
+    monkeypatch.setattr(config, 'WARMUP_CHANNELS', 2)
+    monkeypatch.setattr(config, 'WARMUP_RATE', 0)
+
+def test_warmup_skips_channels_of_other_shards(warmup_settings):
+    """Test that only channels this process can see are warmed, ranking enough candidates to fill WARMUP_CHANNELS."""
+    ranked = [("1", "900"), ("2", "901"), ("dm-test", None), ("3", "900"), ("4", "900")]
+    bot = make_bot(ranked, visible={1, 3, 4}, shard_ids=[0], shard_count=2)
+
+    asyncio.run(Warmup(bot).run("test"))
+
+    assert bot.storage.limits == [4] # Half the shards live in other processes
+    assert bot.storage.warmed == ["1", "3"]
+
+def test_warmup_is_skipped_in_gateway_mode(warmup_settings):
+    """Test that a gateway process never schedules a warm-up; its workers read context, not the gateway."""
+    bot = make_bot([("1", "900")], visible={1}, job_queue=object())
+    cog = Warmup(bot)
+    cog.schedule("connect")
+    assert cog._task is None
@@ -0,0 +1,87 @@
+import pytest
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+
+# Add project root to the Python path to allow importing 'worker' and 'job_queue'
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+import conversation
+import job_queue
+from job_queue import JobQueue
+from worker import Worker
+
+class FlakyMistral:
+    """Fails the first `failures` calls, then echoes the last user message."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self.chat = self
+
+    async def complete_async(self, model, messages):
+        self.calls.append(messages)
+        if len(self.calls) <= self.failures:
+            raise RuntimeError("API unavailable")
+        message = SimpleNamespace(content=f"You said: {messages[-1]['content']}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+@pytest.fixture
+def queue(tmp_path, db_file):
+    """A job queue plus a temporary history database."""
+    jobs = JobQueue(str(tmp_path / "jobs.db"), max_attempts=2)
+    yield jobs
+    jobs.close()
+
+def run_worker_until_idle(run_with_storage, queue, client):
+    """Runs a Worker until the queue has nothing left for it, then returns the saved history of conversation '10'."""
+    async def scenario(storage):
+        worker = Worker("w1", queue, storage, client, concurrency=2, poll_interval=0.01)
+        task = asyncio.create_task(worker.run())
+        while queue.counts().get(job_queue.QUEUED) or queue.counts().get(job_queue.WORKING):
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return await storage.get_history("10", limit=10)
+    return run_with_storage(scenario, read_pool_size=1)
+
+def test_worker_replies_through_queue(queue, run_with_storage):
+    """Test that a worker saves the exchange and leaves the reply for the gateway."""
+    queue.enqueue(1, 10, None, {"content": "Hello", "username": "alice"})
+    history = run_worker_until_idle(run_with_storage, queue, FlakyMistral())
+
+    assert [(row['role'], row['content']) for row in history] == [("user", "Hello"), ("assistant", "You said: Hello")]
+    assert [reply.response for reply in queue.claim_responses("gw")] == ["You said: Hello"]
+
+def test_worker_retry_does_not_duplicate_user_message(queue, run_with_storage):
+    """Test that a job retried after an API error saves the user message only once."""
+    queue.enqueue(1, 10, None, {"content": "Hello", "username": "alice"})
+    client = FlakyMistral(failures=1)
+    history = run_worker_until_idle(run_with_storage, queue, client)
+
+    assert len(client.calls) == 2
+    assert [row['role'] for row in history] == ["user", "assistant"]
+
+def test_worker_apologizes_after_last_attempt(queue, run_with_storage):
+    """Test that a job failing on every attempt ends with the apology reply instead of silence."""
+    queue.enqueue(1, 10, None, {"content": "Hello", "username": "alice"})
+    history = run_worker_until_idle(run_with_storage, queue, FlakyMistral(failures=5))
+
+    assert [row['role'] for row in history] == ["user"]
+    assert [reply.response for reply in queue.claim_responses("gw")] == [conversation.ERROR_REPLY]
+
+def test_worker_gives_up_on_job_past_its_limit(queue, run_with_storage):
+    """Test that a job claimed beyond max_attempts gets the apology reply without another model call."""
+    queue.enqueue(1, 10, None, {"content": "Hello", "username": "alice"})
+    job = queue.claim("w1")[0]
+    job.attempts = queue.max_attempts + 1
+    client = FlakyMistral()
+
+    async def scenario(storage):
+        await Worker("w1", queue, storage, client).process(job)
+
+    run_with_storage(scenario, read_pool_size=1)
+    assert client.calls == []
+    assert [reply.response for reply in queue.claim_responses("gw")] == [conversation.ERROR_REPLY]
@@ -0,0 +1,220 @@
+"""AI worker process for DEPLOYMENT_MODE=gateway.
+
+Claims mention jobs from the local job queue, assembles context, calls the model and stores
+the reply in the queue for the gateway process to send. The gateway spawns AI_WORKERS of
+these itself; with AI_WORKERS=0 run them separately:
+
+    python worker.py [--workers N]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from functools import partial
+
+import config # Import our config module
+import conversation
+import logging_setup
+import runtime
+from job_queue import JobQueue
+from storage import Storage
+
+MODE_COMBINED = "combined"
+MODE_GATEWAY = "gateway"
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+RESTART_BACKOFF = 5.0 # Seconds between checks for (and restarts of) dead worker processes
+
+# --- Worker ---
+
+class Worker:
+    """Processes queued jobs, up to `concurrency` at a time.
+
+    Each job's user message is saved once (the queue records it), so a job retried after a
+    crash or error only repeats the model call. Failed jobs go back to the queue until their
+    last attempt, which replies with an apology instead.
+    """
+
+    def __init__(self, worker_id, queue, storage, mistral_client, concurrency=None, lease=None, poll_interval=None):
+        self.worker_id = worker_id
+        self.queue = queue
+        self.storage = storage
+        self.mistral_client = mistral_client
+        self.concurrency = concurrency or config.AI_WORKER_CONCURRENCY
+        self.lease = lease or config.JOB_LEASE_SECONDS
+        self.poll_interval = poll_interval if poll_interval is not None else config.JOB_POLL_INTERVAL
+        self._tasks = set()
+
+    async def run(self):
+        """Claims and processes jobs until cancelled, then waits for in-flight jobs."""
+        logging.info(f"Worker {self.worker_id} started (concurrency {self.concurrency}).")
+        try:
+            while True:
+                free = self.concurrency - len(self._tasks)
+                if free <= 0:
+                    await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                jobs = await asyncio.to_thread(self.queue.claim, self.worker_id, free, self.lease)
+                if not jobs:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                for job in jobs:
+                    task = asyncio.create_task(self.process(job))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        finally:
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            logging.info(f"Worker {self.worker_id} stopped.")
+
+    async def process(self, job):
+        """Runs the conversation pipeline for one job and hands the reply back to the queue."""
+        logging_setup.set_correlation_id(job.message_id)
+        payload = job.payload
+        if job.attempts > self.queue.max_attempts: # Should not be claimable; never run a job past its limit
+            logging.error("Job %s was claimed for attempt %d of %d; giving up on it.", job.message_id, job.attempts, self.queue.max_attempts)
+            await asyncio.to_thread(self.queue.complete, job.message_id, self.worker_id, conversation.ERROR_REPLY)
+            return
+        if self.mistral_client is None:
+            logging.warning("Mistral client not available. Cannot process AI request.")
+            await asyncio.to_thread(self.queue.complete, job.message_id, self.worker_id, None)
+            return
+
+        logging.info('Worker %s processing job (attempt %d) in conv %s: "%.50s..."', self.worker_id, job.attempts, job.channel_id, payload["content"])
+        save_reply = False
+        try:
+            if not job.user_saved:
+                await self.storage.save_message(job.channel_id, "user", payload["content"], username=payload["username"], guild_id=job.guild_id)
+                await asyncio.to_thread(self.queue.mark_user_saved, job.message_id, self.worker_id)
+            response = await conversation.generate_reply(self.storage, self.mistral_client, job.channel_id, job.guild_id)
+            save_reply = response is not None
+            if response is None:
+                response = conversation.NO_CHOICES_REPLY
+        except Exception as e:
+            logging.exception("Error processing job %s: %s", job.message_id, e)
+            if job.attempts < self.queue.max_attempts:
+                await asyncio.to_thread(self.queue.release, job.message_id, self.worker_id)
+                return
+            response = conversation.ERROR_REPLY
+
+        completed = await asyncio.to_thread(self.queue.complete, job.message_id, self.worker_id, response)
+        if not completed:
+            logging.warning("Lease on job %s expired before it finished; dropping this reply.", job.message_id)
+        elif save_reply:
+            await self.storage.save_message(job.channel_id, "assistant", response, guild_id=job.guild_id)
+
+# --- Process Entry ---
+
+async def serve(worker_id):
+    """Runs one worker with its own storage and queue connection until cancelled or SIGTERM."""
+    runtime.configure_loop()
+    main_task = asyncio.current_task()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+    except NotImplementedError: # Windows
+        pass
+
+    storage = Storage(cache_size=0) # Workers share conversations, so another worker's writes would make a cache stale
+    await storage.start()
+    queue = await asyncio.to_thread(JobQueue, config.JOB_QUEUE_FILE, config.JOB_MAX_ATTEMPTS)
+    try:
+        mistral_client = await asyncio.to_thread(conversation.create_mistral_client)
+        await Worker(worker_id, queue, storage, mistral_client).run()
+    except asyncio.CancelledError:
+        logging.info(f"Worker {worker_id} shutting down.")
+    finally:
+        await storage.close() # Flush queued history writes
+        queue.close()
+
+def run_worker(name):
+    """Entry point of a worker process."""
+    config.load(require_discord_token=False)
+    logging_setup.setup_logging()
+    try:
+        runtime.run(partial(serve, f"{name}@{os.getpid()}"))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging_setup.stop_logging()
+
+# --- Worker Pool ---
+
+class WorkerPool:
+    """Starts `size` worker processes and restarts any that exit."""
+
+    def __init__(self, size, name_prefix="ai-worker"):
+        self.size = size
+        self.name_prefix = name_prefix
+        self.processes = [None] * size
+
+    def _spawn(self, index):
+        name = f"{self.name_prefix}-{index}"
+        self.processes[index] = subprocess.Popen([sys.executable, WORKER_SCRIPT, "--name", name])
+        logging.info(f"Started {name} (pid {self.processes[index].pid}).")
+
+    def start(self):
+        for index in range(self.size):
+            self._spawn(index)
+
+    def restart_dead(self):
+        """Restarts exited workers. Returns how many were restarted."""
+        restarted = 0
+        for index, process in enumerate(self.processes):
+            if process is not None and process.poll() is not None:
+                logging.warning(f"{self.name_prefix}-{index} exited with code {process.returncode}; restarting.")
+                self._spawn(index)
+                restarted += 1
+        return restarted
+
+    async def supervise(self):
+        """Restarts dead workers every RESTART_BACKOFF seconds until cancelled."""
+        while True:
+            await asyncio.sleep(RESTART_BACKOFF)
+            self.restart_dead()
+
+    def stop(self, timeout=10.0):
+        """Asks every worker to finish its in-flight jobs and exit, killing any that take longer than `timeout`."""
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is None:
+                continue
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.processes = [None] * self.size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes to run and supervise")
+    parser.add_argument("--name", default="ai-worker", help="Worker name used in lease ownership and logs")
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        run_worker(args.name)
+        return
+
+    config.load(require_discord_token=False)
+    logging_setup.setup_logging()
+    pool = WorkerPool(args.workers, name_prefix=args.name)
+    pool.start()
+    try:
+        while True:
+            time.sleep(RESTART_BACKOFF)
+            pool.restart_dead()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+        logging_setup.stop_logging()
+
+if __name__ == "__main__":
+    main()